@@ -1,39 +1,27 @@
 import pandas as pd
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from typing import Iterator, Optional
+from utils.aggregate_cube import AggregateCube, debit_cells, monthly_totals
+from utils.llm_client import LLMUnavailableError, chat_completion, achat_completion
+from utils.normalization import ensure_normalized
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def create_budget_baseline_with_pandas(df: pd.DataFrame) -> dict:
+def create_budget_baseline_with_pandas(df: pd.DataFrame, cube: Optional[pd.DataFrame] = None) -> dict:
     """
     Analyzes historical data to create a baseline of average monthly spending.
+    Reads the user's slice of the aggregate cube; when none is passed it is built from df.
     """
     print("Executing Pandas Budget Baseline...")
     
     # --- Data Preparation ---
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['month'] = df['timestamp'].dt.to_period('M')
-    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
-    
-    debit_df = df[df['direction'].str.strip().str.lower() == 'debit'].copy()
+    # The Needs vs. Wants mapping ('budget_bucket') is the same one the shared normalization uses
+    if cube is None:
+        cube = AggregateCube.build(ensure_normalized(df)).frame
+    debit_cube = debit_cells(cube)
 
-    if debit_df.empty:
+    if debit_cube.empty:
         return {"summary": "No spending data available to create a budget baseline."}
     
-    # --- Categorization Mapping (Needs vs. Wants) ---
-    def map_category(cat):
-        cat = str(cat).lower()
-        if any(c in cat for c in ['groceries', 'utilities', 'rent', 'transport', 'bills', 'emi', 'health']):
-            return 'Needs'
-        elif any(c in cat for c in ['shopping', 'food', 'travel', 'entertainment', 'recharge', 'lifestyle', 'subscription']):
-            return 'Wants'
-        else:
-            return 'Other'
-            
-    debit_df['budget_category'] = debit_df['category'].apply(map_category)
-    
     # --- Analysis ---
-    monthly_spend = debit_df.groupby(['month', 'budget_category'])['amount'].sum().unstack(fill_value=0)
+    monthly_spend = monthly_totals(debit_cube, by='budget_bucket').unstack(fill_value=0)
     avg_monthly_spend = monthly_spend.mean()
     total_avg_spend = avg_monthly_spend.sum()
 
@@ -44,14 +32,10 @@ def create_budget_baseline_with_pandas(df: pd.DataFrame) -> dict:
     }
     return baseline
 
-def generate_budget_plan_with_llm(baseline: dict, profile: str) -> str:
+def build_budget_messages(baseline: dict, profile: str) -> list[dict]:
     """
-    Uses an LLM to generate a personalized budget proposal and financial tip.
+    Builds the chat messages for the budget plan LLM call.
     """
-    if "summary" in baseline:
-        return baseline["summary"]
-
-    print("Executing LLM Budget Plan...")
     prompt = f"""
     You are a friendly financial advisor AI. Create a simple, personalized monthly budget for a user based on their past spending and profile.
 
@@ -70,16 +54,56 @@ def generate_budget_plan_with_llm(baseline: dict, profile: str) -> str:
 
     Keep the tone helpful and non-judgmental. Start the response with a heading "### Proposed Monthly Budget".
     """
+    return [
+        {"role": "system", "content": "You are a friendly and practical financial advisor AI."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_budget_plan_with_llm(baseline: dict, profile: str) -> str:
+    """
+    Uses an LLM to generate a personalized budget proposal and financial tip.
+    """
+    if "summary" in baseline:
+        return baseline["summary"]
+
+    print("Executing LLM Budget Plan...")
+    try:
+        return chat_completion(build_budget_messages(baseline, profile), temperature=0.6, max_tokens=500)
+    except LLMUnavailableError:
+        raise  # The runner defers the user instead of reporting an API error
+    except Exception as e:
+        return f"An error occurred with the OpenAI API during budget planning: {e}"
+
+def stream_budget_plan_with_llm(baseline: dict, profile: str) -> Iterator[str]:
+    """
+    Streaming variant of generate_budget_plan_with_llm for the UI: yields the
+    budget proposal piece by piece as the model writes it (e.g. for st.write_stream).
+    """
+    if "summary" in baseline:
+        yield baseline["summary"]
+        return
+
+    print("Executing LLM Budget Plan (streaming)...")
+    streamed = False
+    try:
+        for piece in chat_completion(build_budget_messages(baseline, profile), temperature=0.6, max_tokens=500,
+                                     stream=True):
+            streamed = True
+            yield piece
+    except Exception as e:
+        yield ("\n\n" if streamed else "") + f"An error occurred with the OpenAI API during budget planning: {e}"
+
+async def agenerate_budget_plan_with_llm(baseline: dict, profile: str) -> str:
+    """
+    Async variant of generate_budget_plan_with_llm for concurrent multi-user runs.
+    """
+    if "summary" in baseline:
+        return baseline["summary"]
+
+    print("Executing LLM Budget Plan (async)...")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a friendly and practical financial advisor AI."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.6,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
+        return await achat_completion(build_budget_messages(baseline, profile), temperature=0.6, max_tokens=500)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        return f"An error occurred with the OpenAI API during budget planning: {e}"
\ No newline at end of file
+        return f"An error occurred with the OpenAI API during budget planning: {e}"
@@ -1,56 +1,159 @@
+import asyncio
+import json
+import os
+import numpy as np
 import pandas as pd
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from utils.aggregate_cube import AMOUNT_DECIMALS
+from utils.llm_cache import llm_cache_scope
+from utils.llm_client import LLMUnavailableError, chat_completion, achat_completion, discard_cached_response
+from utils.normalization import ensure_normalized, drop_normalized_columns
+from utils.partitioning import partition_by_user
+from utils.prompt_builder import TRANSACTION_PROMPT_COLUMNS, render_section
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+TOP_N = 5
+SAMPLE_ROWS = 10
+NO_SPENDING_SUMMARY = "This user has no spending (debit) transactions to analyze."
+PROFILE_MAX_TOKENS = 500
+
+# Tables stored in the analysis (and put into prompts) are token-bounded; see utils/prompt_builder.py
+def _render_top_categories(category_totals: pd.Series) -> str:
+    return render_section("top_spending_categories", category_totals, value_name="amount")
+
+def _render_top_merchants(merchant_counts: pd.Series) -> str:
+    return render_section("top_merchants_by_frequency", merchant_counts, value_name="transactions")
+
+def _render_samples(samples: pd.DataFrame) -> str:
+    return render_section("transaction_samples", samples, columns=TRANSACTION_PROMPT_COLUMNS, noun="transactions")
 
 def analyze_transactions_with_pandas(df: pd.DataFrame) -> dict:
     """
     Performs quantitative analysis (top categories/merchants) for a single user's DataFrame.
+    total_spending is rounded to paise and average_transaction_amount is total / count.
     """
     print("Executing Pandas Analysis for User...")
-    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
-    
-    # **CRITICAL FIX**: This line is now robust. It handles "debit", "Debit", " DEBIT ", etc.
-    debit_transactions = df[df['direction'].str.strip().str.lower() == 'debit'].copy()
+    # Normalization (amount coercion, robust debit mask) is shared; see utils/normalization.py
+    df = ensure_normalized(df)
+    debit_transactions = df[df['is_debit']]
 
     # If a user has no spending, we return a specific message.
     if debit_transactions.empty:
-        return {"summary": "This user has no spending (debit) transactions to analyze."}
+        return {"summary": NO_SPENDING_SUMMARY}
 
     # Calculate spending by category (for charts)
-    category_spending = debit_transactions.groupby('category')['amount'].sum().to_dict()
-    top_categories = debit_transactions.groupby('category')['amount'].sum().nlargest(5).to_string()
-    top_merchants = debit_transactions['merchant_name'].value_counts().nlargest(5).to_string()
-    total_debit = debit_transactions['amount'].sum()
+    category_spending = debit_transactions.groupby('category', observed=True)['amount'].sum().to_dict()
+    top_categories = _render_top_categories(debit_transactions.groupby('category', observed=True)['amount'].sum().nlargest(TOP_N))
+    top_merchants = _render_top_merchants(_top_merchant_counts(debit_transactions['merchant_name'], TOP_N))
+    # Rounded to paise: the batch path sums in a different order, so raw float totals differ in the last digits
+    total_debit = round(float(debit_transactions['amount'].sum()), AMOUNT_DECIMALS)
     
     # Additional metrics for Streamlit
     total_transactions = len(debit_transactions)
-    avg_transaction_amount = debit_transactions['amount'].mean()
+    avg_transaction_amount = total_debit / total_transactions
     unique_merchants = debit_transactions['merchant_name'].nunique()
     
     analysis = {
         "top_spending_categories": top_categories,
         "top_merchants_by_frequency": top_merchants,
         "total_debit": f"{total_debit:,.2f}",
-        "transaction_samples": df.sample(n=min(10, len(df)), random_state=42).to_string(),
+        "transaction_samples": _render_samples(drop_normalized_columns(df.sample(n=min(SAMPLE_ROWS, len(df)), random_state=42))),
         # Additional structured data for Streamlit
         "category_spending": category_spending,
-        "total_spending": total_debit,
+        "total_spending": float(total_debit),
         "total_transactions": total_transactions,
-        "average_transaction_amount": avg_transaction_amount,
-        "unique_merchants": unique_merchants
+        "average_transaction_amount": float(avg_transaction_amount),
+        "unique_merchants": int(unique_merchants)
     }
     return analysis
 
-def generate_profile_from_analysis(analysis: dict) -> str:
+def _top_merchant_counts(merchants: pd.Series, n: int) -> pd.Series:
     """
-    Uses an LLM to generate the qualitative profile from a user's pre-analyzed data.
+    The n most frequent merchants, equal counts in order of first appearance
+    (value_counts on a categorical would order them by category instead).
     """
-    if "summary" in analysis:
-        return analysis["summary"]
+    counts = merchants.groupby(merchants, observed=True, sort=False).size()
+    return counts.sort_values(ascending=False, kind='stable').head(n)
 
-    print("Executing LLM Profile Generation for User...")
+def _top_n_per_user(values: pd.Series, n: int) -> dict:
+    """
+    Splits a (user, key)-indexed series into per-user series of the n largest
+    values. A stable descending sort keeps equal values in their original
+    order, which is what nlargest(keep='first') returns for one user.
+    """
+    ordered = values.sort_values(ascending=False, kind='stable')
+    top = ordered.groupby(level=0, observed=True, sort=False).head(n)
+    return {user_id: group.droplevel(0) for user_id, group in top.groupby(level=0, observed=True, sort=False)}
+
+def _sample_positions(n_rows: int, cache: dict) -> np.ndarray:
+    # Same draw as df.sample(n=min(SAMPLE_ROWS, len(df)), random_state=42), which only depends on len(df)
+    if n_rows not in cache:
+        cache[n_rows] = np.random.RandomState(42).choice(n_rows, size=min(SAMPLE_ROWS, n_rows), replace=False)
+    return cache[n_rows]
+
+def analyze_all_users_with_pandas(df: pd.DataFrame, user_col: str = 'user_id') -> dict:
+    """
+    Batch version of analyze_transactions_with_pandas for every user at once.
+
+    Totals, averages, unique merchant counts, category totals and merchant
+    frequencies come from a few groupbys over the whole dataset, and the top-N
+    tables from one sort; the results are then split into per-user dicts with
+    the same keys and values as the single-user function. Returns
+    {user_id: analysis}.
+    """
+    print("Executing Batch Pandas Analysis for All Users...")
+    df = ensure_normalized(df)
+    partitions = partition_by_user(df, user_col)
+    frame = partitions.frame
+    debit_transactions = frame[frame['is_debit']]
+
+    # --- Whole-dataset aggregations ---
+    by_user = debit_transactions.groupby(user_col, observed=True, sort=False)
+    totals = by_user['amount'].agg(['sum', 'size'])
+    # Rounded and averaged like the single-user function, whose float sum runs in a different order
+    totals['sum'] = totals['sum'].round(AMOUNT_DECIMALS)
+    totals['mean'] = totals['sum'] / totals['size']
+    unique_merchants = by_user['merchant_name'].nunique()
+    category_totals = debit_transactions.groupby([user_col, 'category'], observed=True)['amount'].sum()
+    # Unsorted groups keep each user's merchants in order of first appearance, like _top_merchant_counts
+    merchant_counts = debit_transactions.groupby([user_col, 'merchant_name'], observed=True, sort=False).size()
+
+    category_spending = {user_id: group.droplevel(0) for user_id, group
+                         in category_totals.groupby(level=0, observed=True, sort=False)}
+    top_categories = _top_n_per_user(category_totals, TOP_N)
+    top_merchants = _top_n_per_user(merchant_counts, TOP_N)
+
+    # Transaction samples: one take over all users' sampled rows
+    sample_cache = {}
+    sample_positions, sample_bounds = [], [0]
+    for user_id in partitions.user_ids:
+        start, stop = partitions.bounds(user_id)
+        sample_positions.append(start + _sample_positions(stop - start, sample_cache))
+        sample_bounds.append(sample_bounds[-1] + len(sample_positions[-1]))
+    samples = drop_normalized_columns(frame.take(np.concatenate(sample_positions))) if sample_positions else frame.iloc[0:0]
+
+    # --- Split into per-user results ---
+    results = {}
+    for i, user_id in enumerate(partitions.user_ids):
+        if user_id not in totals.index:
+            results[user_id] = {"summary": NO_SPENDING_SUMMARY}
+            continue
+        total_debit = totals.at[user_id, 'sum']
+        results[user_id] = {
+            "top_spending_categories": _render_top_categories(top_categories[user_id]),
+            "top_merchants_by_frequency": _render_top_merchants(top_merchants[user_id]),
+            "total_debit": f"{total_debit:,.2f}",
+            "transaction_samples": _render_samples(samples.iloc[sample_bounds[i]:sample_bounds[i + 1]]),
+            "category_spending": category_spending[user_id].to_dict(),
+            "total_spending": float(total_debit),
+            "total_transactions": int(totals.at[user_id, 'size']),
+            "average_transaction_amount": float(totals.at[user_id, 'mean']),
+            "unique_merchants": int(unique_merchants.at[user_id])
+        }
+    return results
+
+def build_profile_messages(analysis: dict) -> list[dict]:
+    """
+    Builds the chat messages for the profile LLM call from a user's pre-analyzed data.
+    """
     prompt = f"""
     You are a financial analyst AI. Based on the following summary of a user's spending, create a concise financial profile.
 
@@ -66,16 +169,212 @@ def generate_profile_from_analysis(analysis: dict) -> str:
     1.  **Spending Habits:** A one-paragraph summary of the user's main spending patterns.
     2.  **Potential Fixed Obligations:** Identify any merchants from the list that look like recurring bills or subscriptions (e.g., rent, utilities, streaming services).
     """
+    return [
+        {"role": "system", "content": "You are a financial analyst AI who creates concise user profiles."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_profile_from_analysis(analysis: dict) -> str:
+    """
+    Uses an LLM to generate the qualitative profile from a user's pre-analyzed data.
+    """
+    if "summary" in analysis:
+        return analysis["summary"]
+
+    print("Executing LLM Profile Generation for User...")
+    try:
+        return chat_completion(build_profile_messages(analysis), temperature=0.4, max_tokens=PROFILE_MAX_TOKENS)
+    except LLMUnavailableError:
+        raise  # The runner defers the user instead of reporting an API error
+    except Exception as e:
+        return f"An error occurred with the OpenAI API: {e}"
+
+async def agenerate_profile_from_analysis(analysis: dict) -> str:
+    """
+    Async variant of generate_profile_from_analysis for concurrent multi-user runs.
+    """
+    if "summary" in analysis:
+        return analysis["summary"]
+
+    print("Executing LLM Profile Generation for User (async)...")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a financial analyst AI who creates concise user profiles."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.4,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
+        return await achat_completion(build_profile_messages(analysis), temperature=0.4, max_tokens=PROFILE_MAX_TOKENS)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        return f"An error occurred with the OpenAI API: {e}"
\ No newline at end of file
+        return f"An error occurred with the OpenAI API: {e}"
+
+# --- Batched Profiles ---
+# Several users' summaries go into one request whose response must match
+# PROFILE_BATCH_SCHEMA; a batch of B users costs one round-trip instead of B.
+# PROFILE_BATCH_SIZE=1 turns batching off.
+PROFILE_BATCH_SIZE = int(os.getenv("PROFILE_BATCH_SIZE", "8"))
+MAX_BATCH_COMPLETION_TOKENS = 16000  # gpt-4o's output limit is 16,384 tokens
+
+PROFILE_BATCH_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "user_profiles",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "profiles": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"user_id": {"type": "string"}, "profile": {"type": "string"}},
+                        "required": ["user_id", "profile"],
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["profiles"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+def build_batch_profile_messages(analyses: dict) -> list[dict]:
+    """
+    Builds one request for several users' profiles from their pre-analyzed
+    data ({user_id: analysis}). The task matches build_profile_messages.
+    """
+    users = "\n\n".join(
+        f"""### User {user_id}
+- Total Money Spent: ₹{analysis['total_debit']}
+- Top Spending Categories by Amount:
+{analysis['top_spending_categories']}
+- Top Merchants by Transaction Frequency:
+{analysis['top_merchants_by_frequency']}"""
+        for user_id, analysis in analyses.items()
+    )
+    prompt = f"""
+    You are a financial analyst AI. Below are spending summaries for {len(analyses)} users. For EACH user, create a concise financial profile.
+
+    {users}
+
+    **Your Task:**
+    For each user, based ONLY on that user's data, write a brief summary covering:
+    1.  **Spending Habits:** A one-paragraph summary of the user's main spending patterns.
+    2.  **Potential Fixed Obligations:** Identify any merchants from the list that look like recurring bills or subscriptions (e.g., rent, utilities, streaming services).
+
+    Respond with JSON: {{"profiles": [{{"user_id": "...", "profile": "..."}}]}}, one entry per user, using the user IDs exactly as given.
+    """
+    return [
+        {"role": "system", "content": "You are a financial analyst AI who creates concise user profiles."},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_batch_profiles(content: str, user_ids: list) -> dict:
+    """
+    Validates a batched response and splits it into {user_id: profile}.
+    Entries for unknown users or with an empty profile are dropped, so the
+    caller can fall back to single calls for whoever is missing.
+    """
+    try:
+        payload = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    entries = payload.get("profiles") if isinstance(payload, dict) else None
+    if not isinstance(entries, list):
+        return {}
+
+    wanted = {str(user_id): user_id for user_id in user_ids}
+    profiles = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        user_id = wanted.get(str(entry.get("user_id")))
+        profile = entry.get("profile")
+        if user_id is not None and user_id not in profiles and isinstance(profile, str) and profile.strip():
+            profiles[user_id] = profile.strip()
+    return profiles
+
+def _plan_batches(analyses: dict, batch_size: int) -> tuple[dict, list[dict]]:
+    """Users answered without the LLM (no spending) and batches of the rest."""
+    ready = {user_id: analysis["summary"] for user_id, analysis in analyses.items() if "summary" in analysis}
+    pending = [(user_id, analysis) for user_id, analysis in analyses.items() if "summary" not in analysis]
+    batches = [dict(pending[i:i + batch_size]) for i in range(0, len(pending), batch_size)]
+    return ready, batches
+
+def _batch_request(batch: dict) -> dict:
+    return dict(messages=build_batch_profile_messages(batch), temperature=0.4,
+                max_tokens=min(PROFILE_MAX_TOKENS * len(batch), MAX_BATCH_COMPLETION_TOKENS),
+                response_format=PROFILE_BATCH_SCHEMA)
+
+def generate_profiles_batched(analyses: dict, batch_size: int = PROFILE_BATCH_SIZE) -> dict:
+    """
+    Profiles for many users ({user_id: analysis} -> {user_id: profile}) with
+    one LLM call per batch_size users. Users missing from a batch response, or
+    all of a batch whose response does not parse or fails, get a single call.
+    While the LLM service is unavailable, users are left out of the result
+    (their graph runs generate the profile, or defer the user).
+    """
+    profiles, batches = _plan_batches(analyses, max(1, batch_size))
+    for batch in batches:
+        parsed = {}
+        if len(batch) > 1:
+            print(f"Executing Batched LLM Profile Generation for {len(batch)} Users...")
+            try:
+                request = _batch_request(batch)
+                # Tagged with every user of the batch, so invalidating any one of them drops the shared response
+                with llm_cache_scope(list(batch)):
+                    parsed = parse_batch_profiles(chat_completion(**request), list(batch))
+                if len(parsed) < len(batch):
+                    print(f"Warning: Batched response covered {len(parsed)} of {len(batch)} users; using single requests for the rest.")
+                    # Not kept in the cache, or every rerun would replay it and repeat the single requests
+                    discard_cached_response(**request)
+            except LLMUnavailableError as e:
+                print(f"Warning: Batched profile request failed ({e}); leaving these profiles to the graph runs.")
+                continue
+            except Exception as e:
+                print(f"Warning: Batched profile request failed ({e}); using single requests.")
+        profiles.update(parsed)
+        for user_id, analysis in batch.items():
+            if user_id not in parsed:
+                try:
+                    with llm_cache_scope(user_id):
+                        profiles[user_id] = generate_profile_from_analysis(analysis)
+                except LLMUnavailableError:
+                    pass
+    return {user_id: profiles[user_id] for user_id in analyses if user_id in profiles}
+
+async def agenerate_profiles_batched(analyses: dict, batch_size: int = PROFILE_BATCH_SIZE) -> dict:
+    """
+    Async variant of generate_profiles_batched; all batches are in flight at
+    once behind the shared rate limiter.
+    """
+    profiles, batches = _plan_batches(analyses, max(1, batch_size))
+
+    async def run_batch(batch: dict) -> dict:
+        parsed = {}
+        if len(batch) > 1:
+            print(f"Executing Batched LLM Profile Generation for {len(batch)} Users (async)...")
+            try:
+                request = _batch_request(batch)
+                with llm_cache_scope(list(batch)):
+                    parsed = parse_batch_profiles(await achat_completion(**request), list(batch))
+                if len(parsed) < len(batch):
+                    print(f"Warning: Batched response covered {len(parsed)} of {len(batch)} users; using single requests for the rest.")
+                    await asyncio.to_thread(discard_cached_response, **request)
+            except LLMUnavailableError as e:
+                print(f"Warning: Batched profile request failed ({e}); leaving these profiles to the graph runs.")
+                return {}
+            except Exception as e:
+                print(f"Warning: Batched profile request failed ({e}); using single requests.")
+
+        async def single(user_id, analysis):
+            try:
+                with llm_cache_scope(user_id):
+                    return user_id, await agenerate_profile_from_analysis(analysis)
+            except LLMUnavailableError:
+                return user_id, None
+
+        missing = await asyncio.gather(*(single(user_id, analysis) for user_id, analysis in batch.items()
+                                         if user_id not in parsed))
+        return {**parsed, **{user_id: profile for user_id, profile in missing if profile is not None}}
+
+    for result in await asyncio.gather(*(run_batch(batch) for batch in batches)):
+        profiles.update(result)
+    return {user_id: profiles[user_id] for user_id in analyses if user_id in profiles}
@@ -1,24 +1,28 @@
 import pandas as pd
-from openai import OpenAI
-from config import OPENAI_API_KEY
+from typing import Optional
+from utils.aggregate_cube import AggregateCube, amount_moments, debit_cells, monthly_totals
+from utils.llm_client import LLMUnavailableError, chat_completion, achat_completion
+from utils.normalization import ensure_normalized
+from utils.prompt_builder import render_section
 
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-def analyze_trends_with_pandas(df: pd.DataFrame) -> dict:
+def analyze_trends_with_pandas(df: pd.DataFrame, cube: Optional[pd.DataFrame] = None) -> dict:
     """
     Performs quantitative, time-series analysis on transaction data using pandas.
+
+    Monthly totals and the burst threshold come from the user's slice of the
+    aggregate cube (utils/aggregate_cube.py); when no slice is passed it is
+    built from df. Raw rows are only scanned to list the burst transactions.
     """
     print("Executing Pandas Trend Analysis...")
     
     # --- Data Preparation ---
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['month'] = df['timestamp'].dt.to_period('M')
-    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
-    
-    debit_df = df[df['direction'].str.strip().str.lower() == 'debit'].copy()
+    df = ensure_normalized(df)
+    if cube is None:
+        cube = AggregateCube.build(df).frame
+    debit_cube = debit_cells(cube)
     
     # Identify the last two full months in the data
-    months = sorted(debit_df['month'].unique())
+    months = sorted(debit_cube['month'].dropna().unique())
     if len(months) < 2:
         return {"summary": "Not enough data for a month-on-month comparison."}
     
@@ -26,44 +30,42 @@ def analyze_trends_with_pandas(df: pd.DataFrame) -> dict:
     prev_month_period = months[-2]
 
     # --- Analysis ---
-    last_month_data = debit_df[debit_df['month'] == last_month_period]
-    prev_month_data = debit_df[debit_df['month'] == prev_month_period]
+    monthly_spend = monthly_totals(debit_cube)
+    monthly_categories = monthly_totals(debit_cube, by='category')
 
-    # 1. MoM Total Spending
-    last_month_total = last_month_data['amount'].sum()
-    prev_month_total = prev_month_data['amount'].sum()
+    # 1. MoM Total Spending (including transactions without a category)
+    last_month_total = monthly_spend[last_month_period]
+    prev_month_total = monthly_spend[prev_month_period]
+    last_month_categories = monthly_categories.xs(last_month_period, level='month')
+    prev_month_categories = monthly_categories.xs(prev_month_period, level='month')
     total_spend_change_pct = ((last_month_total - prev_month_total) / prev_month_total) * 100 if prev_month_total > 0 else 0
 
     # 2. MoM Spending by Top Categories
-    last_month_categories = last_month_data.groupby('category')['amount'].sum()
-    prev_month_categories = prev_month_data.groupby('category')['amount'].sum()
     category_comparison = pd.DataFrame({'last_month': last_month_categories, 'prev_month': prev_month_categories}).fillna(0)
     category_comparison['change'] = category_comparison['last_month'] - category_comparison['prev_month']
-    top_increases = category_comparison['change'].nlargest(3).to_string()
+    top_increases = render_section("top_category_increases", category_comparison['change'].nlargest(3), value_name="change")
     
     # 3. Burst Detection (Anomaly)
-    avg_spend = debit_df['amount'].mean()
-    std_dev = debit_df['amount'].std()
+    avg_spend, std_dev = amount_moments(debit_cube)
     burst_threshold = avg_spend + 3 * std_dev
-    burst_transactions = last_month_data[last_month_data['amount'] > burst_threshold]
+    last_month_data = df[df['is_debit'] & (df['month'] == last_month_period)]
+    # Largest first, so a heavy spender's report keeps its biggest bursts within the token budget
+    burst_transactions = last_month_data[last_month_data['amount'] > burst_threshold].sort_values('amount', ascending=False, kind='stable')
 
     analysis = {
         "last_month_name": last_month_period.strftime('%B %Y'),
         "prev_month_name": prev_month_period.strftime('%B %Y'),
         "total_spend_change_pct": f"{total_spend_change_pct:.2f}%",
         "top_category_increases": top_increases,
-        "burst_transactions_report": "No significant burst spending detected." if burst_transactions.empty else burst_transactions[['timestamp', 'merchant_name', 'amount']].to_string()
+        "burst_transactions_report": "No significant burst spending detected." if burst_transactions.empty else render_section(
+            "burst_transactions_report", burst_transactions, columns=['timestamp', 'merchant_name', 'amount'], noun="large transactions")
     }
     return analysis
 
-def summarize_trends_with_llm(analysis: dict) -> str:
+def build_trend_messages(analysis: dict) -> list[dict]:
     """
-    Uses an LLM to generate a qualitative summary of financial trends.
+    Builds the chat messages for the trend summary LLM call.
     """
-    if "summary" in analysis:
-        return analysis["summary"]
-
-    print("Executing LLM Trend Summary...")
     prompt = f"""
     You are a financial analyst AI. Create a concise, human-readable summary of a user's spending trends based on pre-calculated data.
 
@@ -81,14 +83,35 @@ def summarize_trends_with_llm(analysis: dict) -> str:
     - Mention any noteworthy large transactions.
     - Keep the tone helpful and informative.
     """
+    return [{"role": "system", "content": "You are a financial analyst AI who summarizes spending trends."},
+            {"role": "user", "content": prompt}]
+
+def summarize_trends_with_llm(analysis: dict) -> str:
+    """
+    Uses an LLM to generate a qualitative summary of financial trends.
+    """
+    if "summary" in analysis:
+        return analysis["summary"]
+
+    print("Executing LLM Trend Summary...")
+    try:
+        return chat_completion(build_trend_messages(analysis), temperature=0.5, max_tokens=400)
+    except LLMUnavailableError:
+        raise  # The runner defers the user instead of reporting an API error
+    except Exception as e:
+        return f"An error occurred with the OpenAI API during trend summarization: {e}"
+
+async def asummarize_trends_with_llm(analysis: dict) -> str:
+    """
+    Async variant of summarize_trends_with_llm for concurrent multi-user runs.
+    """
+    if "summary" in analysis:
+        return analysis["summary"]
+
+    print("Executing LLM Trend Summary (async)...")
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": "You are a financial analyst AI who summarizes spending trends."},
-                      {"role": "user", "content": prompt}],
-            temperature=0.5,
-            max_tokens=400
-        )
-        return response.choices[0].message.content
+        return await achat_completion(build_trend_messages(analysis), temperature=0.5, max_tokens=400)
+    except LLMUnavailableError:
+        raise
     except Exception as e:
-        return f"An error occurred with the OpenAI API during trend summarization: {e}"
\ No newline at end of file
+        return f"An error occurred with the OpenAI API during trend summarization: {e}"
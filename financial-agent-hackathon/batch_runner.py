@@ -0,0 +1,243 @@
+"""
+Batch CLI for the full (Phase 1-4) multi-user pipeline on multi-core nodes.
+
+Users are split into shards that a process pool runs through the pandas
+stages (profile analysis, trends and budget baseline; one aggregate cube per
+shard). As each shard finishes, the main process runs the LLM stages and the
+report node for its users and writes each user's final report, as soon as
+that user is done, to <output-dir>/<input name>/<user_id>.md. Users whose report already exists are
+skipped, so an interrupted run resumes where it stopped. Users deferred while
+the LLM service is unavailable get no report, so a rerun picks them up.
+
+Usage:
+    python batch_runner.py exports/day1.csv exports/day2.csv --workers 16 --output-dir reports [--async] [--stream]
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import load_transactions, stream_transactions_to_shards, ShardedTransactions
+from utils.normalization import ensure_normalized
+from utils.partitioning import partition_by_user
+from utils.partition_store import partition_store
+from utils.aggregate_cube import AggregateCube
+from utils.llm_cache import llm_cache_scope
+from utils.instrumentation import metrics_recorder_from_env
+from utils.llm_resilience import (run_deferring_unavailable, arun_deferring_unavailable,
+                                  llm_call_metrics, format_llm_call_metrics)
+from agent.profile_builder import (PROFILE_BATCH_SIZE, analyze_all_users_with_pandas,
+                                   generate_profiles_batched, agenerate_profiles_batched)
+from agent.trend_analyzer import analyze_trends_with_pandas
+from agent.budgeting_expert import create_budget_baseline_with_pandas
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+SHARDS_PER_WORKER = 4  # More shards than workers: balanced load, and reports start appearing early
+# (but never fewer users per shard than one profile batch: the LLM stages run per shard)
+
+# --- Worker Side (pandas stages) ---
+
+def analyze_shard(shard_df: Optional[pd.DataFrame] = None, shard_dir: Optional[str] = None,
+                  user_ids: Optional[list] = None, verbose: bool = False) -> dict:
+    """
+    Runs the pandas stages for one shard of users in a worker process. The rows
+    come either as shard_df or, for streamed inputs, are read from shard_dir.
+    Returns {user_id: {"pandas_analysis", "trend_analysis", "budget_baseline"}}.
+    """
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        if shard_df is None:
+            sharded = ShardedTransactions(shard_dir)
+            shard_df = pd.concat([sharded[user_id] for user_id in user_ids], ignore_index=True)
+        shard_df = ensure_normalized(shard_df)
+        cube = AggregateCube.build(shard_df)
+        analyses = analyze_all_users_with_pandas(shard_df)
+        results = {}
+        for user_id, user_df in partition_by_user(shard_df).items():
+            cells = cube.for_user(user_id)
+            results[user_id] = {
+                "pandas_analysis": analyses[user_id],
+                "trend_analysis": analyze_trends_with_pandas(user_df, cells),
+                "budget_baseline": create_budget_baseline_with_pandas(user_df, cells),
+            }
+    return results
+
+# --- Main Process Side (LLM stages and reports) ---
+
+def report_path(output_dir: str, user_id) -> str:
+    """
+    <output_dir>/<user_id>.md. IDs with characters unsafe in file names get them
+    replaced and a short hash of the raw ID appended, so "a/b" and "a_b" keep separate reports.
+    """
+    safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", str(user_id))
+    if safe_name != str(user_id):
+        safe_name += "-" + hashlib.sha256(str(user_id).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_dir, f"{safe_name}.md")
+
+def write_report(output_dir: str, user_id, report: str) -> None:
+    """Writes atomically, so a report on disk is always complete (and safe to resume from)."""
+    path = report_path(output_dir, user_id)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(report)
+    os.replace(tmp_path, path)
+
+def _initial_state(user_id, dataset_key: str, precomputed: dict, profiles: Optional[dict]) -> dict:
+    state = {"user_id": user_id, "transactions_ref": partition_store.handle(dataset_key, user_id), **precomputed}
+    if profiles is not None and user_id in profiles:
+        state["profile_summary"] = profiles[user_id]
+    return state
+
+def run_llm_stages(app, shard_results: dict, dataset_key: str, async_mode: bool, verbose: bool,
+                   on_report: Optional[Callable[[Any, str], None]] = None) -> tuple[dict, list]:
+    """
+    Runs the graph (only the LLM and report nodes remain) for one shard's users,
+    whose rows are registered in the partition store under dataset_key.
+    on_report(user_id, report) is called as each user finishes, so a failure
+    later in the shard does not lose the reports already made.
+    Returns ({user_id: report}, [users deferred while the LLM service was unavailable]).
+    """
+    on_report = on_report or (lambda user_id, report: None)
+    with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+        analyses = {user_id: result["pandas_analysis"] for user_id, result in shard_results.items()}
+        if async_mode:
+            async def run_shard():
+                profiles = await agenerate_profiles_batched(analyses) if PROFILE_BATCH_SIZE > 1 else None
+
+                async def run_user(user_id):
+                    with llm_cache_scope(user_id):
+                        state = await app.ainvoke(_initial_state(user_id, dataset_key, shard_results[user_id], profiles))
+                    report = state.get('final_report', 'Error generating report.')
+                    on_report(user_id, report)
+                    return report
+
+                return await arun_deferring_unavailable(list(shard_results), run_user)
+            return asyncio.run(run_shard())
+
+        profiles = generate_profiles_batched(analyses) if PROFILE_BATCH_SIZE > 1 else None
+
+        def run_user(user_id):
+            with llm_cache_scope(user_id):
+                state = app.invoke(_initial_state(user_id, dataset_key, shard_results[user_id], profiles))
+            report = state.get('final_report', 'Error generating report.')
+            on_report(user_id, report)
+            return report
+
+        return run_deferring_unavailable(list(shard_results), run_user)
+
+def _shards(user_ids: list, workers: int) -> list[list]:
+    """
+    Splits users into about SHARDS_PER_WORKER shards per worker. Shard sizes are rounded
+    up to whole profile batches, so batched profile requests go out full.
+    """
+    if not user_ids:
+        return []
+    shard_size = math.ceil(len(user_ids) / max(1, workers * SHARDS_PER_WORKER))
+    if PROFILE_BATCH_SIZE > 1:
+        shard_size = math.ceil(shard_size / PROFILE_BATCH_SIZE) * PROFILE_BATCH_SIZE
+    return [user_ids[i:i + shard_size] for i in range(0, len(user_ids), shard_size)]
+
+def run_batch(input_path: str, output_dir: str, workers: int = DEFAULT_WORKERS, async_mode: bool = False,
+              stream: bool = False, resume: bool = True, verbose: bool = False) -> Optional[dict]:
+    """
+    Analyzes every user of input_path and writes one report file per user into
+    output_dir. Returns a summary dict, or None if the input could not be loaded.
+    """
+    from main import build_full_workflow  # Deferred with langgraph until a run actually starts
+
+    print(f"--- Batch Analysis: {input_path} -> {output_dir} ({workers} workers) ---")
+    if stream:
+        partitions = stream_transactions_to_shards(input_path)
+        if partitions is None: return None
+        dataset_rows = partitions.total_rows
+    else:
+        full_df = load_transactions(input_path)
+        if full_df is None: return None
+        partitions = partition_by_user(ensure_normalized(full_df))
+        dataset_rows = len(full_df)
+        del full_df
+    user_ids = list(partitions.user_ids)
+    dataset_key = f"batch:{os.path.abspath(input_path)}"
+    partition_store.register(dataset_key, partitions)
+
+    os.makedirs(output_dir, exist_ok=True)
+    done = {user_id for user_id in user_ids if resume and os.path.exists(report_path(output_dir, user_id))}
+    pending = [user_id for user_id in user_ids if user_id not in done]
+    print(f"Found {len(user_ids)} users: {len(done)} already reported, {len(pending)} to analyze.")
+
+    app = build_full_workflow(async_llm=async_mode, recorder=metrics_recorder_from_env(dataset_rows=dataset_rows))
+    start = time.perf_counter()
+    completed = failed = deferred = 0
+
+    def on_report(user_id, report):
+        nonlocal completed
+        write_report(output_dir, user_id, report)
+        completed += 1
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for shard in _shards(pending, workers):
+            if stream:
+                future = pool.submit(analyze_shard, shard_dir=partitions.shard_dir, user_ids=shard, verbose=verbose)
+            else:
+                positions = np.concatenate([np.arange(*partitions.bounds(user_id)) for user_id in shard])
+                future = pool.submit(analyze_shard, shard_df=partitions.frame.take(positions), verbose=verbose)
+            futures[future] = shard
+
+        for future in as_completed(futures):
+            shard = futures[future]
+            completed_before = completed
+            try:
+                _, shard_deferred = run_llm_stages(app, future.result(), dataset_key, async_mode, verbose, on_report)
+            except Exception as e:
+                # Reports written before the error are kept; the rerun picks up the rest
+                shard_failed = len(shard) - (completed - completed_before)
+                failed += shard_failed
+                print(f"Error: Shard failed for {shard_failed} of {len(shard)} users ({e}); rerun to retry them.")
+                continue
+            deferred += len(shard_deferred)
+            print(f"[{len(done) + completed}/{len(user_ids)}] Wrote {completed - completed_before} reports "
+                  f"({time.perf_counter() - start:.1f}s elapsed)")
+            if shard_deferred:
+                print(f"Deferred {len(shard_deferred)} users (LLM service unavailable); rerun to retry them.")
+
+    partition_store.release(dataset_key)
+    summary = {"input": input_path, "users": len(user_ids), "skipped": len(done), "completed": completed,
+               "failed": failed, "deferred": deferred, "seconds": round(time.perf_counter() - start, 2),
+               "llm": llm_call_metrics()}
+    with open(os.path.join(output_dir, "_batch_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Transactions files (.xlsx, .xls or .csv)")
+    parser.add_argument("--output-dir", default="batch_reports", help="Reports go to <output-dir>/<input name>/<user_id>.md")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Processes for the pandas stages")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="Run each shard's LLM stages concurrently (AsyncOpenAI + shared rate limiter)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Ingest large CSVs in chunks into per-user shards; workers read their users from disk")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Recompute users whose report already exists")
+    parser.add_argument("--verbose", action="store_true", help="Show the per-node and per-agent progress output")
+    args = parser.parse_args()
+
+    for input_path in args.inputs:
+        name = os.path.splitext(os.path.basename(input_path))[0]
+        summary = run_batch(input_path, os.path.join(args.output_dir, name), workers=max(1, args.workers),
+                            async_mode=args.async_mode, stream=args.stream, resume=args.resume, verbose=args.verbose)
+        if summary is not None:
+            print(f"Done: {summary['completed']} reports written, {summary['skipped']} skipped, "
+                  f"{summary['failed']} failed, {summary['deferred']} deferred in {summary['seconds']}s.")
+            print(format_llm_call_metrics(summary['llm']) + "\n")
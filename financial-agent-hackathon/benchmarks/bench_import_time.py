@@ -0,0 +1,83 @@
+"""
+Cold-start benchmark: how long importing the CLI, the Streamlit app and the
+LLM client takes, and which dependencies dominate.
+
+Each module is imported in a fresh interpreter with `python -X importtime`;
+the wall time is the median over --repeat runs, and the slowest top-level
+third-party imports made by project code (cumulative, from the last run) are
+listed per module.
+
+Usage:
+    python benchmarks/bench_import_time.py [--modules main streamlit_app utils.llm_client] [--repeat 5] [--top 8]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["main", "main_refactored", "streamlit_app", "utils.llm_client"]
+PROJECT_PACKAGES = {"utils", "agent"}
+PROJECT_MODULES = {"main", "main_refactored", "streamlit_app", "config"}
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, str]]:
+    """(module, cumulative_us, parent) for every import in -X importtime output."""
+    lines = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        lines.append((name.strip(), int(cumulative_us), (len(name) - len(name.lstrip()) - 1) // 2))
+    # Children are printed before their parent, so walk backwards keeping the open parents
+    rows, parents = [], []
+    for name, cumulative_us, depth in reversed(lines):
+        del parents[depth:]
+        rows.append((name, cumulative_us, parents[-1] if parents else ""))
+        parents.append(name)
+    return rows
+
+def is_project_module(name: str) -> bool:
+    return name.split(".")[0] in PROJECT_PACKAGES or name in PROJECT_MODULES
+
+def time_import(module: str) -> tuple[float, list[tuple[str, int, str]]]:
+    """Wall seconds for a fresh interpreter to import module (nothing if empty), and its importtime rows."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}" if module else "pass"],
+                          cwd=PROJECT_ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr.splitlines()[-1] if proc.stderr else ''}")
+    return elapsed, parse_importtime(proc.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="Slowest dependencies listed per module")
+    args = parser.parse_args()
+
+    baseline = statistics.median(time_import("")[0] for _ in range(args.repeat))
+    print(f"\n--- Import Time Benchmark (median of {args.repeat}; bare interpreter {baseline * 1000:.0f} ms) ---")
+    print(f"{'Module':<22}{'Wall ms':>10}{'Import ms':>12}")
+    breakdowns = {}
+    for module in args.modules:
+        runs = [time_import(module) for _ in range(args.repeat)]
+        wall = statistics.median(seconds for seconds, _ in runs)
+        rows = runs[-1][1]
+        total_us = next((us for name, us, parent in rows if name == module and not parent), 0)
+        print(f"{module:<22}{wall * 1000:>10.0f}{total_us / 1000:>12.0f}")
+        # Third-party packages as first imported by project code
+        breakdowns[module] = sorted(
+            ((name, us) for name, us, parent in rows
+             if not is_project_module(name) and is_project_module(parent)),
+            key=lambda row: row[1], reverse=True)[:args.top]
+
+    for module, deps in breakdowns.items():
+        print(f"\nSlowest imports under {module}:")
+        for name, us in deps:
+            print(f"  {name:<40}{us / 1000:>8.0f} ms")
+
+if __name__ == "__main__":
+    main()
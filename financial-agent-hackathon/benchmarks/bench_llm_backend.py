@@ -0,0 +1,131 @@
+"""
+Load benchmark for the LLM client against the local mock server
+(utils/mock_llm_server.py): throughput, p50/p95 latency, 429s and the peak
+number of concurrent requests the server saw, for the blocking client on a
+thread pool and for the async client behind its shared rate limiter. The
+stream mode runs streamed requests on the thread pool; its latency columns
+are the time to the first text piece (what a UI user waits for).
+
+Usage:
+    python benchmarks/bench_llm_backend.py [--requests 200] [--latency-ms 300] [--ms-per-token 0] [--rpm 0]
+        [--error-rate 0.0] [--mode both|sync|async|stream] [--workers 8]
+
+The response cache is disabled so every request reaches the server. No
+network access or API key is needed. Requests the client gives up on (retries
+exhausted, or circuit breaker open) are left out of the latency columns; the
+retry and breaker counters are printed at the end.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Make the project root importable when run as a script; every request must reach the server
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE_ENABLED"] = "0"
+
+import numpy as np
+import utils.llm_client as llm_client
+from utils.llm_resilience import LLMUnavailableError, format_llm_call_metrics, get_circuit_breaker
+from utils.llm_backends import OpenAIBackend, set_backend
+from utils.mock_llm_server import start_mock_server
+
+def build_messages(i: int) -> list[dict]:
+    return [
+        {"role": "system", "content": "You are a financial analyst."},
+        {"role": "user", "content": f"Summarize spending for user {i}. " + "Transaction row. " * 50},
+    ]
+
+def timed_call(i: int) -> tuple[float, bool]:
+    """Returns (seconds, gave_up) for one blocking request."""
+    start = time.perf_counter()
+    try:
+        llm_client.chat_completion(build_messages(i), temperature=0.2, max_tokens=150)
+        return time.perf_counter() - start, False
+    except LLMUnavailableError:
+        return time.perf_counter() - start, True
+
+def timed_stream_call(i: int) -> tuple[float, bool]:
+    """Returns (seconds to the first text piece, gave_up) for one streamed request, read to the end."""
+    start = time.perf_counter()
+    first = None
+    try:
+        for _ in llm_client.chat_completion(build_messages(i), temperature=0.2, max_tokens=150, stream=True):
+            if first is None:
+                first = time.perf_counter() - start
+        return (first if first is not None else time.perf_counter() - start), False
+    except LLMUnavailableError:
+        return time.perf_counter() - start, True
+
+async def atimed_call(i: int) -> tuple[float, bool]:
+    start = time.perf_counter()
+    try:
+        await llm_client.achat_completion(build_messages(i), temperature=0.2, max_tokens=150)
+        return time.perf_counter() - start, False
+    except LLMUnavailableError:
+        return time.perf_counter() - start, True
+
+def run_sync(n: int, workers: int, call=timed_call) -> list[tuple[float, bool]]:
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(call, range(n)))
+
+def run_async(n: int) -> list[tuple[float, bool]]:
+    async def run_all():
+        return await asyncio.gather(*(atimed_call(i) for i in range(n)))
+    return asyncio.run(run_all())
+
+def report(mode: str, results: list[tuple[float, bool]], wall_s: float, stats: dict) -> None:
+    latencies = np.array([seconds for seconds, gave_up in results if not gave_up])
+    completed = len(latencies)
+    p50, p95 = (np.percentile(latencies, [50, 95]) * 1000) if completed else (float('nan'), float('nan'))
+    # 429s as counted by the server: the client retries them (utils/llm_resilience.py) before giving up
+    print(f"{mode:<28}{completed:>10}{stats['rate_limited']:>7}{completed / wall_s:>10.1f}"
+          f"{p50:>10.0f}{p95:>10.0f}{stats['peak_in_flight']:>8}{wall_s:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="Mock generation time per completion token")
+    parser.add_argument("--rpm", type=int, default=0, help="Mock server requests-per-minute limit (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests the mock answers with 429")
+    parser.add_argument("--mode", choices=["both", "sync", "async", "stream"], default="both")
+    parser.add_argument("--workers", type=int, default=llm_client.LLM_MAX_CONCURRENCY,
+                        help="Threads for the blocking client")
+    args = parser.parse_args()
+
+    modes = ["sync", "async"] if args.mode == "both" else [args.mode]
+    if args.mode == "stream":
+        modes = ["sync", "stream"]  # Blocking baseline first, for the time-to-first-text comparison
+    print(f"\n--- LLM Backend Benchmark: {args.requests} requests, {args.latency_ms:.0f} ms "
+          f"(+{args.jitter_ms:.0f} ms jitter) mock latency ---")
+    print(f"{'Mode':<28}{'Completed':>10}{'429s':>7}{'Req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'Peak':>8}{'Wall s':>9}")
+    for mode in modes:
+        # A fresh server per mode so the rate-limit window and counters start empty
+        server = start_mock_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, ms_per_token=args.ms_per_token,
+                                   rpm=args.rpm, error_rate=args.error_rate)
+        set_backend(OpenAIBackend(api_key="benchmark", base_url=server.base_url))
+        try:
+            start = time.perf_counter()
+            if mode == "sync":
+                results = run_sync(args.requests, args.workers)
+                label = f"sync ({args.workers} threads)"
+            elif mode == "stream":
+                results = run_sync(args.requests, args.workers, timed_stream_call)
+                label = f"stream, first text ({args.workers} thr)"
+            else:
+                results = run_async(args.requests)
+                label = f"async (limit {llm_client.LLM_MAX_CONCURRENCY})"
+            report(label, results, time.perf_counter() - start, dict(server.stats))
+        finally:
+            server.shutdown()
+            server.server_close()
+            set_backend(None)
+            get_circuit_breaker().reset()
+    print(format_llm_call_metrics())
+
+if __name__ == "__main__":
+    main()
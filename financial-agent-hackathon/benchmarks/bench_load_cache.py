@@ -0,0 +1,73 @@
+"""
+Benchmark: cold (parse Excel/CSV) vs warm (memory-mapped Arrow cache) loads
+for utils.data_loader.load_transactions.
+
+Usage:
+    python benchmarks/bench_load_cache.py [--file PATH] [--rows N] [--repeat K]
+
+--rows inflates the sample file to roughly N rows (by repeating it) so the
+difference can be seen at realistic sizes.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Make the project root importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import utils.data_loader as data_loader
+
+def build_input(source_path: str, rows: int, out_dir: str) -> str:
+    """Writes a copy of the source file inflated to about `rows` rows."""
+    df = pd.read_excel(source_path) if source_path.endswith(('.xlsx', '.xls')) else pd.read_csv(source_path)
+    if rows and rows > len(df):
+        df = pd.concat([df] * (rows // len(df) + 1), ignore_index=True).head(rows)
+    _, ext = os.path.splitext(source_path)
+    out_path = os.path.join(out_dir, f"bench_input{ext}")
+    if ext in ('.xlsx', '.xls'):
+        df.to_excel(out_path, index=False)
+    else:
+        df.to_csv(out_path, index=False)
+    return out_path
+
+def time_load(file_path: str, use_cache: bool = True) -> float:
+    start = time.perf_counter()
+    df = data_loader.load_transactions(file_path, use_cache=use_cache)
+    elapsed = time.perf_counter() - start
+    if df is None:
+        raise RuntimeError(f"Failed to load {file_path}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default="sample_data/upi_transactions.xlsx")
+    parser.add_argument("--rows", type=int, default=0, help="Inflate the input to this many rows")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of warm loads to time")
+    args = parser.parse_args()
+
+    if data_loader.feather is None:
+        print("pyarrow is not installed; the columnar cache is disabled.")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Point the cache at a fresh directory so the first load is genuinely cold
+        data_loader.CACHE_DIR = os.path.join(tmp_dir, "cache")
+        file_path = build_input(args.file, args.rows, tmp_dir) if args.rows else args.file
+
+        no_cache = time_load(file_path, use_cache=False)
+        cold = time_load(file_path)
+        warm = [time_load(file_path) for _ in range(args.repeat)]
+        best_warm = min(warm)
+
+    print("\n--- Load Benchmark ---")
+    print(f"{'Input:':<22}{args.file}" + (f" inflated to {args.rows} rows" if args.rows else ""))
+    print(f"{'No cache:':<22}{no_cache * 1000:10.1f} ms")
+    print(f"{'Cold (parse+write):':<22}{cold * 1000:10.1f} ms")
+    print(f"{f'Warm (best of {args.repeat}):':<22}{best_warm * 1000:10.1f} ms")
+    print(f"{'Speedup:':<22}{no_cache / best_warm:10.1f}x")
+
+if __name__ == "__main__":
+    main()
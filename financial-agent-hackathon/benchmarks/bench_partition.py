@@ -0,0 +1,65 @@
+"""
+Benchmark: per-user boolean masks vs UserPartitions as the number of users grows.
+
+The old loop did full_df[full_df['user_id'] == user_id].copy() for every user,
+which is O(rows x users). UserPartitions reorders the frame once and hands out
+slices.
+
+Usage:
+    python benchmarks/bench_partition.py [--rows N] [--users 10,100,1000]
+"""
+import argparse
+import os
+import sys
+import time
+
+# Make the project root importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from utils.data_loader import load_transactions
+from utils.partitioning import partition_by_user
+
+def build_frame(base_df: pd.DataFrame, rows: int, n_users: int, seed: int = 42) -> pd.DataFrame:
+    """Repeats the sample to `rows` rows and spreads them randomly over `n_users` users."""
+    rng = np.random.default_rng(seed)
+    df = base_df.iloc[rng.integers(0, len(base_df), size=rows)].reset_index(drop=True)
+    user_ids = np.array([f"USER_{i:06d}" for i in range(n_users)])
+    df['user_id'] = pd.Categorical(user_ids[rng.integers(0, n_users, size=rows)])
+    return df
+
+def time_mask_loop(df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    for user_id in df['user_id'].unique():
+        user_df = df[df['user_id'] == user_id].copy()
+        len(user_df)
+    return time.perf_counter() - start
+
+def time_partitions(df: pd.DataFrame) -> float:
+    start = time.perf_counter()
+    for user_id, user_df in partition_by_user(df).items():
+        len(user_df)
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default="sample_data/upi_transactions.xlsx")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--users", default="10,100,1000,5000", help="Comma-separated user counts")
+    args = parser.parse_args()
+
+    base_df = load_transactions(args.file)
+    if base_df is None:
+        return
+
+    print(f"\n--- Partition Benchmark ({args.rows:,} rows) ---")
+    print(f"{'Users':>8} {'Mask loop (s)':>15} {'Partitions (s)':>15} {'Speedup':>9}")
+    for n_users in [int(u) for u in args.users.split(",")]:
+        df = build_frame(base_df, args.rows, n_users)
+        mask_time = time_mask_loop(df)
+        partition_time = time_partitions(df)
+        print(f"{n_users:>8} {mask_time:>15.3f} {partition_time:>15.3f} {mask_time / partition_time:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
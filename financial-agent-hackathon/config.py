@@ -7,6 +7,12 @@ load_dotenv()
 # Retrieve the API key from the environment variables.
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# A crucial check to ensure the application doesn't run without the API key.
-if not OPENAI_API_KEY:
-    raise ValueError("OpenAI API key not found. Please create a .env file and set the OPENAI_API_KEY.")
\ No newline at end of file
+def require_openai_api_key() -> str:
+    """
+    Returns the API key. The check runs when the OpenAI backend first needs a
+    client, not at import, so the offline backends and the pandas stages work
+    without a key.
+    """
+    if not OPENAI_API_KEY:
+        raise ValueError("OpenAI API key not found. Please create a .env file and set the OPENAI_API_KEY.")
+    return OPENAI_API_KEY
@@ -0,0 +1,25 @@
+"""
+Shared pytest fixtures: every test talks to an in-process fake LLM, with the
+on-disk response cache off and a fresh circuit breaker.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils import llm_cache, llm_resilience
+from utils.llm_backends import FakeBackend, set_backend
+
+@pytest.fixture(autouse=True)
+def offline_llm(monkeypatch):
+    """Installs a FakeBackend (returned for tests that want to inspect it) and restores the defaults afterwards."""
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(llm_resilience, "LLM_BACKOFF_BASE_S", 0.0)  # Retries without Retry-After do not wait
+    llm_resilience.get_circuit_breaker().reset()
+    backend = FakeBackend()
+    set_backend(backend)
+    yield backend
+    set_backend(None)
+    llm_resilience.get_circuit_breaker().reset()
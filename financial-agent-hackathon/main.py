@@ -1,28 +1,56 @@
-from langgraph.graph import StateGraph, END
+import argparse
+import asyncio
+import os
+import sqlite3
+from typing import Optional
 from utils.state_manager import FinancialAnalysisState
-from utils.data_loader import load_transactions
-from agent.profile_builder import analyze_transactions_with_pandas, generate_profile_from_analysis
-from agent.trend_analyzer import analyze_trends_with_pandas, summarize_trends_with_llm
-from agent.budgeting_expert import create_budget_baseline_with_pandas, generate_budget_plan_with_llm
+from utils.data_loader import load_transactions, stream_transactions_to_shards, dataset_fingerprint
+from utils.partitioning import partition_by_user
+from utils.partition_store import partition_store, state_transactions, state_cube_cells
+from utils.normalization import ensure_normalized
+from agent.profile_builder import analyze_transactions_with_pandas, analyze_all_users_with_pandas, generate_profile_from_analysis, agenerate_profile_from_analysis
+from agent.profile_builder import PROFILE_BATCH_SIZE, generate_profiles_batched, agenerate_profiles_batched
+from agent.trend_analyzer import analyze_trends_with_pandas, summarize_trends_with_llm, asummarize_trends_with_llm
+from agent.budgeting_expert import create_budget_baseline_with_pandas, generate_budget_plan_with_llm, agenerate_budget_plan_with_llm
 from agent.insight_generator import generate_final_report # Import the new function
+from utils.llm_cache import get_response_cache, llm_cache_scope
+from utils.incremental import IncrementalStore, INCREMENTAL_STORE_DIR, ingest_delta, merge_touched, update_cube
+from utils.aggregate_cube import load_or_build_cube
+from utils.instrumentation import NodeMetricsRecorder, instrument, metrics_recorder_from_env
+from utils.llm_resilience import run_deferring_unavailable, arun_deferring_unavailable, format_llm_call_metrics
 
 # --- Define Graph Nodes ---
 
+# Phase 0 Node: shared normalization (a no-op when the dataset was normalized before partitioning)
+def normalize_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
+    print(f"--- User {state['user_id']} | Node: Normalize Transactions ---")
+    if state.get('transactions_df') is None:
+        # Rows behind a transactions_ref are read and normalized once here, before the branches fan out
+        state_transactions(state)
+        return {}
+    return {"transactions_df": ensure_normalized(state['transactions_df'])}
+
 # Phase 1 Nodes
 def pandas_analysis_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     print(f"--- User {state['user_id']} | Node: Pandas Profile Analysis ---")
-    analysis_results = analyze_transactions_with_pandas(state['transactions_df'])
+    if state.get('pandas_analysis') is not None:
+        return {}  # Precomputed for all users by analyze_all_users_with_pandas
+    analysis_results = analyze_transactions_with_pandas(state_transactions(state))
     return {"pandas_analysis": analysis_results}
 
 def profile_llm_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     print(f"--- User {state['user_id']} | Node: LLM Profile Summary ---")
+    if state.get('profile_summary') is not None:
+        return {}  # Precomputed in a batched request by generate_profiles_batched
     profile = generate_profile_from_analysis(state['pandas_analysis'])
     return {"profile_summary": profile}
 
 # Phase 2 Nodes
 def trend_pandas_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     print(f"--- User {state['user_id']} | Node: Pandas Trend Analysis ---")
-    analysis = analyze_trends_with_pandas(state['transactions_df'])
+    if state.get('trend_analysis') is not None:
+        return {}  # Precomputed, e.g. by a batch_runner.py worker process
+    analysis = analyze_trends_with_pandas(state_transactions(state), state_cube_cells(state))
     return {"trend_analysis": analysis}
 
 def trend_llm_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
@@ -33,7 +61,9 @@ def trend_llm_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
 # Phase 3 Nodes
 def budget_pandas_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     print(f"--- User {state['user_id']} | Node: Pandas Budget Baseline ---")
-    baseline = create_budget_baseline_with_pandas(state['transactions_df'])
+    if state.get('budget_baseline') is not None:
+        return {}
+    baseline = create_budget_baseline_with_pandas(state_transactions(state), state_cube_cells(state))
     return {"budget_baseline": baseline}
 
 def budget_llm_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
@@ -41,6 +71,24 @@ def budget_llm_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     summary = generate_budget_plan_with_llm(state['budget_baseline'], state['profile_summary'])
     return {"budget_summary": summary}
 
+# Async LLM Nodes: used when many users are analyzed concurrently (see run_full_analysis_async)
+async def profile_llm_node_async(state: FinancialAnalysisState) -> FinancialAnalysisState:
+    print(f"--- User {state['user_id']} | Node: LLM Profile Summary (async) ---")
+    if state.get('profile_summary') is not None:
+        return {}
+    profile = await agenerate_profile_from_analysis(state['pandas_analysis'])
+    return {"profile_summary": profile}
+
+async def trend_llm_node_async(state: FinancialAnalysisState) -> FinancialAnalysisState:
+    print(f"--- User {state['user_id']} | Node: LLM Trend Summary (async) ---")
+    summary = await asummarize_trends_with_llm(state['trend_analysis'])
+    return {"trend_summary": summary}
+
+async def budget_llm_node_async(state: FinancialAnalysisState) -> FinancialAnalysisState:
+    print(f"--- User {state['user_id']} | Node: LLM Budget Plan (async) ---")
+    summary = await agenerate_budget_plan_with_llm(state['budget_baseline'], state['profile_summary'])
+    return {"budget_summary": summary}
+
 # Phase 4 Node (NEW)
 def insight_generator_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     print(f"--- User {state['user_id']} | Node: Insight Generator (Report Assembly) ---")
@@ -51,55 +99,231 @@ def insight_generator_node(state: FinancialAnalysisState) -> FinancialAnalysisSt
     )
     return {"final_report": report}
 
-# --- Main Multi-User Workflow Execution ---
+# --- Workflow Construction ---
 
-def run_full_analysis_for_multiple_users():
-    print("--- Initializing Full (Phase 1-4) Multi-User Financial Analysis Engine ---")
+def build_full_workflow(async_llm: bool = False, recorder: Optional[NodeMetricsRecorder] = None, checkpointer=None):
+    """
+    Builds and compiles the full (Phase 1-4) per-user graph. Independent
+    branches run concurrently and join at the report node. With async_llm=True
+    the LLM nodes are coroutines, and the app must be run with ainvoke. If a
+    recorder is given, every node is wrapped to record timing, memory and token usage.
+    With a checkpointer, each completed step is persisted per thread (see run_user_graph).
+    """
+    from langgraph.graph import StateGraph, END  # Imported on first build: langgraph is the slowest import here
 
     workflow = StateGraph(FinancialAnalysisState)
 
+    def add_node(name, fn):
+        workflow.add_node(name, instrument(name, fn, recorder))
+
     # Add all nodes
-    workflow.add_node("profile_pandas", pandas_analysis_node)
-    workflow.add_node("profile_llm", profile_llm_node)
-    workflow.add_node("trend_pandas", trend_pandas_node)
-    workflow.add_node("trend_llm", trend_llm_node)
-    workflow.add_node("budget_pandas", budget_pandas_node)
-    workflow.add_node("budget_llm", budget_llm_node)
-    workflow.add_node("generate_report", insight_generator_node) # Add the final node
+    add_node("normalize", normalize_node)
+    add_node("profile_pandas", pandas_analysis_node)
+    add_node("profile_llm", profile_llm_node_async if async_llm else profile_llm_node)
+    add_node("trend_pandas", trend_pandas_node)
+    add_node("trend_llm", trend_llm_node_async if async_llm else trend_llm_node)
+    add_node("budget_pandas", budget_pandas_node)
+    add_node("budget_llm", budget_llm_node_async if async_llm else budget_llm_node)
+    add_node("generate_report", insight_generator_node) # Add the final node
     
-    # Define the complete workflow graph
-    workflow.set_entry_point("profile_pandas")
+    # Define the complete workflow graph. After normalization the three pandas
+    # stages fan out; trends and the budget baseline do not depend on the profile,
+    # so the only sequential LLM path is profile_llm -> budget_llm.
+    workflow.set_entry_point("normalize")
+    workflow.add_edge("normalize", "profile_pandas")
+    workflow.add_edge("normalize", "trend_pandas")
+    workflow.add_edge("normalize", "budget_pandas")
     workflow.add_edge("profile_pandas", "profile_llm")
-    workflow.add_edge("profile_llm", "trend_pandas")
     workflow.add_edge("trend_pandas", "trend_llm")
-    workflow.add_edge("trend_llm", "budget_pandas")
-    workflow.add_edge("budget_pandas", "budget_llm")
-    workflow.add_edge("budget_llm", "generate_report") # Final step is report generation
+    workflow.add_edge(["profile_llm", "budget_pandas"], "budget_llm") # Needs the profile and the baseline
+    workflow.add_edge(["trend_llm", "budget_llm"], "generate_report") # Fan-in: final step is report generation
     workflow.add_edge("generate_report", END)
     
-    app = workflow.compile()
+    return workflow.compile(checkpointer=checkpointer)
+
+# --- Checkpointing ---
+# With a checkpoint path (--checkpoint or GRAPH_CHECKPOINT_PATH), every user's graph
+# runs on its own thread of a SQLite checkpointer, keyed by dataset and user. After a
+# crash or kill, rerunning on the same input skips finished users and resumes the
+# others at the nodes that had not completed.
+GRAPH_CHECKPOINT_PATH = os.getenv("GRAPH_CHECKPOINT_PATH")
+
+def open_checkpointer(path: str):
+    """A SqliteSaver on path, or None (with a warning) if langgraph-checkpoint-sqlite is not installed."""
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError:
+        print("Warning: langgraph-checkpoint-sqlite is not installed; running without checkpoints.")
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+def thread_config(dataset_key: str, user_id) -> dict:
+    return {"configurable": {"thread_id": f"{dataset_key}:{user_id}"}}
+
+def run_user_graph(app, initial_state: dict, config: Optional[dict] = None) -> dict:
+    """
+    Runs one user's graph. With a checkpoint config, a finished thread returns
+    its stored state and an interrupted one resumes at its pending nodes.
+    """
+    if config is None:
+        return app.invoke(initial_state)
+    snapshot = app.get_state(config)
+    if snapshot.values and not snapshot.next:
+        return snapshot.values
+    return app.invoke(None if snapshot.next else initial_state, config)
+
+async def arun_user_graph(app, initial_state: dict, config: Optional[dict] = None) -> dict:
+    if config is None:
+        return await app.ainvoke(initial_state)
+    snapshot = await app.aget_state(config)
+    if snapshot.values and not snapshot.next:
+        return snapshot.values
+    return await app.ainvoke(None if snapshot.next else initial_state, config)
+
+# --- Main Multi-User Workflow Execution ---
+
+# Report for users whose LLM stages could not run (see utils/llm_resilience.py)
+DEFERRED_REPORT = ("Report deferred: the LLM service was unavailable. Rerun the analysis to generate it "
+                   "(with --checkpoint, this user's finished steps are kept).")
+
+def build_initial_state(user_id, transactions_ref: dict, analyses=None, profiles=None) -> dict:
+    """
+    Graph input for one user. The rows (and aggregate cube cells) are passed
+    as a partition store handle, so the state stays small enough to checkpoint.
+    Precomputed results go along so the graph skips that work: the batch
+    profile analysis and the profile from a batched LLM request.
+    """
+    state = {"user_id": user_id, "transactions_ref": transactions_ref}
+    if analyses is not None and user_id in analyses:
+        state["pandas_analysis"] = analyses[user_id]
+    if profiles is not None and user_id in profiles:
+        state["profile_summary"] = profiles[user_id]
+    return state
+
+def batched_profiles(analyses, app=None, dataset_key=None):
+    """
+    Profiles for the analyzed users in batched LLM requests, or None when
+    batching is off. With a checkpointed app, users that already have a
+    checkpoint are left out: their state holds whatever they need.
+    """
+    if analyses and app is not None and app.checkpointer is not None:
+        analyses = {user_id: analysis for user_id, analysis in analyses.items()
+                    if not app.get_state(thread_config(dataset_key, user_id)).values}
+    if not analyses or PROFILE_BATCH_SIZE <= 1:
+        return None
+    return generate_profiles_batched(analyses)
+
+async def run_full_analysis_async(app, dataset_key: str, analyses=None, checkpoint_path: Optional[str] = None) -> dict:
+    """
+    Runs every user's graph concurrently on one event loop. The LLM stages of
+    all users share the rate limiter in utils/llm_client.py, so wall-clock time
+    approaches the latency of a single user instead of growing with the user count.
+    Profiles of precomputed analyses are generated first, in batched requests.
+    The dataset's partitions must be registered in the partition store under
+    dataset_key. With a checkpoint_path the graphs run on an AsyncSqliteSaver (see run_user_graph).
+    Users deferred while the LLM service is unavailable get DEFERRED_REPORT.
+    """
+    if checkpoint_path:
+        try:
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+        except ImportError:
+            print("Warning: langgraph-checkpoint-sqlite (with aiosqlite) is not installed; running without checkpoints.")
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+            async with AsyncSqliteSaver.from_conn_string(checkpoint_path) as saver:
+                return await run_full_analysis_async(app.copy(update={"checkpointer": saver}), dataset_key, analyses)
+
+    checkpointed = app.checkpointer is not None
+    config_for = (lambda user_id: thread_config(dataset_key, user_id)) if checkpointed else (lambda user_id: None)
+    profiles = None
+    if analyses and checkpointed:
+        states = await asyncio.gather(*(app.aget_state(config_for(user_id)) for user_id in analyses))
+        analyses = {user_id: analysis for (user_id, analysis), state in zip(analyses.items(), states) if not state.values}
+    if analyses and PROFILE_BATCH_SIZE > 1:
+        profiles = await agenerate_profiles_batched(analyses)
+
+    async def analyze_user(user_id):
+        handle = partition_store.handle(dataset_key, user_id)
+        if not handle["rows"]:
+            return "No data available for this user."
+        with llm_cache_scope(user_id):
+            final_state = await arun_user_graph(app, build_initial_state(user_id, handle, analyses, profiles),
+                                                config_for(user_id))
+        return final_state.get('final_report', 'Error generating report.')
 
-    full_df = load_transactions("sample_data/upi_transactions.xlsx")
-    if full_df is None: return
+    user_ids = partition_store.partitions(dataset_key).user_ids
+    reports, _ = await arun_deferring_unavailable(user_ids, analyze_user)
+    return {user_id: reports.get(user_id, DEFERRED_REPORT) for user_id in user_ids}
 
-    unique_user_ids = full_df['user_id'].unique()
-    print(f"Found {len(unique_user_ids)} unique users. Beginning full analysis...")
+def run_full_analysis_for_multiple_users(async_mode: bool = False, metrics_path: Optional[str] = None,
+                                         print_metrics: bool = False,
+                                         input_path: str = "sample_data/upi_transactions.xlsx",
+                                         stream: bool = False, checkpoint_path: Optional[str] = GRAPH_CHECKPOINT_PATH):
+    print("--- Initializing Full (Phase 1-4) Multi-User Financial Analysis Engine ---")
+
+    if stream:
+        # Large CSV exports: stream into per-user shards and load one user at a time.
+        # Each user is normalized when the graph first resolves its rows instead of up front.
+        partitions = stream_transactions_to_shards(input_path)
+        if partitions is None: return
+        dataset_rows = partitions.total_rows
+        dataset_key = os.path.basename(partitions.shard_dir)  # The shards are keyed by content hash
+        cube = analyses = None  # Computed per user inside the graph
+    else:
+        full_df = load_transactions(input_path)
+        if full_df is None: return
+        dataset_rows = len(full_df)
+
+    # Per-node instrumentation: --metrics / PIPELINE_METRICS_PATH for JSON lines, --metrics-summary for a table
+    if metrics_path or print_metrics:
+        recorder = NodeMetricsRecorder(metrics_path, dataset_rows=dataset_rows)
+    else:
+        recorder = metrics_recorder_from_env(dataset_rows=dataset_rows)
+    # The async runner opens its own (async) checkpointer on the event loop
+    checkpointer = open_checkpointer(checkpoint_path) if checkpoint_path and not async_mode else None
+    app = build_full_workflow(async_llm=async_mode, recorder=recorder, checkpointer=checkpointer)
+
+    if not stream:
+        # Normalize and partition once; each user gets a slice of the normalized frame
+        full_df = ensure_normalized(full_df)
+        partitions = partition_by_user(full_df)
+        dataset_key = dataset_fingerprint(full_df)
+        # Monthly aggregates for every user from a single groupby, persisted per dataset
+        cube = load_or_build_cube(full_df, dataset_key)
+        # Profile analytics for every user in a few whole-dataset groupbys
+        analyses = analyze_all_users_with_pandas(full_df)
+    print(f"Found {len(partitions)} unique users. Beginning full analysis...")
+    # Graph states hold handles into the partition store, not the users' rows
+    partition_store.register(dataset_key, partitions, cube)
+    if checkpoint_path:
+        print(f"Checkpointing to {checkpoint_path}; finished users are skipped and interrupted ones resumed.")
     all_user_reports = {}
 
-    for user_id in unique_user_ids:
-        print(f"\n" + "="*50)
-        print(f"Processing User ID: {user_id}")
-        print("="*50)
+    if async_mode:
+        all_user_reports = asyncio.run(run_full_analysis_async(app, dataset_key, analyses, checkpoint_path))
+    else:
+        profiles = batched_profiles(analyses, app, dataset_key)
+
+        def analyze_user(user_id):
+            print(f"\n" + "="*50)
+            print(f"Processing User ID: {user_id}")
+            print("="*50)
+
+            handle = partition_store.handle(dataset_key, user_id)
+            if not handle["rows"]:
+                return "No data available for this user."
 
-        user_df = full_df[full_df['user_id'] == user_id].copy()
-        if user_df.empty:
-            all_user_reports[user_id] = "No data available for this user."
-            continue
+            initial_input = build_initial_state(user_id, handle, analyses, profiles)
+            config = thread_config(dataset_key, user_id) if checkpointer is not None else None
+            with llm_cache_scope(user_id):
+                final_state = run_user_graph(app, initial_input, config)
+            
+            return final_state.get('final_report', 'Error generating report.')
 
-        initial_input = {"user_id": user_id, "transactions_df": user_df}
-        final_state = app.invoke(initial_input)
-        
-        all_user_reports[user_id] = final_state.get('final_report', 'Error generating report.')
+        # Users whose LLM stages fail while the service is unavailable are retried once after the breaker's cooldown
+        reports, _ = run_deferring_unavailable(partitions.user_ids, analyze_user)
+        all_user_reports = {user_id: reports.get(user_id, DEFERRED_REPORT) for user_id in partitions.user_ids}
 
     print("\n" + "#"*60)
     print("      Full Analysis Complete. Final User Reports:")
@@ -110,5 +334,136 @@ def run_full_analysis_for_multiple_users():
         print(report)
         print("--- End of Report ---\n")
 
+    cache = get_response_cache()
+    if cache is not None:
+        stats = cache.stats()
+        print(f"LLM response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries stored.")
+    print(format_llm_call_metrics())
+
+    if recorder is not None:
+        if recorder.path:
+            print(f"Node metrics written to {recorder.path} (run {recorder.run_id}).")
+        if print_metrics:
+            recorder.print_summary()
+
+def run_incremental_analysis(input_path: str, store_dir: str = INCREMENTAL_STORE_DIR, metrics_path: Optional[str] = None,
+                             print_metrics: bool = False):
+    """
+    Merges input_path into the incremental store (the first run ingests the full
+    history, later runs a daily delta) and re-runs the graph only for users with
+    new transactions. Rows already ingested are skipped by txn_id/utr, and only
+    the touched users' cached LLM responses are invalidated. Every other user's
+    last report is kept as is, except for users deferred by an earlier run
+    while the LLM service was unavailable, which are recomputed. So are the
+    users of an earlier run that stopped before saving its results.
+    """
+    print("--- Incremental Multi-User Financial Analysis ---")
+
+    delta_df = load_transactions(input_path, use_cache=False)
+    if delta_df is None: return
+
+    store = IncrementalStore(store_dir)
+    # Users whose rows an earlier run ingested without saving their results
+    interrupted = store.load_pending()
+    new_rows, n_duplicates, touched = ingest_delta(store, delta_df)
+    print(f"Ingested {len(new_rows)} new transactions ({n_duplicates} duplicates skipped) "
+          f"for {len(touched)} users.")
+    if interrupted:
+        print(f"Resuming {len(interrupted)} users whose last run stopped before its results were saved.")
+        touched = merge_touched(interrupted, touched)
+    results = store.load_results()
+    # Users deferred by an earlier run (LLM service unavailable) are recomputed as well
+    for user_id, result in results.items():
+        if result.get("deferred"):
+            touched.setdefault(user_id, result["updated_months"])
+    if not touched:
+        print("No new transactions; all reports are up to date.")
+        return
+
+    cache = get_response_cache()
+    if cache is not None:
+        removed = cache.invalidate_scopes(touched)
+        print(f"Invalidated {removed} cached LLM responses for the touched users.")
+
+    # Only the touched cube cells are updated, and only the touched users' history is read back
+    cube = update_cube(store, new_rows, rebuild=bool(interrupted))
+    history = ensure_normalized(store.load_users(touched))
+    analyses = {str(user_id): analysis for user_id, analysis in analyze_all_users_with_pandas(history).items()}
+    if metrics_path or print_metrics:
+        recorder = NodeMetricsRecorder(metrics_path, dataset_rows=len(history))
+    else:
+        recorder = metrics_recorder_from_env(dataset_rows=len(history))
+    app = build_full_workflow(recorder=recorder)
+    profiles = batched_profiles(analyses)
+
+    history_key = f"incremental:{os.path.abspath(store_dir)}"
+    partition_store.register(history_key, partition_by_user(history), cube)
+
+    def analyze_user(partition_user_id):
+        handle = partition_store.handle(history_key, partition_user_id)
+        user_id = str(partition_user_id)
+        print(f"Recomputing User ID: {user_id} (new data in {', '.join(touched[user_id])})")
+        with llm_cache_scope(user_id):
+            final_state = app.invoke(build_initial_state(user_id, handle, analyses, profiles))
+        return {
+            "final_report": final_state.get('final_report', 'Error generating report.'),
+            "pandas_analysis": final_state.get('pandas_analysis', {}),
+            "transactions": handle["rows"],
+            "updated_months": touched[user_id],
+        }
+
+    user_ids = partition_store.partitions(history_key).user_ids
+    recomputed, deferred = run_deferring_unavailable(user_ids, analyze_user)
+    for partition_user_id in user_ids:
+        user_id = str(partition_user_id)
+        if partition_user_id in recomputed:
+            results[user_id] = recomputed[partition_user_id]
+        else:
+            results[user_id] = {
+                "final_report": DEFERRED_REPORT,
+                "pandas_analysis": analyses.get(user_id, {}),
+                "transactions": partition_store.handle(history_key, partition_user_id)["rows"],
+                "updated_months": touched[user_id],
+                "deferred": True,
+            }
+    partition_store.release(history_key)
+    store.save_results(results)
+    store.clear_pending()
+
+    print("\n" + "#"*60)
+    print(f"      Incremental Analysis Complete: {len(touched)} of {len(results)} users recomputed.")
+    print("#"*60 + "\n")
+    for user_id in touched:
+        print(f"--- Personalized Report for User ID: {user_id} ---")
+        print(results[user_id]["final_report"])
+        print("--- End of Report ---\n")
+
+    if deferred:
+        print(f"{len(deferred)} users were deferred; the next incremental run recomputes them.")
+    print(format_llm_call_metrics())
+
+    if recorder is not None and print_metrics:
+        recorder.print_summary()
+
 if __name__ == "__main__":
-    run_full_analysis_for_multiple_users()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the full multi-user financial analysis.")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="Run all users' LLM stages concurrently (AsyncOpenAI + shared rate limiter)")
+    parser.add_argument("--metrics", metavar="PATH", help="Append per-node metrics to this JSON lines file")
+    parser.add_argument("--metrics-summary", action="store_true", help="Print a per-node metrics table at the end")
+    parser.add_argument("--input", default="sample_data/upi_transactions.xlsx", help="Transactions file (.xlsx, .xls or .csv)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Ingest a large CSV in chunks into per-user shards instead of loading it whole")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Merge --input into the incremental store and recompute only users with new transactions")
+    parser.add_argument("--store", default=INCREMENTAL_STORE_DIR, help="Directory of the incremental store")
+    parser.add_argument("--checkpoint", metavar="PATH", default=GRAPH_CHECKPOINT_PATH,
+                        help="SQLite file for per-user graph checkpoints; rerun with the same input to resume")
+    args = parser.parse_args()
+    if args.incremental:
+        run_incremental_analysis(args.input, store_dir=args.store, metrics_path=args.metrics,
+                                 print_metrics=args.metrics_summary)
+    else:
+        run_full_analysis_for_multiple_users(async_mode=args.async_mode, metrics_path=args.metrics,
+                                             print_metrics=args.metrics_summary, input_path=args.input,
+                                             stream=args.stream, checkpoint_path=args.checkpoint)
@@ -1,85 +1,139 @@
-from langgraph.graph import StateGraph, END
+import pandas as pd
 from utils.state_manager import FinancialAnalysisState
-from utils.data_loader import load_transactions
-from agent.profile_builder import analyze_transactions_with_pandas, generate_profile_from_analysis
+from utils.data_loader import load_transactions, apply_schema, dataset_fingerprint
+from utils.partitioning import partition_by_user
+from utils.partition_store import partition_store, state_transactions
+from utils.normalization import ensure_normalized
+from agent.profile_builder import analyze_transactions_with_pandas, analyze_all_users_with_pandas, generate_profile_from_analysis
+from agent.profile_builder import PROFILE_BATCH_SIZE, generate_profiles_batched
+from utils.instrumentation import instrument, metrics_recorder_from_env
+from utils.llm_cache import llm_cache_scope
+from utils.llm_resilience import run_deferring_unavailable
 
 # --- Define Graph Nodes for a SINGLE USER analysis ---
 
 def pandas_analysis_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     """Node 1: Performs quantitative analysis for the user."""
     print(f"--- User {state['user_id']} | Node: Pandas Analysis ---")
-    analysis_results = analyze_transactions_with_pandas(state['transactions_df'])
+    if state.get('pandas_analysis') is not None:
+        return {}  # Precomputed for all users by analyze_all_users_with_pandas
+    analysis_results = analyze_transactions_with_pandas(state_transactions(state))
     return {"pandas_analysis": analysis_results}
 
 def profile_llm_node(state: FinancialAnalysisState) -> FinancialAnalysisState:
     """Node 2: Generates qualitative insights for the user."""
     print(f"--- User {state['user_id']} | Node: LLM Profile ---")
+    if state.get('profile_summary') is not None:
+        return {}  # Precomputed in a batched request by generate_profiles_batched
     profile = generate_profile_from_analysis(state['pandas_analysis'])
     return {"profile_summary": profile}
 
 # --- Reusable Analysis Functions ---
 
-def build_workflow():
-    """Build and return the reusable LangGraph workflow app."""
+def build_workflow(recorder=None):
+    """
+    Build and return the reusable LangGraph workflow app.
+    If a NodeMetricsRecorder is given, each node is instrumented with it.
+    """
+    from langgraph.graph import StateGraph, END  # Deferred: langgraph adds ~0.2 s to app start
+
     workflow = StateGraph(FinancialAnalysisState)
-    workflow.add_node("pandas_analysis", pandas_analysis_node)
-    workflow.add_node("profile_llm", profile_llm_node)
+    workflow.add_node("pandas_analysis", instrument("pandas_analysis", pandas_analysis_node, recorder))
+    workflow.add_node("profile_llm", instrument("profile_llm", profile_llm_node, recorder))
     workflow.set_entry_point("pandas_analysis")
     workflow.add_edge("pandas_analysis", "profile_llm")
     workflow.add_edge("profile_llm", END)
     return workflow.compile()
 
-def analyze_single_user(app, user_id, user_df):
-    """Analyze a single user and return the results."""
-    if user_df.empty:
+def analyze_single_user(app, user_id, transactions_ref, pandas_analysis=None, profile_summary=None):
+    """
+    Analyze a single user and return the results. The user's rows are passed as
+    a partition store handle. Precomputed results skip their nodes.
+    """
+    if not transactions_ref["rows"]:
         return {"profile_summary": "No data available for this user.", "pandas_analysis": {}}
     
     initial_input = {
         "user_id": user_id,
-        "transactions_df": user_df
+        "transactions_ref": transactions_ref
     }
+    if pandas_analysis is not None:
+        initial_input["pandas_analysis"] = pandas_analysis
+    if profile_summary is not None:
+        initial_input["profile_summary"] = profile_summary
     
-    return app.invoke(initial_input)
+    # Responses cached during this run are tagged with the user so they can be invalidated per user
+    with llm_cache_scope(user_id):
+        return app.invoke(initial_input)
 
-def analyze_all_users_data(full_df):
+def analyze_all_users_data(full_df, recorder=None, app=None, dataset_key=None):
     """
     Analyze all users in the dataset and return structured results.
     Returns a dictionary with user_id as key and analysis results as value.
+    Each result refers to the user's rows with a 'transactions_ref' handle into
+    the partition store (registered under dataset_key, by default the data's
+    fingerprint) instead of holding a copy of them.
+    Node metrics go to `recorder`, or to PIPELINE_METRICS_PATH when that is set.
+    A prebuilt `app` (from build_workflow) can be passed in to skip compilation.
     """
     if full_df is None or full_df.empty:
         print("No data to analyze.")
         return {}
     
     # Build the workflow once
-    app = build_workflow()
+    if app is None:
+        recorder = recorder or metrics_recorder_from_env(dataset_rows=len(full_df))
+        app = build_workflow(recorder)
     
-    # Get unique users
-    unique_user_ids = full_df['user_id'].unique()
-    print(f"Found {len(unique_user_ids)} unique users. Beginning analysis for each...")
+    # Normalize once, then partition the dataset by user in a single pass
+    full_df = ensure_normalized(full_df)
+    partitions = partition_by_user(full_df)
+    dataset_key = dataset_key or dataset_fingerprint(full_df)
+    partition_store.register(dataset_key, partitions)
+    print(f"Found {len(partitions)} unique users. Beginning analysis for each...")
     
+    # Pandas analytics for all users in one batch; the graph then only runs the LLM step
+    analyses = analyze_all_users_with_pandas(full_df)
+    # Several users per profile request when batching is on (PROFILE_BATCH_SIZE > 1)
+    profiles = generate_profiles_batched(analyses) if PROFILE_BATCH_SIZE > 1 else {}
     results = {}
     
     # Analyze each user
-    for user_id in unique_user_ids:
+    def analyze_user(user_id):
         print(f"\n" + "="*50)
         print(f"Processing User ID: {user_id}")
         print("="*50)
         
-        # Filter data for current user
-        user_df = full_df[full_df['user_id'] == user_id].copy()
-        
         # Analyze the user
-        final_state = analyze_single_user(app, user_id, user_df)
+        handle = partition_store.handle(dataset_key, user_id)
+        final_state = analyze_single_user(app, user_id, handle, analyses.get(user_id), profiles.get(user_id))
         
         # Store results
-        results[user_id] = {
+        return {
             'profile_summary': final_state.get("profile_summary", "Error generating profile."),
             'pandas_analysis': final_state.get("pandas_analysis", {}),
-            'transactions_df': user_df
+            'transactions_ref': handle
+        }
+    
+    # Users the LLM service could not answer for (see utils/llm_resilience.py) keep their pandas analysis;
+    # the app does not hold the page through the breaker's cooldown to retry them
+    completed, _ = run_deferring_unavailable(partitions.user_ids, analyze_user, retry=False)
+    for user_id in partitions.user_ids:
+        results[user_id] = completed.get(user_id) or {
+            'profile_summary': "Profile deferred: the LLM service is temporarily unavailable. Please try again shortly.",
+            'pandas_analysis': analyses.get(user_id, {}),
+            'transactions_ref': partition_store.handle(dataset_key, user_id)
         }
     
     return results
 
+def user_transactions(user_data: dict) -> pd.DataFrame:
+    """The user's rows behind an analysis result's transactions_ref, or an empty frame without one."""
+    handle = user_data.get('transactions_ref')
+    if handle is None:
+        return pd.DataFrame()
+    return partition_store.transactions(handle)
+
 # --- Main Multi-User Workflow Execution ---
 
 def run_phase_1_for_multiple_users():
@@ -112,20 +166,20 @@ def run_phase_1_for_multiple_users():
         print(user_data['profile_summary'])
         print("--- End of Profile ---\n")
 
-def load_and_analyze_for_streamlit(file_path=None, df=None):
+def load_and_analyze_for_streamlit(file_path=None, df=None, app=None, dataset_key=None):
     """
     Load and analyze data specifically for Streamlit usage.
     Returns the full dataset and analysis results.
     """
     if df is not None:
-        full_df = df
+        full_df = apply_schema(df) if 'user_id' in df.columns else df
     else:
         full_df = load_transactions(file_path)
     
     if full_df is None or full_df.empty:
         return None, {}
     
-    results = analyze_all_users_data(full_df)
+    results = analyze_all_users_data(full_df, app=app, dataset_key=dataset_key)
     return full_df, results
 
 # --- Entry Point ---
@@ -1,22 +1,14 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from main_refactored import load_and_analyze_for_streamlit
-from utils.data_loader import load_transactions
-from agent.budgeting_expert import create_budget_baseline_with_pandas, generate_budget_plan_with_llm
-import os
-import numpy as np
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak, Image
-from reportlab.lib.units import inch
+from main_refactored import load_and_analyze_for_streamlit, user_transactions, build_workflow
+from utils.data_loader import load_transactions, dataset_fingerprint
+from agent.budgeting_expert import create_budget_baseline_with_pandas, stream_budget_plan_with_llm
+from utils.normalization import ensure_normalized
+from utils.partitioning import partition_by_user
+from utils.partition_store import partition_store
+from utils.aggregate_cube import AggregateCube, debit_cells, load_or_build_cube
+from utils.llm_cache import llm_cache_scope
 from datetime import datetime
-import base64
-import io
-import tempfile
 
 # Page configuration
 st.set_page_config(
@@ -79,47 +71,122 @@ if 'processed_data' not in st.session_state:
     st.session_state.processed_data = None
 if 'budget_plans' not in st.session_state:
     st.session_state.budget_plans = {}
+if 'dataset_hash' not in st.session_state:
+    st.session_state.dataset_hash = None
+if 'pdf_job_key' not in st.session_state:
+    st.session_state.pdf_job_key = None
+
+# --- Caching ---
+# Derived results are keyed by (dataset hash, user_id). Arguments starting with "_"
+# are not hashed by Streamlit, so the DataFrames themselves never have to be.
+ANALYSIS_CACHE_MAX_ENTRIES = 4     # Whole-dataset analyses kept in memory
+USER_CACHE_MAX_ENTRIES = 256       # Per-user chart sets and budget baselines
+
+@st.cache_resource(show_spinner=False)
+def get_analysis_workflow():
+    """The compiled LangGraph app, built once per server process."""
+    return build_workflow()
+
+@st.cache_resource(max_entries=ANALYSIS_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_analysis(dataset_hash, _df):
+    """Runs the multi-user analysis once per distinct dataset. Results are shared read-only."""
+    return load_and_analyze_for_streamlit(df=_df, app=get_analysis_workflow(), dataset_key=dataset_hash)
+
+@st.cache_resource(max_entries=ANALYSIS_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_aggregate_cube(dataset_hash, _df):
+    """Monthly aggregate cube for the whole dataset (persisted under .cache/aggregates)."""
+    return load_or_build_cube(_df, dataset_hash)
+
+def ensure_partitions_registered():
+    """
+    Results refer to users' rows by partition store handles. The store keeps a
+    few datasets only, so the session's dataset is partitioned again if it was released.
+    """
+    dataset_hash = st.session_state.dataset_hash
+    if dataset_hash is not None and dataset_hash not in partition_store and st.session_state.processed_data is not None:
+        partition_store.register(dataset_hash, partition_by_user(ensure_normalized(st.session_state.processed_data)))
+
+def user_cube_cells(user_id):
+    """The selected dataset's cube cells for one user."""
+    cube = cached_aggregate_cube(st.session_state.dataset_hash, st.session_state.processed_data)
+    return cube.for_user(user_id)
+
+@st.cache_data(max_entries=USER_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_user_charts(dataset_hash, user_id, _user_data, _cube_cells):
+    """Builds all Plotly figures for one user of one dataset."""
+    transactions_df = user_transactions(_user_data)
+    return {
+        'spending': create_spending_chart(_user_data, _cube_cells),
+        'merchant': create_merchant_chart(transactions_df),
+        'budget': create_budget_visualization(_user_data, _cube_cells),
+        'timeline': create_transaction_timeline(transactions_df),
+    }
+
+@st.cache_data(max_entries=USER_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_budget_baseline(dataset_hash, user_id, _transactions_df, _cube_cells):
+    return create_budget_baseline_with_pandas(_transactions_df, _cube_cells)
+
+@st.cache_resource(show_spinner=False)
+def get_pdf_worker():
+    """Background PDF builder shared by all sessions; keeps recently finished reports for reuse."""
+    from utils.report_generator import PdfReportWorker  # reportlab is only loaded once a report is requested
+    return PdfReportWorker()
+
+@st.cache_data(max_entries=ANALYSIS_CACHE_MAX_ENTRIES, show_spinner=False)
+def cached_comparison_chart(dataset_hash, _comparison_df):
+    import plotly.express as px
+    return px.bar(_comparison_df, x='User', y='Total Spending',
+                  title="Total Spending Comparison Across Users")
 
 def load_and_analyze_data(file_path=None, uploaded_file=None):
-    """Load and analyze transaction data using the refactored functions"""
+    """
+    Load and analyze transaction data using the refactored functions.
+    Returns (data, results, dataset_hash); repeated analyses of the same data are served from cache.
+    """
     try:
         if uploaded_file is not None:
             # Handle uploaded file
             df = pd.read_excel(uploaded_file)
-            return load_and_analyze_for_streamlit(df=df)
         else:
             # Use default file
-            return load_and_analyze_for_streamlit(file_path)
+            df = load_transactions(file_path)
+        if df is None:
+            return None, None, None
+        dataset_hash = dataset_fingerprint(df)
+        data, results = cached_analysis(dataset_hash, df)
+        return data, results, dataset_hash
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
-        return None, None
+        return None, None, None
 
 def generate_budget_for_user(user_id, user_data):
-    """Generate budget plan for a specific user"""
+    """
+    Generate budget plan for a specific user. Returns {'baseline', 'plan'} where
+    plan is a stream of text pieces (render it with st.write_stream inside the
+    user's llm_cache_scope), or a message string when no plan can be made.
+    """
     try:
-        transactions_df = user_data.get('transactions_df', pd.DataFrame())
+        transactions_df = user_transactions(user_data)
         profile_summary = user_data.get('profile_summary', '')
         
         if transactions_df.empty:
             return "No transaction data available for budget planning."
         
-        # Create budget baseline
-        baseline = create_budget_baseline_with_pandas(transactions_df)
+        # Create budget baseline (cached per dataset and user)
+        baseline = cached_budget_baseline(st.session_state.dataset_hash, user_id, transactions_df, user_cube_cells(user_id))
         
         if 'summary' in baseline:
             return baseline['summary']
         
-        # Generate budget plan with LLM
-        budget_plan = generate_budget_plan_with_llm(baseline, profile_summary)
-        
+        # Generate budget plan with LLM (the request starts when the stream is first read)
         return {
             'baseline': baseline,
-            'plan': budget_plan
+            'plan': stream_budget_plan_with_llm(baseline, profile_summary)
         }
     except Exception as e:
         return f"Error generating budget plan: {str(e)}"
 
-def create_spending_chart(user_data):
+def create_spending_chart(user_data, cube_cells=None):
     """Create spending breakdown chart"""
     analysis = user_data.get('pandas_analysis', {})
     
@@ -133,19 +200,23 @@ def create_spending_chart(user_data):
             category_data.append({'Category': category, 'Amount': amount})
     
     if not category_data:
-        # Fallback: create category data from transactions
-        transactions_df = user_data.get('transactions_df', pd.DataFrame())
-        if not transactions_df.empty and 'category' in transactions_df.columns:
-            category_spending = transactions_df.groupby('category')['amount'].sum()
-            for category, amount in category_spending.items():
-                category_data.append({'Category': category, 'Amount': amount})
+        # Fallback: category totals from the aggregate cube, or from the transactions without one
+        transactions_df = user_transactions(user_data)
+        category_spending = pd.Series(dtype=float)
+        if cube_cells is not None and not cube_cells.empty:
+            category_spending = cube_cells.groupby('category', observed=True)['amount_sum'].sum()
+        elif not transactions_df.empty and 'category' in transactions_df.columns:
+            category_spending = transactions_df.groupby('category', observed=True)['amount'].sum()
+        for category, amount in category_spending.items():
+            category_data.append({'Category': category, 'Amount': amount})
     
     if not category_data:
         return None
         
     df_categories = pd.DataFrame(category_data)
     
-    # Create pie chart
+    # Create pie chart (plotly is imported by the chart functions, not at app start)
+    import plotly.express as px
     fig = px.pie(df_categories, values='Amount', names='Category', 
                  title="💰 Spending by Category",
                  color_discrete_sequence=px.colors.qualitative.Set3)
@@ -153,33 +224,23 @@ def create_spending_chart(user_data):
     fig.update_layout(showlegend=True)
     return fig
 
-def create_budget_visualization(user_data):
+def create_budget_visualization(user_data, cube_cells=None):
     """Create budget vs actual spending chart"""
-    transactions_df = user_data.get('transactions_df', pd.DataFrame())
+    transactions_df = user_transactions(user_data)
     
     if transactions_df.empty:
         return None
     
     try:
-        # Categorize spending into Needs vs Wants
-        def map_category(cat):
-            cat = str(cat).lower()
-            if any(c in cat for c in ['groceries', 'utilities', 'rent', 'transport', 'bills', 'emi', 'health']):
-                return 'Needs'
-            elif any(c in cat for c in ['shopping', 'food', 'travel', 'entertainment', 'recharge', 'lifestyle', 'subscription']):
-                return 'Wants'
-            else:
-                return 'Other'
-        
-        # Filter debit transactions
-        debit_df = transactions_df[transactions_df['direction'].str.strip().str.lower() == 'debit'].copy()
-        if debit_df.empty:
+        # Needs vs Wants buckets come from the aggregate cube (same keyword table as the budget agent)
+        if cube_cells is None:
+            cube_cells = AggregateCube.build(ensure_normalized(transactions_df)).frame
+        debit_cube = debit_cells(cube_cells)
+        if debit_cube.empty:
             return None
-            
-        debit_df['budget_category'] = debit_df['category'].apply(map_category)
         
         # Calculate actual spending
-        actual_spending = debit_df.groupby('budget_category')['amount'].sum()
+        actual_spending = debit_cube.groupby('budget_bucket', observed=True)['amount_sum'].sum()
         total_spending = actual_spending.sum()
         
         # Suggested budget (50/30/20 rule)
@@ -196,6 +257,7 @@ def create_budget_visualization(user_data):
         ]
         suggested = [suggested_needs, suggested_wants, suggested_savings]
         
+        import plotly.graph_objects as go
         fig = go.Figure(data=[
             go.Bar(name='Actual Spending', x=categories, y=actual, marker_color='lightcoral'),
             go.Bar(name='Suggested Budget', x=categories, y=suggested, marker_color='lightblue')
@@ -233,6 +295,7 @@ def create_transaction_timeline(transactions_df):
             daily_spending = df_copy.groupby(df_copy[date_col].dt.date)['amount'].sum().reset_index()
             daily_spending.columns = ['Date', 'Amount']
             
+            import plotly.express as px
             fig = px.line(daily_spending, x='Date', y='Amount',
                          title="📈 Daily Spending Trend",
                          markers=True)
@@ -258,11 +321,12 @@ def create_merchant_chart(transactions_df):
     if transactions_df.empty or merchant_col is None:
         return None
         
-    merchant_spending = transactions_df.groupby(merchant_col)['amount'].sum().sort_values(ascending=False).head(10)
+    merchant_spending = transactions_df.groupby(merchant_col, observed=True)['amount'].sum().sort_values(ascending=False).head(10)
     
     if merchant_spending.empty:
         return None
     
+    import plotly.express as px
     fig = px.bar(
         x=merchant_spending.values, 
         y=merchant_spending.index, 
@@ -278,203 +342,34 @@ def create_merchant_chart(transactions_df):
     )
     return fig
 
-def generate_pdf_report(results, processed_data, budget_plans):
-    """Generate a comprehensive PDF report including budget planning"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Custom styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        spaceAfter=30,
-        textColor=colors.HexColor('#1f77b4'),
-        alignment=1  # Center alignment
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=16,
-        spaceAfter=12,
-        textColor=colors.HexColor('#2c3e50'),
-        leftIndent=0
-    )
-    
-    # Title page
-    story.append(Paragraph("💰 Financial Analysis & Budget Planning Report", title_style))
-    story.append(Spacer(1, 20))
-    story.append(Paragraph(f"Generated on: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Executive Summary
-    story.append(Paragraph("📊 Executive Summary", heading_style))
-    
-    total_users = len(results)
-    total_transactions = len(processed_data) if processed_data is not None else 0
-    total_spending = sum([r.get('pandas_analysis', {}).get('total_spending', 0) for r in results.values()])
-    avg_spending = total_spending / total_users if total_users > 0 else 0
-    
-    summary_data = [
-        ['Metric', 'Value'],
-        ['Total Users Analyzed', f"{total_users}"],
-        ['Total Transactions', f"{total_transactions:,}"],
-        ['Total Spending', f"₹{total_spending:,.2f}"],
-        ['Average Spending per User', f"₹{avg_spending:,.2f}"]
-    ]
-    
-    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f77b4')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    story.append(summary_table)
-    story.append(Spacer(1, 20))
-    
-    # Individual User Analysis with Budget Planning
-    for user_id, user_data in results.items():
-        story.append(PageBreak())
-        story.append(Paragraph(f"👤 User Analysis: {user_id}", heading_style))
-        
-        analysis = user_data.get('pandas_analysis', {})
-        profile = user_data.get('profile_summary', 'No profile available')
-        
-        # User metrics table
-        if analysis:
-            user_metrics = [
-                ['Metric', 'Value'],
-                ['Total Spending', f"₹{analysis.get('total_spending', 0):,.2f}"],
-                ['Total Transactions', f"{analysis.get('total_transactions', 0):,}"],
-                ['Average Transaction', f"₹{analysis.get('average_transaction_amount', 0):.2f}"],
-                ['Unique Merchants', f"{analysis.get('unique_merchants', 0)}"]
-            ]
-            
-            user_table = Table(user_metrics, colWidths=[2.5*inch, 2.5*inch])
-            user_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            
-            story.append(user_table)
-            story.append(Spacer(1, 15))
-        
-        # AI-Generated Insights
-        story.append(Paragraph("🤖 AI-Generated Financial Insights", styles['Heading3']))
-        
-        # Clean and format the profile text
-        profile_lines = profile.split('\n')
-        for line in profile_lines:
-            if line.strip():
-                # Remove markdown-style formatting for PDF
-                clean_line = line.replace('**', '').strip()
-                if clean_line:
-                    story.append(Paragraph(clean_line, styles['Normal']))
-                    story.append(Spacer(1, 6))
-        
-        story.append(Spacer(1, 15))
-        
-        # Budget Planning Section
-        if user_id in budget_plans:
-            story.append(Paragraph("💡 Personalized Budget Plan", styles['Heading3']))
-            budget_data = budget_plans[user_id]
-            
-            if isinstance(budget_data, dict) and 'plan' in budget_data:
-                budget_lines = budget_data['plan'].split('\n')
-                for line in budget_lines:
-                    if line.strip():
-                        clean_line = line.replace('**', '').replace('###', '').strip()
-                        if clean_line:
-                            story.append(Paragraph(clean_line, styles['Normal']))
-                            story.append(Spacer(1, 6))
-            
-            story.append(Spacer(1, 15))
-        
-        # Category spending breakdown
-        if 'category_spending' in analysis:
-            story.append(Paragraph("💰 Spending by Category", styles['Heading3']))
-            
-            category_data = [['Category', 'Amount', 'Percentage']]
-            total_cat_spending = sum(analysis['category_spending'].values())
-            
-            for category, amount in sorted(analysis['category_spending'].items(), key=lambda x: x[1], reverse=True):
-                percentage = (amount / total_cat_spending * 100) if total_cat_spending > 0 else 0
-                category_data.append([
-                    category,
-                    f"₹{amount:,.2f}",
-                    f"{percentage:.1f}%"
-                ])
-            
-            category_table = Table(category_data, colWidths=[2*inch, 1.5*inch, 1.5*inch])
-            category_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.lightgoldenrodyellow),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            
-            story.append(category_table)
-            story.append(Spacer(1, 20))
-    
-    # Comparison section if multiple users
-    if len(results) > 1:
-        story.append(PageBreak())
-        story.append(Paragraph("📊 User Comparison", heading_style))
-        
-        comparison_data = [['User', 'Total Spending', 'Transactions', 'Avg Transaction', 'Unique Merchants']]
-        for user_id, data in results.items():
-            analysis = data.get('pandas_analysis', {})
-            comparison_data.append([
-                user_id,
-                f"₹{analysis.get('total_spending', 0):,.2f}",
-                f"{analysis.get('total_transactions', 0):,}",
-                f"₹{analysis.get('average_transaction_amount', 0):.2f}",
-                f"{analysis.get('unique_merchants', 0)}"
-            ])
-        
-        comparison_table = Table(comparison_data, colWidths=[1.2*inch, 1.3*inch, 1*inch, 1.2*inch, 1.3*inch])
-        comparison_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e74c3c')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.lavender),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 8)
-        ]))
-        
-        story.append(comparison_table)
-    
-    # Footer
-    story.append(Spacer(1, 30))
-    story.append(Paragraph("Report generated by Financial Agent - Transaction Analyzer & Budget Planner", styles['Italic']))
-    
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+def pdf_report_panel():
+    """Shows the report job's result, or a progress bar that polls until the job finishes."""
+    job = get_pdf_worker().get(st.session_state.pdf_job_key)
+    if job is None:
+        return
+    if not job.finished:
+        pdf_progress_fragment()
+    elif job.status == "failed":
+        st.error(f"❌ Error generating PDF report: {job.error}")
+        st.info("💡 Make sure all required packages are installed. Run: pip install reportlab kaleido")
+    else:
+        # A finished report is reused for the same data and plans, so name it after its build time
+        st.download_button(
+            label="💾 Click to Download Complete Report",
+            data=job.result,
+            file_name=f"Financial_Analysis_Budget_Report_{job.generated_at.strftime('%Y%m%d_%H%M%S')}.pdf",
+            mime="application/pdf",
+            help="Click to download your comprehensive financial analysis and budget planning report"
+        )
+        st.success(f"✅ Complete PDF report generated successfully on {job.generated_at.strftime('%B %d, %Y at %I:%M %p')}!")
+
+@st.fragment(run_every=1.0)
+def pdf_progress_fragment():
+    # Only this fragment reruns while the PDF is built; one full rerun swaps in the download button.
+    job = get_pdf_worker().get(st.session_state.pdf_job_key)
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress, text=f"Generating PDF report... {job.message}")
 
 def display_user_analysis(user_id, user_data):
     """Display comprehensive analysis for a user including budget planning"""
@@ -488,7 +383,7 @@ def display_user_analysis(user_id, user_data):
     col1, col2, col3, col4 = st.columns(4)
     
     analysis = user_data.get('pandas_analysis', {})
-    transactions_df = user_data.get('transactions_df', pd.DataFrame())
+    transactions_df = user_transactions(user_data)
     
     if analysis:
         with col1:
@@ -507,26 +402,27 @@ def display_user_analysis(user_id, user_data):
             unique_merchants = analysis.get('unique_merchants', 0)
             st.metric("Unique Merchants", f"{unique_merchants}")
     
-    # Charts section
+    # Charts section (built once per dataset and user, then served from cache on reruns)
+    charts = cached_user_charts(st.session_state.dataset_hash, user_id, user_data, user_cube_cells(user_id))
     chart_col1, chart_col2 = st.columns(2)
     
     with chart_col1:
-        spending_chart = create_spending_chart(user_data)
+        spending_chart = charts['spending']
         if spending_chart:
             st.plotly_chart(spending_chart, use_container_width=True)
     
     with chart_col2:
-        merchant_chart = create_merchant_chart(transactions_df)
+        merchant_chart = charts['merchant']
         if merchant_chart:
             st.plotly_chart(merchant_chart, use_container_width=True)
     
     # Budget Analysis Chart
-    budget_chart = create_budget_visualization(user_data)
+    budget_chart = charts['budget']
     if budget_chart:
         st.plotly_chart(budget_chart, use_container_width=True)
     
     # Timeline chart
-    timeline_chart = create_transaction_timeline(transactions_df)
+    timeline_chart = charts['timeline']
     if timeline_chart:
         st.plotly_chart(timeline_chart, use_container_width=True)
     
@@ -538,14 +434,13 @@ def display_user_analysis(user_id, user_data):
     """, unsafe_allow_html=True)
     
     # Generate budget plan button
+    budget_data = st.session_state.budget_plans.get(user_id)
     if st.button(f"📊 Generate Budget Plan for {user_id}", key=f"budget_{user_id}"):
         with st.spinner("Creating personalized budget plan..."):
-            budget_plan = generate_budget_for_user(user_id, user_data)
-            st.session_state.budget_plans[user_id] = budget_plan
+            budget_data = generate_budget_for_user(user_id, user_data)
     
     # Display budget plan if available
-    if user_id in st.session_state.budget_plans:
-        budget_data = st.session_state.budget_plans[user_id]
+    if budget_data is not None:
         
         if isinstance(budget_data, dict) and 'plan' in budget_data:
             st.markdown("""
@@ -565,11 +460,17 @@ def display_user_analysis(user_id, user_data):
             
             # Display AI-generated budget plan
             st.markdown("### 🤖 AI-Generated Budget Recommendations")
-            st.markdown(budget_data['plan'])
+            if isinstance(budget_data['plan'], str):
+                st.markdown(budget_data['plan'])
+            else:
+                # Rendered as it is generated; the finished text is kept for reruns and the PDF report
+                with llm_cache_scope(user_id):
+                    budget_data = {**budget_data, 'plan': st.write_stream(budget_data['plan'])}
             
             st.markdown("</div>", unsafe_allow_html=True)
         else:
             st.warning(f"Budget planning: {budget_data}")
+        st.session_state.budget_plans[user_id] = budget_data
     
     # AI-Generated Profile
     st.subheader("🤖 AI-Generated Financial Insights")
@@ -640,9 +541,9 @@ def main():
     if st.sidebar.button("🔍 Analyze Transactions", type="primary"):
         with st.spinner("Loading and analyzing transaction data..."):
             if use_sample_data and not uploaded_file:
-                data, results = load_and_analyze_data("sample_data/upi_transactions.xlsx")
+                data, results, dataset_hash = load_and_analyze_data("sample_data/upi_transactions.xlsx")
             elif uploaded_file:
-                data, results = load_and_analyze_data(uploaded_file=uploaded_file)
+                data, results, dataset_hash = load_and_analyze_data(uploaded_file=uploaded_file)
             else:
                 st.error("Please upload a file or use sample data")
                 return
@@ -650,12 +551,14 @@ def main():
             if results:
                 st.session_state.analysis_results = results
                 st.session_state.processed_data = data
+                st.session_state.dataset_hash = dataset_hash
                 st.session_state.budget_plans = {}  # Reset budget plans
                 st.success(f"✅ Analysis complete! Found {len(results)} users with {len(data)} total transactions.")
     
     # Display results
     if st.session_state.analysis_results:
         results = st.session_state.analysis_results
+        ensure_partitions_registered()
         
         # Overview metrics
         st.subheader("📈 Overview")
@@ -680,22 +583,12 @@ def main():
         col_download, col_spacer = st.columns([2, 4])
         with col_download:
             if st.button("📄 Download Complete Report", type="primary", help="Generate and download a comprehensive financial analysis report with budget planning"):
-                with st.spinner("Generating comprehensive PDF report..."):
-                    try:
-                        pdf_buffer = generate_pdf_report(results, st.session_state.processed_data, st.session_state.budget_plans)
-                        
-                        # Create download button
-                        st.download_button(
-                            label="💾 Click to Download Complete Report",
-                            data=pdf_buffer,
-                            file_name=f"Financial_Analysis_Budget_Report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                            mime="application/pdf",
-                            help="Click to download your comprehensive financial analysis and budget planning report"
-                        )
-                        st.success("✅ Complete PDF report generated successfully!")
-                    except Exception as e:
-                        st.error(f"❌ Error generating PDF report: {str(e)}")
-                        st.info("💡 Make sure all required packages are installed. Run: pip install reportlab kaleido")
+                from utils.report_generator import report_cache_key
+                key = report_cache_key(st.session_state.dataset_hash, st.session_state.budget_plans)
+                get_pdf_worker().submit(key, results, st.session_state.processed_data, st.session_state.budget_plans)
+                st.session_state.pdf_job_key = key
+            if st.session_state.pdf_job_key:
+                pdf_report_panel()
         
         st.markdown("---")
         
@@ -729,8 +622,7 @@ def main():
             comparison_df = pd.DataFrame(comparison_data)
             
             # Comparison chart
-            fig = px.bar(comparison_df, x='User', y='Total Spending', 
-                        title="Total Spending Comparison Across Users")
+            fig = cached_comparison_chart(st.session_state.dataset_hash, comparison_df)
             st.plotly_chart(fig, use_container_width=True)
             
             # Comparison table
@@ -3,7 +3,7 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from main_refactored import load_and_analyze_for_streamlit
+from main_refactored import load_and_analyze_for_streamlit, user_transactions
 from utils.data_loader import load_transactions
 import os
 import numpy as np
@@ -92,9 +92,9 @@ def create_spending_chart(user_data):
     
     if not category_data:
         # Fallback: create category data from transactions
-        transactions_df = user_data.get('transactions_df', pd.DataFrame())
+        transactions_df = user_transactions(user_data)
         if not transactions_df.empty and 'category' in transactions_df.columns:
-            category_spending = transactions_df.groupby('category')['amount'].sum()
+            category_spending = transactions_df.groupby('category', observed=True)['amount'].sum()
             for category, amount in category_spending.items():
                 category_data.append({'Category': category, 'Amount': amount})
     
@@ -157,7 +157,7 @@ def create_merchant_chart(transactions_df):
     if transactions_df.empty or merchant_col is None:
         return None
         
-    merchant_spending = transactions_df.groupby(merchant_col)['amount'].sum().sort_values(ascending=False).head(10)
+    merchant_spending = transactions_df.groupby(merchant_col, observed=True)['amount'].sum().sort_values(ascending=False).head(10)
     
     if merchant_spending.empty:
         return None
@@ -371,7 +371,7 @@ def display_user_analysis(user_id, user_data):
     col1, col2, col3, col4 = st.columns(4)
     
     analysis = user_data.get('pandas_analysis', {})
-    transactions_df = user_data.get('transactions_df', pd.DataFrame())
+    transactions_df = user_transactions(user_data)
     
     if analysis:
         with col1:
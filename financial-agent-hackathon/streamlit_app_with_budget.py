@@ -3,9 +3,10 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from main_refactored import load_and_analyze_for_streamlit
+from main_refactored import load_and_analyze_for_streamlit, user_transactions
 from utils.data_loader import load_transactions
 from agent.budgeting_expert import create_budget_baseline_with_pandas, generate_budget_plan_with_llm
+from utils.budget_categories import map_budget_buckets
 import os
 import numpy as np
 from reportlab.lib.pagesizes import letter, A4
@@ -97,7 +98,7 @@ def load_and_analyze_data(file_path=None, uploaded_file=None):
 def generate_budget_for_user(user_id, user_data):
     """Generate budget plan for a specific user"""
     try:
-        transactions_df = user_data.get('transactions_df', pd.DataFrame())
+        transactions_df = user_transactions(user_data)
         profile_summary = user_data.get('profile_summary', '')
         
         if transactions_df.empty:
@@ -134,9 +135,9 @@ def create_spending_chart(user_data):
     
     if not category_data:
         # Fallback: create category data from transactions
-        transactions_df = user_data.get('transactions_df', pd.DataFrame())
+        transactions_df = user_transactions(user_data)
         if not transactions_df.empty and 'category' in transactions_df.columns:
-            category_spending = transactions_df.groupby('category')['amount'].sum()
+            category_spending = transactions_df.groupby('category', observed=True)['amount'].sum()
             for category, amount in category_spending.items():
                 category_data.append({'Category': category, 'Amount': amount})
     
@@ -155,31 +156,22 @@ def create_spending_chart(user_data):
 
 def create_budget_visualization(user_data):
     """Create budget vs actual spending chart"""
-    transactions_df = user_data.get('transactions_df', pd.DataFrame())
+    transactions_df = user_transactions(user_data)
     
     if transactions_df.empty:
         return None
     
     try:
-        # Categorize spending into Needs vs Wants
-        def map_category(cat):
-            cat = str(cat).lower()
-            if any(c in cat for c in ['groceries', 'utilities', 'rent', 'transport', 'bills', 'emi', 'health']):
-                return 'Needs'
-            elif any(c in cat for c in ['shopping', 'food', 'travel', 'entertainment', 'recharge', 'lifestyle', 'subscription']):
-                return 'Wants'
-            else:
-                return 'Other'
-        
         # Filter debit transactions
         debit_df = transactions_df[transactions_df['direction'].str.strip().str.lower() == 'debit'].copy()
         if debit_df.empty:
             return None
             
-        debit_df['budget_category'] = debit_df['category'].apply(map_category)
+        # Categorize spending into Needs vs Wants (shared keyword table, see utils/budget_categories.py)
+        debit_df['budget_category'] = map_budget_buckets(debit_df['category'])
         
         # Calculate actual spending
-        actual_spending = debit_df.groupby('budget_category')['amount'].sum()
+        actual_spending = debit_df.groupby('budget_category', observed=True)['amount'].sum()
         total_spending = actual_spending.sum()
         
         # Suggested budget (50/30/20 rule)
@@ -258,7 +250,7 @@ def create_merchant_chart(transactions_df):
     if transactions_df.empty or merchant_col is None:
         return None
         
-    merchant_spending = transactions_df.groupby(merchant_col)['amount'].sum().sort_values(ascending=False).head(10)
+    merchant_spending = transactions_df.groupby(merchant_col, observed=True)['amount'].sum().sort_values(ascending=False).head(10)
     
     if merchant_spending.empty:
         return None
@@ -488,7 +480,7 @@ def display_user_analysis(user_id, user_data):
     col1, col2, col3, col4 = st.columns(4)
     
     analysis = user_data.get('pandas_analysis', {})
-    transactions_df = user_data.get('transactions_df', pd.DataFrame())
+    transactions_df = user_transactions(user_data)
     
     if analysis:
         with col1:
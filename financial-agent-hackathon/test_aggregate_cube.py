@@ -0,0 +1,98 @@
+"""
+Tests for incremental updates of the monthly aggregate cube (utils/aggregate_cube.py)
+"""
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from agent.budgeting_expert import create_budget_baseline_with_pandas
+from agent.trend_analyzer import analyze_trends_with_pandas
+from utils.aggregate_cube import CUBE_DIMENSIONS, AggregateCube, amount_moments, debit_cells, monthly_totals
+from utils.data_loader import load_transactions
+from utils.normalization import ensure_normalized
+
+@pytest.fixture(scope="module")
+def sample_df():
+    return ensure_normalized(load_transactions("sample_data/upi_transactions.xlsx", use_cache=False))
+
+def comparable(cube: AggregateCube) -> pd.DataFrame:
+    """The cube's cells in a fixed order, dimensions as strings, so differently built cubes compare equal."""
+    frame = cube.frame.assign(**{col: cube.frame[col].astype(str) for col in CUBE_DIMENSIONS + ['budget_bucket']})
+    return frame.sort_values(CUBE_DIMENSIONS).reset_index(drop=True)
+
+def build_in_steps(df: pd.DataFrame, steps: int) -> AggregateCube:
+    chunks = np.array_split(np.arange(len(df)), steps)
+    cube = AggregateCube.build(df.iloc[chunks[0]])
+    for chunk in chunks[1:]:
+        cube = cube.update(df.iloc[chunk])
+    return cube
+
+@pytest.mark.parametrize("steps", [2, 7, 20])
+def test_updates_match_a_fresh_build(sample_df, steps):
+    full = AggregateCube.build(sample_df)
+    updated = build_in_steps(sample_df, steps)
+    pd.testing.assert_frame_equal(comparable(updated), comparable(full))
+
+def test_budget_baseline_does_not_drift_with_updates(sample_df):
+    full = AggregateCube.build(sample_df)
+    updated = build_in_steps(sample_df, 7)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id, user_df in sample_df.groupby('user_id', observed=True):
+            assert create_budget_baseline_with_pandas(user_df, updated.for_user(user_id)) == \
+                create_budget_baseline_with_pandas(user_df, full.for_user(user_id))
+            assert amount_moments(debit_cells(updated.for_user(user_id))) == \
+                amount_moments(debit_cells(full.for_user(user_id)))
+
+def test_update_adds_new_users_and_categories(sample_df):
+    cube = AggregateCube.build(sample_df)
+    new_rows = sample_df.iloc[:2].copy()
+    new_rows['user_id'] = "USER_NEW"
+    new_rows['category'] = "groceries"
+    new_rows['amount'] = [10.25, 4.75]
+
+    updated = cube.update(new_rows)
+    cells = updated.for_user("USER_NEW")
+    assert len(updated.frame) == len(cube.frame) + len(cells)
+    assert cells['amount_sum'].sum() == 15.0
+    assert cells['amount_count'].sum() == 2
+    assert set(cells['budget_bucket'].astype(str)) == {"Needs"}
+    assert cube.frame['amount_count'].sum() == len(sample_df)  # The original cube is left as it was
+
+def test_update_after_save_and_load(sample_df, tmp_path):
+    path = str(tmp_path / "cube.arrow")
+    assert AggregateCube.build(sample_df.iloc[:500]).save(path)
+    updated = AggregateCube.load(path).update(sample_df.iloc[500:])
+    pd.testing.assert_frame_equal(comparable(updated), comparable(AggregateCube.build(sample_df)))
+
+def test_rows_without_category_or_month_are_kept(sample_df):
+    dirty = sample_df.copy()
+    dirty['category'] = dirty['category'].astype(object)
+    dirty.loc[dirty.index[::9], 'category'] = np.nan
+    dirty.loc[dirty.index[::13], 'timestamp'] = pd.NaT
+    dirty = ensure_normalized(dirty.drop(columns=['month', 'signed_amount', 'is_debit', 'budget_bucket']))
+
+    cube = AggregateCube.build(dirty)
+    assert cube.frame['amount_sum'].sum() == pytest.approx(dirty['amount'].sum())
+    assert cube.frame['amount_count'].sum() == len(dirty)
+
+    debits = dirty[dirty['is_debit']]
+    expected = debits.groupby('month')['amount'].sum().round(2)
+    pd.testing.assert_series_equal(monthly_totals(debit_cells(cube.frame)), expected, check_names=False)
+    expected = debits.groupby(['month', 'budget_bucket'], observed=True)['amount'].sum().round(2)
+    pd.testing.assert_series_equal(monthly_totals(debit_cells(cube.frame), by='budget_bucket'), expected, check_names=False)
+
+    # Folding the dirty rows in step by step gives the same cells, missing values included
+    pd.testing.assert_frame_equal(comparable(build_in_steps(dirty, 7)), comparable(cube))
+
+    # The trend agent's month-on-month change still counts spending without a category
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id, user_df in list(dirty.groupby('user_id', observed=True))[:5]:
+            user_debits = user_df[user_df['is_debit']].groupby('month')['amount'].sum()
+            if len(user_debits) < 2:
+                continue
+            last, prev = user_debits.iloc[-1], user_debits.iloc[-2]
+            analysis = analyze_trends_with_pandas(user_df, cube.for_user(user_id))
+            assert analysis['total_spend_change_pct'] == f"{(last - prev) / prev * 100:.2f}%"
@@ -0,0 +1,75 @@
+"""
+Tests for the batch CLI's per-user report files and resume (batch_runner.py)
+"""
+import os
+
+import pytest
+
+import batch_runner
+from utils.data_loader import load_transactions
+
+SAMPLE_PATH = "sample_data/upi_transactions.xlsx"
+
+@pytest.fixture(scope="module")
+def sample_user_ids():
+    return [str(user_id) for user_id in load_transactions(SAMPLE_PATH, use_cache=False)['user_id'].unique()]
+
+def reported_users(output_dir: str) -> set:
+    return {name[:-3] for name in os.listdir(output_dir) if name.endswith(".md")}
+
+def test_write_report_replaces_files_atomically(tmp_path):
+    batch_runner.write_report(str(tmp_path), "USER/001", "first")
+    batch_runner.write_report(str(tmp_path), "USER/001", "second")
+    assert os.listdir(tmp_path) == [os.path.basename(batch_runner.report_path(str(tmp_path), "USER/001"))]  # No temporary files left
+    with open(batch_runner.report_path(str(tmp_path), "USER/001"), encoding="utf-8") as f:
+        assert f.read() == "second"
+
+def test_report_paths_keep_sanitized_ids_apart(tmp_path):
+    assert batch_runner.report_path(str(tmp_path), "USER_001") == str(tmp_path / "USER_001.md")
+    paths = {batch_runner.report_path(str(tmp_path), user_id) for user_id in ["a_b", "a/b", "a b", "a:b"]}
+    assert len(paths) == 4
+
+@pytest.mark.parametrize("n_users, workers", [(20, 1), (100, 2), (1000, 4), (5, 8)])
+def test_shards_are_whole_profile_batches(n_users, workers):
+    user_ids = [f"USER_{i}" for i in range(n_users)]
+    shards = batch_runner._shards(user_ids, workers)
+    assert [user_id for shard in shards for user_id in shard] == user_ids
+    assert all(len(shard) % batch_runner.PROFILE_BATCH_SIZE == 0 for shard in shards[:-1])
+    assert len(shards) <= max(1, workers * batch_runner.SHARDS_PER_WORKER)
+
+def test_rerun_only_analyzes_users_without_a_report(tmp_path, sample_user_ids):
+    output_dir = str(tmp_path / "reports")
+    summary = batch_runner.run_batch(SAMPLE_PATH, output_dir, workers=1)
+    assert summary["completed"] == len(sample_user_ids) and summary["skipped"] == 0
+    assert reported_users(output_dir) == set(sample_user_ids)
+
+    os.remove(batch_runner.report_path(output_dir, sample_user_ids[0]))
+    summary = batch_runner.run_batch(SAMPLE_PATH, output_dir, workers=1)
+    assert summary["completed"] == 1 and summary["skipped"] == len(sample_user_ids) - 1
+
+    summary = batch_runner.run_batch(SAMPLE_PATH, output_dir, workers=1, resume=False)
+    assert summary["completed"] == len(sample_user_ids) and summary["skipped"] == 0
+
+@pytest.mark.parametrize("async_mode", [False, True])
+def test_reports_are_written_as_each_user_finishes(tmp_path, monkeypatch, sample_user_ids, async_mode):
+    output_dir = str(tmp_path / "reports")
+    write_report = batch_runner.write_report
+    written = []
+
+    def fail_on_second_report(directory, user_id, report):
+        if len(written) == 1:
+            raise OSError("disk full")
+        write_report(directory, user_id, report)
+        written.append(user_id)
+
+    # One shard, so the failure hits the shard after its first user finished
+    monkeypatch.setattr(batch_runner, "_shards", lambda user_ids, workers: [list(user_ids)])
+    monkeypatch.setattr(batch_runner, "write_report", fail_on_second_report)
+    summary = batch_runner.run_batch(SAMPLE_PATH, output_dir, workers=1, async_mode=async_mode)
+    assert summary["completed"] == 1 and summary["failed"] == len(sample_user_ids) - 1
+    assert reported_users(output_dir) == set(written)
+
+    monkeypatch.setattr(batch_runner, "write_report", write_report)
+    summary = batch_runner.run_batch(SAMPLE_PATH, output_dir, workers=1, async_mode=async_mode)
+    assert summary["skipped"] == 1 and summary["completed"] == len(sample_user_ids) - 1
+    assert reported_users(output_dir) == set(sample_user_ids)
@@ -0,0 +1,86 @@
+"""
+Tests for the incremental store: txn_id/utr dedup and resuming interrupted runs (utils/incremental.py)
+"""
+import pandas as pd
+import pytest
+
+import main
+from utils.data_loader import load_transactions
+from utils.incremental import IncrementalStore, deduplicate_delta, ingest_delta, merge_touched
+
+SAMPLE_PATH = "sample_data/upi_transactions.xlsx"
+
+@pytest.fixture(scope="module")
+def sample_df():
+    return load_transactions(SAMPLE_PATH, use_cache=False)
+
+def split_sample(sample_df, tmp_path, delta_rows: int = 30) -> tuple[str, str]:
+    """Writes the sample as a history file plus a delta of its last rows; returns both paths."""
+    base_path, delta_path = tmp_path / "base.csv", tmp_path / "delta.csv"
+    sample_df.iloc[:-delta_rows].to_csv(base_path, index=False)
+    sample_df.iloc[-delta_rows:].to_csv(delta_path, index=False)
+    return str(base_path), str(delta_path)
+
+def test_deduplicate_delta_matches_txn_id_or_utr():
+    delta = pd.DataFrame({
+        "txn_id": ["T1", "T2", "T3", "T4", "T4", None],
+        "utr": [100.0, 200.0, 300.0, 400.0, 500.0, 300.0],
+    })
+    existing = {"txn_id": {"T1"}, "utr": {"200"}}  # Stored as strings; the float utr must still match
+
+    new_rows, n_duplicates = deduplicate_delta(delta, existing)
+    # T1 and utr 200 were ingested, the second T4 and the last row's utr repeat earlier delta rows
+    assert list(new_rows["txn_id"]) == ["T3", "T4"]
+    assert n_duplicates == 4
+
+def test_deduplicate_delta_without_keys_keeps_every_row():
+    delta = pd.DataFrame({"amount": [1.0, 1.0]})
+    new_rows, n_duplicates = deduplicate_delta(delta, {})
+    assert len(new_rows) == 2 and n_duplicates == 0
+
+def test_ingest_delta_skips_rows_already_in_the_store(sample_df, tmp_path):
+    store = IncrementalStore(str(tmp_path / "store"))
+    new_rows, n_duplicates, touched = ingest_delta(store, sample_df)
+    assert len(new_rows) == len(sample_df) and n_duplicates == 0
+    assert set(touched) == set(sample_df["user_id"].astype(str))
+
+    new_rows, n_duplicates, touched = ingest_delta(store, sample_df.iloc[-10:])
+    assert new_rows.empty and n_duplicates == 10 and touched == {}
+    assert len(store.load_users()) == len(sample_df)
+
+def test_ingest_delta_records_pending_users_until_cleared(sample_df, tmp_path):
+    store = IncrementalStore(str(tmp_path / "store"))
+    _, _, touched = ingest_delta(store, sample_df.iloc[:100])
+    assert store.load_pending() == touched
+
+    _, _, more = ingest_delta(store, sample_df.iloc[100:200])
+    assert store.load_pending() == merge_touched(touched, more)
+    store.clear_pending()
+    assert store.load_pending() == {}
+
+def test_interrupted_run_is_finished_by_the_next_one(sample_df, tmp_path, monkeypatch):
+    base_path, delta_path = split_sample(sample_df, tmp_path)
+    store_dir = str(tmp_path / "store")
+    main.run_incremental_analysis(base_path, store_dir=store_dir)
+    store = IncrementalStore(store_dir)
+    first_results = store.load_results()
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("killed during recompute")
+
+    with monkeypatch.context() as patched:
+        patched.setattr(main, "run_deferring_unavailable", crash)
+        with pytest.raises(RuntimeError):
+            main.run_incremental_analysis(delta_path, store_dir=store_dir)
+    delta_users = set(sample_df.iloc[-30:]["user_id"].astype(str))
+    assert set(store.load_pending()) == delta_users
+    assert store.load_results() == first_results  # Nothing saved for the interrupted run
+
+    # The rerun ingests nothing new but still recomputes the interrupted users
+    main.run_incremental_analysis(delta_path, store_dir=store_dir)
+    assert store.load_pending() == {}
+    results = store.load_results()
+    for user_id in delta_users:
+        assert results[user_id]["transactions"] == int((sample_df["user_id"].astype(str) == user_id).sum())
+        assert results[user_id]["updated_months"] != first_results[user_id]["updated_months"] or \
+            results[user_id]["transactions"] > first_results[user_id]["transactions"]
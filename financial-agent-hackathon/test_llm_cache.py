@@ -0,0 +1,72 @@
+"""
+Tests for the LLM response cache's per-user scopes (utils/llm_cache.py)
+"""
+import asyncio
+
+import pytest
+
+from agent.profile_builder import generate_profiles_batched
+from utils import llm_cache
+from utils.llm_cache import LLMResponseCache, llm_cache_scope
+from utils.llm_client import achat_completion
+
+ANALYSIS = {"total_debit": "1,000.00", "top_spending_categories": "food | 600.00",
+            "top_merchants_by_frequency": "Zomato | 4"}
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(str(tmp_path / "llm.sqlite"))
+
+def test_invalidating_one_scope_keeps_other_users_entries(cache):
+    with llm_cache_scope("USER_001"):
+        cache.set("k1", "gpt-4o", "profile 1")
+    cache.set("k2", "gpt-4o", "profile 2", scope="USER_002")
+
+    assert cache.invalidate_scopes(["USER_001"]) == 1
+    assert cache.get("k1") is None
+    assert cache.get("k2") == "profile 2"
+
+def test_shared_entries_keep_every_scope(cache):
+    with llm_cache_scope(["USER_001", "USER_002"]):
+        cache.set("batch", "gpt-4o", "profiles")
+    with llm_cache_scope("USER_003"):
+        cache.set("batch", "gpt-4o", "profiles")  # Re-storing adds a scope instead of replacing them
+
+    assert cache.invalidate_scopes(["USER_002"]) == 1
+    assert cache.get("batch") is None
+
+def test_removed_entries_drop_their_scopes(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite"), max_entries=2)
+    for i in range(4):
+        cache.set(f"k{i}", "gpt-4o", "response", scope=f"USER_{i}")
+    assert cache.stats()["entries"] == 2
+    assert cache._conn.execute("SELECT COUNT(*) FROM response_scopes").fetchone()[0] == 2
+
+def test_batched_profiles_are_cached_under_every_batch_user(cache, monkeypatch, offline_llm):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", cache)
+    analyses = {"USER_001": ANALYSIS, "USER_002": ANALYSIS}
+
+    assert set(generate_profiles_batched(analyses, batch_size=2)) == set(analyses)
+    assert offline_llm.calls == 1
+    scopes = {row[0] for row in cache._conn.execute("SELECT scope FROM response_scopes")}
+    assert scopes == {"USER_001", "USER_002"}
+
+    # A new transaction for either user drops the shared response, so the batch is asked again
+    cache.invalidate_scopes(["USER_002"])
+    generate_profiles_batched(analyses, batch_size=2)
+    assert offline_llm.calls == 2
+
+def test_async_completions_are_cached_under_the_current_scope(cache, monkeypatch, offline_llm):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", cache)
+    messages = [{"role": "user", "content": "Summarize my spending."}]
+
+    async def run():
+        with llm_cache_scope("USER_001"):
+            first = await achat_completion(messages, temperature=0, max_tokens=50)
+        return first, await achat_completion(messages, temperature=0, max_tokens=50)
+
+    first, second = asyncio.run(run())
+    assert first == second and offline_llm.calls == 1
+    assert cache.invalidate_scopes(["USER_001"]) == 1
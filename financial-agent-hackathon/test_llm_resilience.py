@@ -0,0 +1,192 @@
+"""
+Tests for the LLM retry, timeout and circuit breaker wrappers (utils/llm_resilience.py)
+"""
+import asyncio
+import time
+
+import pytest
+
+from utils import llm_resilience
+from utils.llm_backends import FakeBackend, rate_limit_error, set_backend, timeout_error
+from utils.llm_client import chat_completion
+from utils.llm_resilience import (CircuitBreaker, CircuitOpenError, LLMUnavailableError, acall_with_retries,
+                                  arun_deferring_unavailable, backoff_delay_s, call_with_retries,
+                                  retry_after_s, run_deferring_unavailable)
+
+MESSAGES = [{"role": "user", "content": "Summarize my spending."}]
+
+def failing_then(result, errors: list):
+    """A request that raises the given errors one per call, then returns result; calls are counted."""
+    calls = []
+
+    def request(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return request, calls
+
+def test_circuit_breaker_opens_and_recovers():
+    """Opens once enough recent attempts failed, rejects calls while open, and closes after a successful probe"""
+    breaker = CircuitBreaker(window=4, min_calls=4, failure_rate=0.5, cooldown_s=0.05)
+    for outcome in (False, True, False):
+        breaker.record(outcome)
+    assert breaker.state == "closed"  # Too few attempts to judge
+
+    breaker.record(False)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == "half-open"
+    breaker.record(True)
+    assert breaker.state == "closed"
+
+def test_circuit_breaker_reopens_when_the_probe_fails():
+    breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, cooldown_s=0.05)
+    breaker.record(False)
+    breaker.record(False)
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.remaining_open_s() > 0
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, cooldown_s=0.05)
+    breaker.record(False)
+    breaker.record(False)
+    time.sleep(0.06)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Everyone else waits for the probe's outcome
+    breaker.release_probe()  # The probe ended without a verdict, e.g. a bad request
+    breaker.before_call()
+    breaker.record(True)
+    assert breaker.state == "closed"
+    breaker.before_call()
+    breaker.before_call()
+
+def test_concurrent_calls_after_the_cooldown_send_a_single_probe(monkeypatch):
+    breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, cooldown_s=0.05)
+    monkeypatch.setattr(llm_resilience, "_breaker", breaker)
+    breaker.record(False)
+    breaker.record(False)
+    time.sleep(0.06)
+    sent = []
+
+    async def request(timeout):
+        sent.append(timeout)
+        await asyncio.sleep(0.02)
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*(acall_with_retries(request) for _ in range(5)), return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert len(sent) == 1
+    assert outcomes.count("ok") == 1
+    assert sum(isinstance(outcome, CircuitOpenError) for outcome in outcomes) == 4
+    assert breaker.state == "closed"
+
+def test_non_transient_error_during_the_probe_releases_it(monkeypatch):
+    breaker = CircuitBreaker(window=2, min_calls=2, failure_rate=1.0, cooldown_s=0.05)
+    monkeypatch.setattr(llm_resilience, "_breaker", breaker)
+    breaker.record(False)
+    breaker.record(False)
+    time.sleep(0.06)
+    request, calls = failing_then("ok", [ValueError("bad request")])
+    with pytest.raises(ValueError):
+        call_with_retries(request)
+    assert call_with_retries(request) == "ok"
+    assert breaker.state == "closed"
+
+def test_retry_after_header_sets_the_backoff():
+    error = rate_limit_error(retry_after=2.5)
+    assert retry_after_s(error) == 2.5
+    assert 2.5 <= backoff_delay_s(0, error) <= 2.75
+    assert retry_after_s(timeout_error()) is None
+
+def test_call_with_retries_waits_for_retry_after(monkeypatch):
+    waits = []
+    monkeypatch.setattr(llm_resilience.time, "sleep", waits.append)
+    request, calls = failing_then("ok", [rate_limit_error(retry_after=1.5), timeout_error()])
+
+    assert call_with_retries(request, max_retries=3, timeout_s=7) == "ok"
+    assert calls == [7, 7, 7]  # Every attempt gets the per-request timeout
+    assert 1.5 <= waits[0] <= 1.65
+    assert llm_resilience.llm_call_metrics()["breaker_state"] == "closed"
+
+def test_call_with_retries_gives_up_as_unavailable():
+    request, calls = failing_then("ok", [timeout_error()] * 5)
+    with pytest.raises(LLMUnavailableError):
+        call_with_retries(request, max_retries=2)
+    assert len(calls) == 3
+
+def test_non_transient_errors_are_not_retried():
+    request, calls = failing_then("ok", [ValueError("bad request")])
+    with pytest.raises(ValueError):
+        call_with_retries(request)
+    assert len(calls) == 1
+
+def test_acall_with_retries_retries_rate_limits():
+    attempts = []
+
+    async def request(timeout):
+        attempts.append(timeout)
+        if len(attempts) == 1:
+            raise rate_limit_error(retry_after=0)
+        return "ok"
+
+    assert asyncio.run(acall_with_retries(request)) == "ok"
+    assert len(attempts) == 2
+
+def test_chat_completion_retries_fake_backend_rate_limits():
+    backend = FakeBackend(rate_limit_every=2, retry_after_s=0, response_text="plan")
+    set_backend(backend)
+    assert [chat_completion(MESSAGES, temperature=0, max_tokens=50) for _ in range(3)] == ["plan"] * 3
+    # Calls 2 and 4 are rate-limited and retried
+    assert backend.rate_limited == 2
+    assert backend.calls == 5
+
+def test_open_breaker_fails_fast_without_calling_the_backend(offline_llm):
+    for _ in range(llm_resilience.LLM_BREAKER_MIN_CALLS):
+        llm_resilience.get_circuit_breaker().record(False)
+    with pytest.raises(CircuitOpenError):
+        chat_completion(MESSAGES, temperature=0, max_tokens=50)
+    assert offline_llm.calls == 0
+
+def test_unavailable_users_are_deferred_and_retried():
+    failures = {"USER_002": 1, "USER_003": 2}
+
+    def analyze_user(user_id):
+        if failures.get(user_id, 0) > 0:
+            failures[user_id] -= 1
+            raise LLMUnavailableError("service down")
+        return f"report for {user_id}"
+
+    results, deferred = run_deferring_unavailable(["USER_001", "USER_002", "USER_003"], analyze_user)
+    assert results == {"USER_001": "report for USER_001", "USER_002": "report for USER_002"}
+    assert deferred == ["USER_003"]
+
+def test_deferral_without_retry_leaves_users_for_the_next_run():
+    def analyze_user(user_id):
+        raise LLMUnavailableError("service down")
+
+    assert run_deferring_unavailable(["USER_001"], analyze_user, retry=False) == ({}, ["USER_001"])
+
+def test_async_deferral_retries_each_user_once():
+    attempts = {}
+
+    async def analyze_user(user_id):
+        attempts[user_id] = attempts.get(user_id, 0) + 1
+        if user_id == "USER_002" and attempts[user_id] == 1:
+            raise LLMUnavailableError("service down")
+        return user_id
+
+    results, deferred = asyncio.run(arun_deferring_unavailable(["USER_001", "USER_002"], analyze_user))
+    assert results == {"USER_001": "USER_001", "USER_002": "USER_002"}
+    assert deferred == []
+    assert attempts == {"USER_001": 1, "USER_002": 2}
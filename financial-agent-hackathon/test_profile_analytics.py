@@ -0,0 +1,43 @@
+"""
+Tests for the single-user and all-users pandas profile analytics (agent/profile_builder.py)
+"""
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from agent.profile_builder import analyze_all_users_with_pandas, analyze_transactions_with_pandas
+from utils.data_loader import load_transactions
+from utils.normalization import ensure_normalized
+from utils.partitioning import partition_by_user
+
+@pytest.fixture(scope="module")
+def sample_df():
+    return ensure_normalized(load_transactions("sample_data/upi_transactions.xlsx", use_cache=False))
+
+def test_batch_analysis_matches_the_single_user_analysis(sample_df):
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch = analyze_all_users_with_pandas(sample_df)
+        single = {user_id: analyze_transactions_with_pandas(user_df)
+                  for user_id, user_df in partition_by_user(sample_df).items()}
+    assert list(batch) == list(single)
+    for user_id, analysis in single.items():
+        assert batch[user_id] == analysis, user_id
+
+def test_totals_are_rounded_to_paise():
+    df = pd.DataFrame({
+        "user_id": ["USER_001"] * 3,
+        "timestamp": ["2024-01-01", "2024-01-02", "2024-01-03"],
+        "amount": [0.1, 0.2, 100.004],
+        "direction": ["debit"] * 3,
+        "category": ["food", "food", "rent"],
+        "merchant_name": ["Zomato", "Zomato", "Landlord"],
+    })
+    with contextlib.redirect_stdout(io.StringIO()):
+        analysis = analyze_transactions_with_pandas(df)
+        batch = analyze_all_users_with_pandas(df)["USER_001"]
+    assert analysis["total_spending"] == 100.3  # Not the raw sum 100.304
+    assert analysis["average_transaction_amount"] == 100.3 / 3
+    assert analysis["total_debit"] == "100.30"
+    assert batch["total_spending"] == analysis["total_spending"]
@@ -0,0 +1,102 @@
+"""
+Tests for batched profile generation and its fallback to single requests (agent/profile_builder.py)
+"""
+import asyncio
+import json
+
+import pytest
+
+from agent.profile_builder import (PROFILE_BATCH_SCHEMA, agenerate_profiles_batched, build_batch_profile_messages,
+                                   generate_profiles_batched, parse_batch_profiles)
+from utils import llm_cache
+from utils.llm_backends import FakeBackend, make_response, set_backend
+from utils.llm_cache import LLMResponseCache
+
+ANALYSIS = {"total_debit": "1,000.00", "top_spending_categories": "food | 600.00",
+            "top_merchants_by_frequency": "Zomato | 4"}
+USER_IDS = ["USER_001", "USER_002", "USER_003"]
+
+class BrokenBatchBackend(FakeBackend):
+    """Answers batched requests with `batch_content`; single requests as usual."""
+
+    def __init__(self, batch_content: str):
+        super().__init__(response_text="single profile")
+        self.batch_content = batch_content
+        self.batch_calls = 0
+
+    def _respond(self, messages, model, max_tokens, limited, response_format=None):
+        if response_format is None:
+            return super()._respond(messages, model, max_tokens, limited)
+        self.batch_calls += 1
+        return make_response(self.batch_content, 10, 10, model)
+
+def test_parse_batch_profiles_keeps_known_users_with_a_profile():
+    content = json.dumps({"profiles": [
+        {"user_id": "USER_001", "profile": " Spends on food. "},
+        {"user_id": "USER_002", "profile": ""},
+        {"user_id": "USER_999", "profile": "Not in this batch"},
+        {"user_id": "USER_001", "profile": "Duplicate"},
+        "not an entry",
+    ]})
+    assert parse_batch_profiles(content, USER_IDS) == {"USER_001": "Spends on food."}
+
+@pytest.mark.parametrize("content", ["not json", "[]", json.dumps({"profiles": "none"}), None])
+def test_parse_batch_profiles_rejects_malformed_responses(content):
+    assert parse_batch_profiles(content, USER_IDS) == {}
+
+def test_fake_backend_answers_the_batch_schema():
+    messages = build_batch_profile_messages({user_id: ANALYSIS for user_id in USER_IDS})
+    response = FakeBackend().complete(messages, "gpt-4o", 0.4, 500, response_format=PROFILE_BATCH_SCHEMA)
+    profiles = parse_batch_profiles(response.choices[0].message.content, USER_IDS)
+    assert list(profiles) == USER_IDS
+
+def test_one_request_per_batch(offline_llm):
+    analyses = {f"USER_{i:03d}": ANALYSIS for i in range(5)}
+    profiles = generate_profiles_batched(analyses, batch_size=2)
+    assert list(profiles) == list(analyses)
+    assert offline_llm.calls == 3  # Batches of 2, 2 and 1 (a batch of one is a single request)
+
+def test_async_batches_match_sync_batches(offline_llm):
+    analyses = {user_id: ANALYSIS for user_id in USER_IDS}
+    assert asyncio.run(agenerate_profiles_batched(analyses, batch_size=3)) == \
+        generate_profiles_batched(analyses, batch_size=3)
+
+@pytest.mark.parametrize("batch_content, single_calls", [
+    ("not json", 3),  # Unparseable: every user gets a single request
+    (json.dumps({"profiles": [{"user_id": "USER_001", "profile": "batched"}]}), 2),  # Only the missing users
+])
+def test_bad_batch_responses_fall_back_to_single_requests(batch_content, single_calls):
+    backend = BrokenBatchBackend(batch_content)
+    set_backend(backend)
+    analyses = {user_id: ANALYSIS for user_id in USER_IDS}
+
+    profiles = generate_profiles_batched(analyses, batch_size=3)
+    assert list(profiles) == USER_IDS
+    assert backend.batch_calls == 1
+    assert backend.calls - backend.batch_calls == single_calls
+    assert list(profiles.values()).count("single profile") == single_calls
+
+def test_users_without_spending_need_no_request(offline_llm):
+    analyses = {"USER_001": ANALYSIS, "USER_002": {"summary": "No spending."}}
+    profiles = generate_profiles_batched(analyses, batch_size=2)
+    assert profiles["USER_002"] == "No spending."
+    assert offline_llm.calls == 1
+
+@pytest.mark.parametrize("run", [generate_profiles_batched,
+                                 lambda analyses, batch_size: asyncio.run(agenerate_profiles_batched(analyses, batch_size))])
+def test_partial_batch_responses_are_not_replayed_from_the_cache(run, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", LLMResponseCache(str(tmp_path / "llm.sqlite")))
+    backend = BrokenBatchBackend(json.dumps({"profiles": [{"user_id": "USER_001", "profile": "batched"}]}))
+    set_backend(backend)
+    analyses = {user_id: {**ANALYSIS, "total_debit": f"{i},000.00"} for i, user_id in enumerate(USER_IDS, 1)}
+
+    run(analyses, 3)
+    run(analyses, 3)
+    assert backend.batch_calls == 2  # The incomplete batch response was dropped, so the rerun asks again
+    assert backend.calls - backend.batch_calls == 2  # The single requests were cached the first time
+
+    backend.batch_content = json.dumps({"profiles": [{"user_id": u, "profile": "batched"} for u in USER_IDS]})
+    run(analyses, 3)
+    run(analyses, 3)
+    assert backend.batch_calls == 3  # A complete response stays cached
@@ -0,0 +1,125 @@
+"""
+Tests for the async scheduler's token bucket and concurrency limit (utils/llm_client.py)
+"""
+import asyncio
+import time
+
+import pytest
+
+from utils.llm_backends import FakeBackend, set_backend
+from utils.llm_client import AsyncRateLimiter, achat_completion, get_rate_limiter
+from utils.llm_resilience import LLMUnavailableError
+
+MESSAGES = [{"role": "user", "content": "Summarize my spending."}]
+
+class FailingBackend(FakeBackend):
+    """Raises `error` on every async call."""
+
+    def __init__(self, error: Exception):
+        super().__init__()
+        self.error = error
+
+    async def acomplete(self, messages, model, temperature, max_tokens, response_format=None, timeout=None):
+        self.calls += 1
+        raise self.error
+
+class TrackingBackend(FakeBackend):
+    """Records the highest number of concurrent async calls."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.in_flight = self.peak = 0
+
+    async def acomplete(self, *args, **kwargs):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            return await super().acomplete(*args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+def test_reserve_waits_for_the_bucket_to_refill():
+    async def run():
+        limiter = AsyncRateLimiter(max_concurrency=4, tokens_per_minute=6000)  # 100 tokens per second
+        start = time.monotonic()
+        await limiter.reserve(6000)
+        assert time.monotonic() - start < 0.05
+        await limiter.reserve(20)
+        return time.monotonic() - start
+
+    assert 0.15 <= asyncio.run(run()) < 1.0
+
+def test_settle_returns_unused_tokens():
+    async def run():
+        limiter = AsyncRateLimiter(tokens_per_minute=1000)
+        await limiter.reserve(600)
+        limiter.settle(600, 100)
+        return limiter._tokens
+
+    assert asyncio.run(run()) == pytest.approx(900, abs=1)
+
+def test_settle_without_usage_keeps_the_estimate():
+    async def run():
+        limiter = AsyncRateLimiter(tokens_per_minute=1000)
+        await limiter.reserve(600)
+        limiter.settle(600, None)
+        return limiter._tokens
+
+    assert asyncio.run(run()) == pytest.approx(400, abs=1)
+
+def test_oversized_request_settles_the_amount_taken():
+    async def run():
+        limiter = AsyncRateLimiter(tokens_per_minute=1000)
+        reserved = await limiter.reserve(5000)
+        limiter.settle(reserved, 100)
+        return reserved, limiter._tokens
+
+    reserved, tokens = asyncio.run(run())
+    assert reserved == 1000
+    assert tokens == pytest.approx(900, abs=1)
+
+def test_waiting_request_does_not_hold_up_ones_that_fit():
+    async def run():
+        limiter = AsyncRateLimiter(tokens_per_minute=6000)  # 100 tokens per second
+        await limiter.reserve(5000)
+        large = asyncio.create_task(limiter.reserve(3000))  # Waits about 20 s for the refill
+        await asyncio.sleep(0)
+        try:
+            return await asyncio.wait_for(limiter.reserve(500), timeout=0.5)
+        finally:
+            large.cancel()
+
+    assert asyncio.run(run()) == 500
+
+def test_semaphore_bounds_requests_in_flight():
+    backend = TrackingBackend(latency_s=0.02)
+    set_backend(backend)
+
+    async def run():
+        get_rate_limiter().semaphore = asyncio.Semaphore(2)
+        return await asyncio.gather(*(achat_completion([{"role": "user", "content": f"request {i}"}],
+                                                       temperature=0, max_tokens=10) for i in range(6)))
+
+    assert len(asyncio.run(run())) == 6
+    assert backend.peak == 2
+
+@pytest.mark.parametrize("error, raised", [
+    (ValueError("bad request"), ValueError),
+    (TimeoutError("timed out"), LLMUnavailableError),  # Retried, then given up
+])
+def test_failed_attempts_refund_their_reservation(error, raised):
+    backend = FailingBackend(error)
+    set_backend(backend)
+
+    async def run():
+        limiter = get_rate_limiter()
+        before = limiter._tokens
+        with pytest.raises(raised):
+            await achat_completion(MESSAGES, temperature=0, max_tokens=400)
+        limiter._refill()
+        return before, limiter._tokens
+
+    before, after = asyncio.run(run())
+    assert backend.calls >= 1
+    # Without the refund every attempt would keep its estimate out of the bucket
+    assert after >= before - 1e-6
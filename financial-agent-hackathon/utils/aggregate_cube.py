@@ -0,0 +1,200 @@
+import os
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.budget_categories import map_budget_buckets
+from utils.normalization import debit_mask, ensure_normalized
+from utils.partitioning import partition_by_user
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # Without pyarrow the cube is still built, just not persisted.
+    feather = None
+
+# --- Cube Definition ---
+# One row per (user, month, category, direction) cell. The measures are additive
+# (or min/max), so a cell can be updated from new rows without rescanning history,
+# and mean / variance can be derived from count, sum and sum of squares.
+CUBE_DIMENSIONS = ['user_id', 'month', 'category', 'direction']
+CUBE_MEASURES = ['amount_sum', 'amount_count', 'amount_min', 'amount_max', 'amount_sumsq']
+# Amounts are rupees with paise precision. Sums are rounded to that precision (squares to
+# twice it) so a cube updated in steps holds the same values as one built in one pass,
+# whatever order the floats were added in.
+AMOUNT_DECIMALS = 2
+
+AGGREGATE_CACHE_DIR = os.getenv(
+    "AGGREGATE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "aggregates")
+)
+
+def _aggregate(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The single groupby that builds cube cells from (normalized) transactions.
+    Rows with a missing category or month keep their own cells (dropna=False),
+    so cube totals still cover every transaction, as the raw-row totals did.
+    """
+    df = ensure_normalized(df)
+    cells = (
+        df[CUBE_DIMENSIONS]
+        .assign(amount=df['amount'], amount_sq=df['amount'] ** 2)
+        .groupby(CUBE_DIMENSIONS, observed=True, sort=False, dropna=False)
+        .agg(amount_sum=('amount', 'sum'), amount_count=('amount', 'size'),
+             amount_min=('amount', 'min'), amount_max=('amount', 'max'),
+             amount_sumsq=('amount_sq', 'sum'))
+        .reset_index()
+    )
+    return _with_derived_columns(_round_sums(cells))
+
+def _round_sums(cells: pd.DataFrame) -> pd.DataFrame:
+    cells['amount_sum'] = cells['amount_sum'].round(AMOUNT_DECIMALS)
+    cells['amount_sumsq'] = cells['amount_sumsq'].round(2 * AMOUNT_DECIMALS)
+    return cells
+
+def _dimension_codes(cube_col: pd.Series, delta_col: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Integer codes of a dimension, comparable between the cube and a delta: month
+    ordinals, or the delta's category codes remapped onto the cube's categories
+    (-2 for values the cube has not seen). Missing values are -1 (NaT ordinals) on both sides.
+    """
+    if isinstance(cube_col.dtype, pd.PeriodDtype):
+        return cube_col.array.asi8, delta_col.array.asi8
+    cube_col, delta_col = cube_col.astype('category'), delta_col.astype('category')
+    remap = cube_col.cat.categories.astype(str).get_indexer(delta_col.cat.categories.astype(str))
+    # The trailing -1 is read by the delta's missing values (code -1)
+    remap = np.append(np.where(remap < 0, -2, remap), -1)
+    return cube_col.cat.codes.to_numpy(), remap[delta_col.cat.codes.to_numpy()]
+
+def _with_derived_columns(cells: pd.DataFrame) -> pd.DataFrame:
+    # Same debit parsing and Needs/Wants mapping as the shared normalization
+    cells['is_debit'] = debit_mask(cells['direction'])
+    cells['budget_bucket'] = map_budget_buckets(cells['category'])
+    return cells
+
+class AggregateCube:
+    """
+    Materialized monthly aggregates over the transactions: per (user, month,
+    category, direction) the sum, count, min, max and sum of squares of 'amount'.
+
+    The trend and budget agents and the Streamlit charts read a user's slice of
+    the cube (for_user) instead of grouping raw rows. Built with one groupby
+    over the full dataset; update() folds new rows into the touched cells only.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self._partitions = None
+
+    @classmethod
+    def build(cls, df: pd.DataFrame) -> "AggregateCube":
+        return cls(_aggregate(df))
+
+    def for_user(self, user_id: Any) -> pd.DataFrame:
+        """The user's cube cells (an empty frame for unknown users)."""
+        if self._partitions is None:
+            self._partitions = partition_by_user(self.frame)
+        if user_id not in self._partitions and str(user_id) in self._partitions:
+            user_id = str(user_id)
+        return self._partitions.get(user_id)
+
+    def update(self, new_rows: pd.DataFrame) -> "AggregateCube":
+        """
+        Returns the cube with new_rows folded in; cells without new rows are untouched.
+        Only new_rows are grouped: their cells are added into the matching cells of the
+        same users, and cells seen for the first time are appended.
+        """
+        if new_rows.empty:
+            return self
+        delta = _aggregate(new_rows)
+        frame = self.frame.copy()
+
+        codes = [_dimension_codes(frame[col], delta[col]) for col in CUBE_DIMENSIONS]
+        # Existing cells can only match among the delta users' cells
+        candidates = np.flatnonzero(np.isin(codes[0][0], codes[0][1]))
+        cube_keys = pd.MultiIndex.from_arrays([cube_codes[candidates] for cube_codes, _ in codes])
+        positions = cube_keys.get_indexer(pd.MultiIndex.from_arrays([delta_codes for _, delta_codes in codes]))
+        found = positions >= 0
+        rows = candidates[positions[found]]
+        old, new = frame.iloc[rows], delta[found]
+
+        updates = {
+            'amount_sum': (old['amount_sum'].to_numpy() + new['amount_sum'].to_numpy()).round(AMOUNT_DECIMALS),
+            'amount_count': old['amount_count'].to_numpy() + new['amount_count'].to_numpy(),
+            'amount_min': np.minimum(old['amount_min'].to_numpy(), new['amount_min'].to_numpy()),
+            'amount_max': np.maximum(old['amount_max'].to_numpy(), new['amount_max'].to_numpy()),
+            'amount_sumsq': (old['amount_sumsq'].to_numpy() + new['amount_sumsq'].to_numpy()).round(2 * AMOUNT_DECIMALS),
+        }
+        for col, values in updates.items():
+            frame.iloc[rows, frame.columns.get_loc(col)] = values
+
+        added = delta[~found]
+        if not added.empty:
+            frame = pd.concat([frame, added], ignore_index=True)
+            for col in CUBE_DIMENSIONS:
+                if col != 'month' and not isinstance(frame[col].dtype, pd.CategoricalDtype):
+                    frame[col] = frame[col].astype('category')  # The two sides had different categories
+            frame = _with_derived_columns(frame)
+        return AggregateCube(frame)
+
+    # --- Persistence ---
+
+    def save(self, path: str) -> bool:
+        """Writes the cube as Arrow IPC (months stored as month-start timestamps). Returns False without pyarrow."""
+        if feather is None:
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        frame = self.frame.drop(columns=['is_debit', 'budget_bucket'])
+        frame['month'] = frame['month'].dt.to_timestamp()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(frame, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+        return True
+
+    @classmethod
+    def load(cls, path: str) -> Optional["AggregateCube"]:
+        if feather is None or not os.path.exists(path):
+            return None
+        try:
+            frame = feather.read_feather(path)
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable aggregate cube {path}: {e}")
+            return None
+        frame['month'] = frame['month'].dt.to_period('M')
+        # Buckets are re-derived so a changed keyword table applies without a rebuild
+        return cls(_with_derived_columns(frame))
+
+def load_or_build_cube(df: pd.DataFrame, dataset_key: str, cache_dir: str = AGGREGATE_CACHE_DIR) -> AggregateCube:
+    """Returns the persisted cube for dataset_key, building and saving it on first use."""
+    path = os.path.join(cache_dir, f"{dataset_key}.arrow")
+    cube = AggregateCube.load(path)
+    if cube is None:
+        cube = AggregateCube.build(df)
+        cube.save(path)
+    return cube
+
+# --- Queries on a Cube Slice ---
+
+def debit_cells(cells: pd.DataFrame) -> pd.DataFrame:
+    return cells[cells['is_debit']]
+
+def monthly_totals(cells: pd.DataFrame, by: Optional[str] = None) -> pd.Series:
+    """
+    Summed amount per month, or per (month, by) when a second dimension is given.
+    Like a groupby over raw rows, cells without a month (or without a `by` value) are left out.
+    """
+    keys = ['month'] if by is None else ['month', by]
+    return cells.groupby(keys, observed=True)['amount_sum'].sum().round(AMOUNT_DECIMALS)
+
+def amount_moments(cells: pd.DataFrame) -> tuple[float, float]:
+    """Mean and sample standard deviation of the individual amounts behind the cells."""
+    n = cells['amount_count'].sum()
+    if n == 0:
+        return np.nan, np.nan
+    # Rounded like the cells, so the result does not depend on their order
+    total = round(float(cells['amount_sum'].sum()), AMOUNT_DECIMALS)
+    mean = total / n
+    if n < 2:
+        return mean, np.nan
+    variance = (round(float(cells['amount_sumsq'].sum()), 2 * AMOUNT_DECIMALS) - total * total / n) / (n - 1)
+    return mean, float(np.sqrt(max(variance, 0.0)))
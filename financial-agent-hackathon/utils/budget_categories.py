@@ -0,0 +1,65 @@
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# --- Needs vs. Wants Keyword Table ---
+# A category belongs to the first bucket that has a keyword occurring in its
+# lowercased name; anything that matches no keyword is 'Other'. Point the
+# BUDGET_KEYWORDS_FILE environment variable at a JSON file of the same shape
+# ({"Needs": [...], "Wants": [...]}) to override it.
+DEFAULT_BUDGET_KEYWORDS = {
+    'Needs': ['groceries', 'utilities', 'rent', 'transport', 'bills', 'emi', 'health'],
+    'Wants': ['shopping', 'food', 'travel', 'entertainment', 'recharge', 'lifestyle', 'subscription'],
+}
+OTHER_BUCKET = 'Other'
+
+def load_budget_keywords(path: Optional[str] = None) -> dict[str, list[str]]:
+    """Returns the keyword table from `path` or BUDGET_KEYWORDS_FILE, falling back to the defaults."""
+    path = path or os.getenv("BUDGET_KEYWORDS_FILE")
+    if not path:
+        return DEFAULT_BUDGET_KEYWORDS
+    try:
+        with open(path, encoding="utf-8") as f:
+            table = json.load(f)
+        return {bucket: [str(k).lower() for k in keywords] for bucket, keywords in table.items()}
+    except Exception as e:
+        print(f"Warning: Could not read budget keywords from {path} ({e}). Using the defaults.")
+        return DEFAULT_BUDGET_KEYWORDS
+
+BUDGET_KEYWORDS = load_budget_keywords()
+
+def budget_buckets(keywords: Optional[dict] = None) -> list[str]:
+    """All bucket names in table order, with 'Other' last."""
+    keywords = keywords or BUDGET_KEYWORDS
+    return [bucket for bucket in keywords if bucket != OTHER_BUCKET] + [OTHER_BUCKET]
+
+def bucket_for_category(category, keywords: Optional[dict] = None) -> str:
+    """Maps a single category name to its budget bucket."""
+    keywords = keywords or BUDGET_KEYWORDS
+    category = str(category).lower()
+    for bucket, bucket_keywords in keywords.items():
+        if any(k in category for k in bucket_keywords):
+            return bucket
+    return OTHER_BUCKET
+
+def map_budget_buckets(categories: pd.Series, keywords: Optional[dict] = None) -> pd.Series:
+    """
+    Vectorized category -> bucket mapping. The keyword scan runs once per
+    distinct category and the result is broadcast back through integer codes,
+    so the cost no longer grows with the number of rows. Returns a categorical
+    Series aligned with `categories`.
+    """
+    buckets = budget_buckets(keywords)
+    if isinstance(categories.dtype, pd.CategoricalDtype):
+        codes = categories.cat.codes.to_numpy()
+        uniques = categories.cat.categories
+    else:
+        codes, uniques = pd.factorize(categories, sort=False)
+
+    # Missing categories (code -1) read the extra trailing entry, i.e. 'Other'.
+    lookup = np.array([buckets.index(bucket_for_category(c, keywords)) for c in uniques] + [len(buckets) - 1], dtype=np.int8)
+    bucket_codes = lookup[np.where(codes < 0, len(uniques), codes)]
+    return pd.Series(pd.Categorical.from_codes(bucket_codes, categories=buckets), index=categories.index)
@@ -1,35 +1,359 @@
 import pandas as pd
+import hashlib
+import json
 import os
-from typing import Optional
+import shutil
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
 
-def load_transactions(file_path: str) -> Optional[pd.DataFrame]:
+from utils.partitioning import partition_by_user
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # The columnar cache is optional; loading still works without pyarrow.
+    pa = None
+    feather = None
+
+# --- Columnar Cache Settings ---
+# Parsed files are stored as uncompressed Arrow IPC (Feather v2) so warm loads can
+# memory-map them instead of re-parsing the Excel/CSV source.
+CACHE_DIR = os.getenv(
+    "TRANSACTIONS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "transactions")
+)
+# Bump this whenever the parsed frame changes shape so stale cache files are ignored.
+CACHE_FORMAT_VERSION = "2"
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+# --- Streaming Ingestion Settings ---
+# Rows parsed per CSV chunk; peak memory of a streaming load scales with this, not the file size.
+STREAM_CHUNK_ROWS = int(os.getenv("TRANSACTIONS_CHUNK_ROWS", "200000"))
+# Per-user shard files kept open at once; older writers are closed and reopened as a new part.
+MAX_OPEN_SHARDS = int(os.getenv("TRANSACTIONS_MAX_OPEN_SHARDS", "256"))
+_SHARD_MANIFEST = "manifest.json"
+
+# --- Declared Schema for UPI Transaction Columns ---
+# Low-cardinality text columns are stored as categoricals: one small integer code
+# per row instead of a Python string, which also makes groupbys on them cheaper.
+CATEGORICAL_COLUMNS = [
+    'user_id', 'merchant_name', 'transaction_type', 'category', 'currency',
+    'direction', 'status', 'city', 'device_id'
+]
+FLOAT_COLUMNS = ['amount', 'running_balance', 'lat', 'lon']
+DATETIME_COLUMNS = ['timestamp']
+BOOLEAN_COLUMNS = ['is_recurring']
+_TRUE_STRINGS = {'true', '1', 'yes', 'y', 't'}
+
+def _to_boolean(series: pd.Series) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series):
+        return series
+    if pd.api.types.is_numeric_dtype(series):
+        return series.fillna(0).astype(bool)
+    return series.astype(str).str.strip().str.lower().isin(_TRUE_STRINGS)
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the known UPI transaction columns to their declared dtypes:
+    categoricals for low-cardinality text, float64 for amounts and coordinates,
+    datetime64 for timestamps and bool for is_recurring. Columns that are not
+    present are skipped, and unparseable values become NaN/NaT.
     """
-    Loads transaction data from an Excel (.xlsx, .xls) or CSV (.csv) file
-    and performs basic validation.
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in DATETIME_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    for col in BOOLEAN_COLUMNS:
+        if col in df.columns:
+            df[col] = _to_boolean(df[col])
+    return df
+
+def file_content_hash(file_path: str) -> str:
+    """
+    Returns a SHA-256 digest of the file contents (plus the cache format version),
+    used as the key for the columnar cache.
+    """
+    digest = hashlib.sha256(CACHE_FORMAT_VERSION.encode())
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def dataset_fingerprint(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame (column names and values, not the index),
+    used to key caches of results derived from an already loaded dataset.
+    """
+    digest = hashlib.sha256("\x1f".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _cache_path(content_hash: str) -> str:
+    return os.path.join(CACHE_DIR, f"{content_hash}.arrow")
+
+def _read_cached(cache_path: str) -> Optional[pd.DataFrame]:
+    """Memory-maps a cached Arrow IPC file. Returns None if it is missing or unreadable."""
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        table = feather.read_table(cache_path, memory_map=True)
+        return table.to_pandas(split_blocks=True)
+    except Exception as e:
+        print(f"Warning: Ignoring unreadable cache file {cache_path}: {e}")
+        return None
+
+def _write_cache(df: pd.DataFrame, cache_path: str) -> None:
+    """Writes the frame as uncompressed Arrow IPC. The rename keeps readers from seeing partial files."""
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        feather.write_feather(df, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Warning: Could not write transaction cache {cache_path}: {e}")
+
+def _read_source(file_path: str, file_extension: str) -> Optional[pd.DataFrame]:
+    if file_extension in ['.xlsx', '.xls']:
+        return pd.read_excel(file_path)
+    if file_extension == '.csv':
+        return pd.read_csv(file_path)
+    print(f"Error: Unsupported file type '{file_extension}'. Please use an Excel or CSV file.")
+    return None
+
+def load_transactions(file_path: str, use_cache: bool = True) -> Optional[pd.DataFrame]:
+    """
+    Loads transaction data from an Excel (.xlsx, .xls) or CSV (.csv) file,
+    performs basic validation and casts the columns to the declared schema
+    (see apply_schema).
+
+    When pyarrow is installed and use_cache is True, the parsed frame is stored in a
+    columnar cache keyed by the file's content hash, and later loads of the same
+    content memory-map that file instead of parsing the source again.
     """
     try:
         # --- NEW: Check the file extension ---
         _, file_extension = os.path.splitext(file_path)
+        file_extension = file_extension.lower()
+
+        cache_path = None
+        df = None
+        if use_cache and feather is not None and file_extension in ['.xlsx', '.xls', '.csv']:
+            cache_path = _cache_path(file_content_hash(file_path))
+            df = _read_cached(cache_path)
+
+        if df is None:
+            df = _read_source(file_path, file_extension)
+            if df is None:
+                return None
+
+            # Critical check to ensure user_id column exists
+            if 'user_id' not in df.columns:
+                print("Error: The dataset must contain a 'user_id' column.")
+                return None
+
+            df = apply_schema(df)
+
+        if cache_path is not None and not os.path.exists(cache_path):
+            _write_cache(df, cache_path)
 
-        if file_extension.lower() in ['.xlsx', '.xls']:
-            df = pd.read_excel(file_path)
-        elif file_extension.lower() == '.csv':
-            df = pd.read_csv(file_path)
-        else:
-            print(f"Error: Unsupported file type '{file_extension}'. Please use an Excel or CSV file.")
-            return None
-
-        # Critical check to ensure user_id column exists
-        if 'user_id' not in df.columns:
-            print("Error: The dataset must contain a 'user_id' column.")
-            return None
-            
         print(f"Data loaded successfully from {file_path}. Found {len(df)} total transactions.")
         return df
-        
+
     except FileNotFoundError:
         print(f"Error: The file at {file_path} was not found.")
         return None
     except Exception as e:
         print(f"An error occurred while reading the data file: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# --- Streaming Ingestion ---
+
+def iter_transaction_chunks(file_path: str, chunk_rows: int = STREAM_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Reads a CSV export in chunks of chunk_rows rows and yields each chunk cast to
+    the declared schema. Raises ValueError if the first chunk has no 'user_id'
+    column, before any further rows are read.
+    """
+    _, file_extension = os.path.splitext(file_path)
+    if file_extension.lower() != '.csv':
+        raise ValueError(f"Streaming ingestion only supports CSV files, got '{file_extension}'.")
+
+    with pd.read_csv(file_path, chunksize=chunk_rows) as reader:
+        for i, chunk in enumerate(reader):
+            if i == 0 and 'user_id' not in chunk.columns:
+                raise ValueError("The dataset must contain a 'user_id' column.")
+            yield apply_schema(chunk)
+
+def storage_schema(chunk: pd.DataFrame) -> "pa.Schema":
+    """
+    Arrow schema used when transactions are written to disk in pieces (shards,
+    incremental parts). Categoricals are stored as plain strings because every
+    piece builds its own categories; apply_schema restores them on read.
+    """
+    fields = []
+    for field in pa.Schema.from_pandas(chunk, preserve_index=False):
+        if pa.types.is_dictionary(field.type) or pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields)
+
+class ShardedTransactions:
+    """
+    Per-user transaction shards on disk, written by stream_transactions_to_shards.
+
+    Mirrors the read side of UserPartitions (user_ids, items(), get(), len, in)
+    but loads a user's rows only when they are requested, so iterating over all
+    users needs memory for one user at a time. Loaded frames have the declared
+    schema applied.
+    """
+
+    def __init__(self, shard_dir: str):
+        with open(os.path.join(shard_dir, _SHARD_MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.shard_dir = shard_dir
+        self.total_rows = manifest["total_rows"]
+        self.columns = manifest["columns"]
+        self._users = {entry["user_id"]: entry for entry in manifest["users"]}
+        self.user_ids = list(self._users)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def __contains__(self, user_id: Any) -> bool:
+        return str(user_id) in self._users
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.user_ids)
+
+    def row_count(self, user_id: Any) -> int:
+        return self._users[str(user_id)]["rows"]
+
+    def __getitem__(self, user_id: Any) -> pd.DataFrame:
+        entry = self._users[str(user_id)]
+        tables = [feather.read_table(os.path.join(self.shard_dir, name), memory_map=True) for name in entry["files"]]
+        return apply_schema(pa.concat_tables(tables).to_pandas())
+
+    def get(self, user_id: Any) -> pd.DataFrame:
+        """Returns the user's rows, or an empty frame with the same columns for unknown users."""
+        if user_id not in self:
+            return pd.DataFrame(columns=self.columns)
+        return self[user_id]
+
+    def items(self) -> Iterator[tuple[Any, pd.DataFrame]]:
+        for user_id in self.user_ids:
+            yield user_id, self[user_id]
+
+class _ShardWriter:
+    """Keeps at most max_open Arrow IPC writers open; a user whose writer was closed gets a new part file."""
+
+    def __init__(self, shard_dir: str, schema: "pa.Schema", max_open: int):
+        self.shard_dir = shard_dir
+        self.schema = schema
+        self.max_open = max(1, max_open)
+        self.users: "OrderedDict[str, dict]" = OrderedDict()  # First-appearance order
+        self._open: "OrderedDict[str, Any]" = OrderedDict()
+
+    def write(self, user_id: str, table: "pa.Table") -> None:
+        entry = self.users.get(user_id)
+        if entry is None:
+            entry = {"user_id": user_id, "index": len(self.users), "rows": 0, "files": []}
+            self.users[user_id] = entry
+        writer = self._open.get(user_id)
+        if writer is None:
+            if len(self._open) >= self.max_open:
+                _, oldest = self._open.popitem(last=False)
+                oldest.close()
+            name = f"user-{entry['index']:06d}-part-{len(entry['files']):04d}.arrow"
+            entry["files"].append(name)
+            writer = pa.ipc.new_file(os.path.join(self.shard_dir, name), self.schema)
+            self._open[user_id] = writer
+        else:
+            self._open.move_to_end(user_id)
+        writer.write_table(table)
+        entry["rows"] += table.num_rows
+
+    def close(self) -> None:
+        while self._open:
+            _, writer = self._open.popitem()
+            writer.close()
+
+def stream_transactions_to_shards(file_path: str, shard_dir: Optional[str] = None,
+                                  chunk_rows: int = STREAM_CHUNK_ROWS,
+                                  max_open_shards: int = MAX_OPEN_SHARDS) -> Optional[ShardedTransactions]:
+    """
+    Streams a large CSV export into per-user Arrow IPC shards without loading
+    the whole file: each chunk is schema-cast, split by user in one pass and
+    appended to that user's shard. Peak memory is bounded by chunk_rows.
+
+    shard_dir defaults to a directory under CACHE_DIR keyed by the file's
+    content hash, so a completed ingestion of the same file is reused.
+    Returns a ShardedTransactions handle, or None on error (requires pyarrow).
+    """
+    if pa is None:
+        print("Error: Streaming ingestion requires pyarrow. Run: pip install pyarrow")
+        return None
+    try:
+        if shard_dir is None:
+            shard_dir = os.path.join(CACHE_DIR, "shards", file_content_hash(file_path))
+        if os.path.exists(os.path.join(shard_dir, _SHARD_MANIFEST)):
+            shards = ShardedTransactions(shard_dir)
+            print(f"Using existing shards for {file_path}: {shards.total_rows} transactions, {len(shards)} users.")
+            return shards
+
+        # Write into a scratch directory and rename it at the end so a crash never leaves a partial shard set
+        tmp_dir = f"{shard_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        writer = None
+        total_rows = 0
+        columns = []
+        try:
+            for chunk in iter_transaction_chunks(file_path, chunk_rows):
+                if writer is None:
+                    columns = list(chunk.columns)
+                    writer = _ShardWriter(tmp_dir, storage_schema(chunk), max_open_shards)
+                partitions = partition_by_user(chunk)
+                table = pa.Table.from_pandas(partitions.frame, preserve_index=False).cast(writer.schema)
+                # partitions.frame holds each user's rows contiguously (rows with no user_id first)
+                offset = len(partitions.frame) - sum(len(partitions[u]) for u in partitions.user_ids)
+                for user_id in partitions.user_ids:
+                    n = len(partitions[user_id])
+                    writer.write(str(user_id), table.slice(offset, n))
+                    offset += n
+                total_rows += len(chunk)
+        except BaseException:
+            if writer is not None:
+                writer.close()
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        if writer is not None:
+            writer.close()
+
+        manifest = {
+            "source": os.path.abspath(file_path),
+            "total_rows": total_rows,
+            "columns": columns,
+            "users": list(writer.users.values()) if writer is not None else [],
+        }
+        with open(os.path.join(tmp_dir, _SHARD_MANIFEST), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.makedirs(os.path.dirname(os.path.abspath(shard_dir)), exist_ok=True)
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        os.replace(tmp_dir, shard_dir)
+
+        shards = ShardedTransactions(shard_dir)
+        print(f"Streamed {total_rows} transactions from {file_path} into {len(shards)} user shards.")
+        return shards
+
+    except FileNotFoundError:
+        print(f"Error: The file at {file_path} was not found.")
+        return None
+    except Exception as e:
+        print(f"An error occurred while streaming the data file: {e}")
+        return None
@@ -0,0 +1,192 @@
+import json
+import os
+from typing import Iterable, Optional
+
+import pandas as pd
+
+from utils.aggregate_cube import AggregateCube
+from utils.data_loader import apply_schema, storage_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+except ImportError:  # Incremental mode needs pyarrow; IncrementalStore reports this on use.
+    pa = None
+    pc = None
+    feather = None
+
+# --- Incremental Store Settings ---
+INCREMENTAL_STORE_DIR = os.getenv(
+    "INCREMENTAL_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "incremental")
+)
+# A delta row is a duplicate if any of these identifiers was already ingested.
+DEDUP_KEYS = ['txn_id', 'utr']
+
+def _key_strings(series: pd.Series) -> pd.Series:
+    """Identifiers as strings (missing values kept as NaN), so 123, 123.0 and '123' compare equal."""
+    if pd.api.types.is_float_dtype(series):
+        series = series.round().astype('Int64')
+    return series.astype(str).where(series.notna())
+
+def deduplicate_delta(delta_df: pd.DataFrame, existing_keys: dict) -> tuple[pd.DataFrame, int]:
+    """
+    Drops delta rows whose txn_id or utr was already ingested (existing_keys maps
+    key column -> set of strings) or that repeat an earlier row of the same delta.
+    Returns (new rows, number of rows dropped).
+    """
+    keys = [col for col in DEDUP_KEYS if col in delta_df.columns]
+    if not keys:
+        print("Warning: The delta has no txn_id/utr column; all rows are treated as new.")
+        return delta_df, 0
+
+    duplicate = pd.Series(False, index=delta_df.index)
+    for col in keys:
+        values = _key_strings(delta_df[col])
+        duplicate |= values.isin(existing_keys.get(col, set()))
+        duplicate |= values.notna() & values.duplicated()
+    return delta_df[~duplicate], int(duplicate.sum())
+
+def touched_user_months(df: pd.DataFrame) -> dict:
+    """Maps each user_id in df to the sorted list of months ('YYYY-MM') it has rows in."""
+    if df.empty:
+        return {}
+    months = pd.to_datetime(df['timestamp'], errors='coerce').dt.strftime('%Y-%m')
+    pairs = pd.DataFrame({'user_id': df['user_id'].astype(str).to_numpy(), 'month': months.to_numpy()}).dropna()
+    return {user_id: sorted(group['month'].unique()) for user_id, group in pairs.groupby('user_id', sort=False)}
+
+def merge_touched(*touched_maps: dict) -> dict:
+    """Union of user -> months maps, with each user's months sorted."""
+    merged = {}
+    for touched in touched_maps:
+        for user_id, months in touched.items():
+            merged.setdefault(user_id, set()).update(months)
+    return {user_id: sorted(months) for user_id, months in merged.items()}
+
+class IncrementalStore:
+    """
+    Append-only transaction history plus the last results for every user.
+
+    Each ingested batch (the first full file, then every delta) is written as a
+    new Arrow IPC part, so a nightly run writes only the delta. Reads are
+    memory-mapped and filtered: dedup reads just the key columns and a
+    recompute loads just the touched users' rows.
+
+    The users touched by ingested rows stay listed in pending.json until their
+    results are saved, so a run that stops in between is finished by the next one.
+    """
+
+    def __init__(self, store_dir: str = INCREMENTAL_STORE_DIR):
+        if feather is None:
+            raise RuntimeError("Incremental mode requires pyarrow. Run: pip install pyarrow")
+        self.store_dir = store_dir
+        self.parts_dir = os.path.join(store_dir, "parts")
+        self.results_path = os.path.join(store_dir, "results.json")
+        self.cube_path = os.path.join(store_dir, "cube.arrow")
+        self.pending_path = os.path.join(store_dir, "pending.json")
+        os.makedirs(self.parts_dir, exist_ok=True)
+
+    def _part_paths(self) -> list[str]:
+        names = sorted(name for name in os.listdir(self.parts_dir) if name.endswith(".arrow"))
+        return [os.path.join(self.parts_dir, name) for name in names]
+
+    def is_empty(self) -> bool:
+        return not self._part_paths()
+
+    def existing_keys(self, candidates: dict) -> dict:
+        """
+        Which of the candidate identifiers (key column -> strings) were already
+        ingested. Only the key columns are read, and the lookup runs in Arrow,
+        so the Python-side work scales with the delta rather than the history.
+        """
+        found = {col: set() for col in candidates}
+        value_sets = {col: pa.array(list(values), type=pa.string()) for col, values in candidates.items() if len(values)}
+        for path in self._part_paths():
+            table = feather.read_table(path, memory_map=True)
+            for col, value_set in value_sets.items():
+                if col not in table.column_names:
+                    continue
+                column = table.column(col).cast(pa.string())
+                hits = pc.filter(column, pc.is_in(column, value_set=value_set))
+                found[col].update(hits.to_pylist())
+        return found
+
+    def append(self, df: pd.DataFrame) -> None:
+        """Writes df as the next part. The rename keeps readers from seeing partial files."""
+        if df.empty:
+            return
+        path = os.path.join(self.parts_dir, f"part-{len(self._part_paths()):06d}.arrow")
+        table = pa.Table.from_pandas(df, preserve_index=False).cast(storage_schema(df))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        feather.write_feather(table, tmp_path, compression="uncompressed")
+        os.replace(tmp_path, path)
+
+    def load_users(self, user_ids: Optional[Iterable] = None) -> pd.DataFrame:
+        """Full history of the given users (all users if None), in ingestion order, with the declared schema applied."""
+        wanted = None if user_ids is None else pa.array([str(user_id) for user_id in user_ids], type=pa.string())
+        frames = []
+        for path in self._part_paths():
+            table = feather.read_table(path, memory_map=True)
+            if wanted is not None:
+                table = table.filter(pc.is_in(table.column('user_id').cast(pa.string()), value_set=wanted))
+            frames.append(table.to_pandas())
+        if not frames:
+            return pd.DataFrame()
+        return apply_schema(pd.concat(frames, ignore_index=True))
+
+    def load_results(self) -> dict:
+        if not os.path.exists(self.results_path):
+            return {}
+        with open(self.results_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_results(self, results: dict) -> None:
+        tmp_path = f"{self.results_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, default=str)
+        os.replace(tmp_path, self.results_path)
+
+    def load_pending(self) -> dict:
+        """Touched user -> months of ingested rows whose results were not saved yet (empty after a complete run)."""
+        if not os.path.exists(self.pending_path):
+            return {}
+        with open(self.pending_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_pending(self, touched: dict) -> None:
+        tmp_path = f"{self.pending_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(touched, f)
+        os.replace(tmp_path, self.pending_path)
+
+    def clear_pending(self) -> None:
+        if os.path.exists(self.pending_path):
+            os.remove(self.pending_path)
+
+def update_cube(store: IncrementalStore, new_rows: pd.DataFrame, rebuild: bool = False) -> AggregateCube:
+    """
+    Folds new_rows into the store's aggregate cube, touching only their cells.
+    A store without a cube yet (or with an unreadable one) gets it built from its full history once,
+    as does one whose last run stopped early (rebuild=True): its cube may or may not include that run's rows.
+    """
+    cube = None if rebuild else AggregateCube.load(store.cube_path)
+    cube = AggregateCube.build(store.load_users()) if cube is None else cube.update(new_rows)
+    cube.save(store.cube_path)
+    return cube
+
+def ingest_delta(store: IncrementalStore, delta_df: pd.DataFrame) -> tuple[pd.DataFrame, int, dict]:
+    """
+    Deduplicates delta_df against the store and appends the new rows.
+    Returns (new rows, duplicates dropped, touched user -> months).
+    The touched users are added to the store's pending list before the append;
+    the caller clears it once their results are saved.
+    """
+    candidates = {col: set(_key_strings(delta_df[col]).dropna()) for col in DEDUP_KEYS if col in delta_df.columns}
+    new_rows, n_duplicates = deduplicate_delta(delta_df, store.existing_keys(candidates))
+    touched = touched_user_months(new_rows)
+    if touched:
+        # A rerun's dedup drops these rows, so without the list their users would never be recomputed
+        store.save_pending(merge_touched(store.load_pending(), touched))
+    store.append(new_rows)
+    return new_rows, n_duplicates, touched
@@ -0,0 +1,169 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is then reported as None.
+    resource = None
+
+# Token usage of the LLM calls made while the current node runs. Set by the
+# node wrapper and filled in by utils/llm_client.py via record_llm_usage().
+_llm_usage: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("llm_usage", default=None)
+
+def record_llm_usage(usage: Any = None, cached: bool = False) -> None:
+    """Adds one LLM call (its response.usage, or a cache hit) to the current node's totals."""
+    totals = _llm_usage.get()
+    if totals is None:
+        return
+    totals["llm_calls"] += 1
+    if cached:
+        totals["llm_cache_hits"] += 1
+    if usage is not None:
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            totals[field] += getattr(usage, field, 0) or 0
+
+def record_llm_retry() -> None:
+    """Counts one retried LLM request (see utils/llm_resilience.py) against the current node."""
+    totals = _llm_usage.get()
+    if totals is not None:
+        totals["llm_retries"] += 1
+
+def _peak_rss_kb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / 1024 if sys.platform == "darwin" else float(peak)
+
+def _row_count(state: dict) -> Optional[int]:
+    if not isinstance(state, dict):
+        return None
+    df = state.get("transactions_df")
+    if isinstance(df, pd.DataFrame):
+        return len(df)
+    ref = state.get("transactions_ref")
+    return ref.get("rows") if isinstance(ref, dict) else None
+
+class NodeMetricsRecorder:
+    """
+    Collects per-node metrics for LangGraph workflows: wall time, CPU time of
+    the executing thread, peak RSS growth, input row count and LLM token usage.
+    Each record is kept in memory and, if a path is given, appended to a JSON
+    lines file as soon as the node finishes.
+    """
+
+    def __init__(self, path: Optional[str] = None, run_id: Optional[str] = None, dataset_rows: Optional[int] = None):
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.dataset_rows = dataset_rows
+        self.records: list[dict] = []
+        self._lock = threading.Lock()
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _start(self) -> tuple:
+        usage = {"llm_calls": 0, "llm_cache_hits": 0, "llm_retries": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        token = _llm_usage.set(usage)
+        return usage, token, time.perf_counter(), time.thread_time(), _peak_rss_kb()
+
+    def _finish(self, node: str, state: dict, started: tuple, error: Optional[BaseException]) -> None:
+        usage, token, wall_start, cpu_start, rss_start = started
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        rss_end = _peak_rss_kb()
+        _llm_usage.reset(token)
+        self.record({
+            "run_id": self.run_id,
+            "timestamp": time.time(),
+            "node": node,
+            "user_id": str(state.get("user_id")) if isinstance(state, dict) else None,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "peak_rss_delta_kb": None if rss_start is None else rss_end - rss_start,
+            "rows": _row_count(state),
+            "dataset_rows": self.dataset_rows,
+            **usage,
+            "error": None if error is None else repr(error),
+        })
+
+    def record(self, entry: dict) -> None:
+        with self._lock:
+            self.records.append(entry)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+
+    def wrap(self, node: str, fn: Callable) -> Callable:
+        """Returns an instrumented version of a (sync or async) graph node function."""
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(state, *args, **kwargs):
+                started = self._start()
+                error = None
+                try:
+                    return await fn(state, *args, **kwargs)
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    self._finish(node, state, started, error)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(state, *args, **kwargs):
+            started = self._start()
+            error = None
+            try:
+                return fn(state, *args, **kwargs)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                self._finish(node, state, started, error)
+        return wrapper
+
+    def summary(self) -> pd.DataFrame:
+        """Per-node totals and averages across all recorded users, slowest node first."""
+        if not self.records:
+            return pd.DataFrame()
+        df = pd.DataFrame(self.records)
+        summary = df.groupby("node").agg(
+            calls=("wall_s", "size"),
+            wall_total_s=("wall_s", "sum"),
+            wall_mean_s=("wall_s", "mean"),
+            wall_max_s=("wall_s", "max"),
+            cpu_total_s=("cpu_s", "sum"),
+            peak_rss_delta_kb=("peak_rss_delta_kb", "sum"),
+            rows_mean=("rows", "mean"),
+            llm_calls=("llm_calls", "sum"),
+            llm_retries=("llm_retries", "sum"),
+            total_tokens=("total_tokens", "sum"),
+        )
+        return summary.sort_values("wall_total_s", ascending=False)
+
+    def print_summary(self) -> None:
+        summary = self.summary()
+        if summary.empty:
+            print("No node metrics recorded.")
+            return
+        print("\n--- Node Metrics Summary ---")
+        print(summary.round(4).to_string())
+
+def instrument(node: str, fn: Callable, recorder: Optional[NodeMetricsRecorder]) -> Callable:
+    """Wraps fn with the recorder, or returns it unchanged when instrumentation is off."""
+    return recorder.wrap(node, fn) if recorder is not None else fn
+
+def metrics_recorder_from_env(dataset_rows: Optional[int] = None) -> Optional[NodeMetricsRecorder]:
+    """Returns a recorder writing to PIPELINE_METRICS_PATH if that variable is set, else None."""
+    path = os.getenv("PIPELINE_METRICS_PATH")
+    return NodeMetricsRecorder(path, dataset_rows=dataset_rows) if path else None
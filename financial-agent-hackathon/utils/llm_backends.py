@@ -0,0 +1,310 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from types import SimpleNamespace
+from typing import Any, Iterator, Optional
+
+# The OpenAI SDK (and httpx, config/dotenv) are imported on first use: importing
+# openai costs about 0.3 s, which every CLI run and app start would pay otherwise.
+
+def _approx_tokens(text: str) -> int:
+    # About 4 characters per token, like llm_client.estimate_tokens
+    return max(1, len(text) // 4)
+
+def make_response(content: str, prompt_tokens: int, completion_tokens: int, model: str) -> Any:
+    """An object shaped like an OpenAI chat completion (choices[0].message.content and usage)."""
+    return SimpleNamespace(
+        model=model,
+        choices=[SimpleNamespace(index=0, finish_reason="stop",
+                                 message=SimpleNamespace(role="assistant", content=content))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                              total_tokens=prompt_tokens + completion_tokens),
+    )
+
+def make_chunk(content: Optional[str], model: str, usage: Any = None) -> Any:
+    """
+    An object shaped like an OpenAI streaming chunk: choices[0].delta.content
+    holds a piece of the text; the final chunk has no choices and carries the usage.
+    """
+    choices = [] if content is None else [SimpleNamespace(index=0, finish_reason=None,
+                                                          delta=SimpleNamespace(content=content))]
+    return SimpleNamespace(model=model, choices=choices, usage=usage)
+
+# Batched prompts introduce each user with a "### User <id>" heading (agent/profile_builder.py)
+_USER_HEADING = re.compile(r"^\s*### User (\S+)\s*$", re.MULTILINE)
+
+def schema_shaped_value(schema: dict, text: str, user_ids: list[str], name: str = "") -> Any:
+    """
+    A value matching a JSON schema, for offline structured-output responses:
+    strings are text (or a user ID for a "user_id" property), and an array of
+    objects with a user_id property gets one item per user ID.
+    """
+    kind = schema.get("type")
+    if kind == "object":
+        properties = schema.get("properties", {})
+        return {key: schema_shaped_value(sub, text, user_ids, key) for key, sub in properties.items()}
+    if kind == "array":
+        items = schema.get("items", {})
+        if "user_id" in items.get("properties", {}):
+            return [{**schema_shaped_value(items, text, user_ids), "user_id": user_id} for user_id in user_ids]
+        return [schema_shaped_value(items, text, user_ids)]
+    if kind == "string":
+        return user_ids[0] if name == "user_id" and user_ids else text
+    if kind in ("number", "integer"):
+        return 0
+    if kind == "boolean":
+        return False
+    return None
+
+def structured_content(text: str, messages: list[dict], response_format: Optional[dict]) -> str:
+    """An offline response body: text as is, or wrapped in JSON shaped like response_format's schema."""
+    schema = ((response_format or {}).get("json_schema") or {}).get("schema")
+    if schema is None:
+        return text
+    user_ids = _USER_HEADING.findall(str(messages[-1].get("content", ""))) if messages else []
+    return json.dumps(schema_shaped_value(schema, text, user_ids))
+
+def split_stream_text(text: str) -> list[str]:
+    """Splits text into word-sized pieces (each with its trailing whitespace), like streamed tokens."""
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+def rate_limit_error(message: str = "Rate limit reached (simulated)", retry_after: Optional[float] = None) -> Exception:
+    """Builds the same exception type the OpenAI SDK raises for an HTTP 429."""
+    import httpx
+    from openai import RateLimitError
+
+    headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+    request = httpx.Request("POST", "http://fake-llm/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return RateLimitError(message, response=response, body={"error": {"message": message, "type": "rate_limit_error"}})
+
+def timeout_error() -> Exception:
+    """Builds the exception the OpenAI SDK raises when a request exceeds its timeout."""
+    import httpx
+    from openai import APITimeoutError
+
+    return APITimeoutError(request=httpx.Request("POST", "http://fake-llm/v1/chat/completions"))
+
+class LLMBackend:
+    """
+    Interface used by utils/llm_client.py. complete() and acomplete() take the
+    chat completion arguments and return an object shaped like an OpenAI chat
+    completion; errors are raised as OpenAI SDK exceptions. response_format
+    (structured output) is optional and may be ignored by offline backends.
+    timeout (seconds) bounds a single attempt; retries are left to the caller
+    (utils/llm_resilience.py).
+    stream() yields chunks shaped like OpenAI streaming chunks (see make_chunk);
+    backends that cannot stream fall back to one chunk with the whole text.
+    """
+    name = "base"
+
+    def complete(self, messages: list[dict], model: str, temperature: float, max_tokens: int,
+                 response_format: Optional[dict] = None, timeout: Optional[float] = None) -> Any:
+        raise NotImplementedError
+
+    async def acomplete(self, messages: list[dict], model: str, temperature: float, max_tokens: int,
+                        response_format: Optional[dict] = None, timeout: Optional[float] = None) -> Any:
+        raise NotImplementedError
+
+    def stream(self, messages: list[dict], model: str, temperature: float, max_tokens: int,
+               timeout: Optional[float] = None) -> Iterator[Any]:
+        response = self.complete(messages, model=model, temperature=temperature, max_tokens=max_tokens, timeout=timeout)
+        yield make_chunk(response.choices[0].message.content, model)
+        yield make_chunk(None, model, getattr(response, "usage", None))
+
+class OpenAIBackend(LLMBackend):
+    """
+    The OpenAI SDK. Clients are created on first use: one sync client per
+    process and one async client per event loop (they hold loop-bound
+    connections). base_url defaults to OPENAI_BASE_URL; a local mock server
+    does not need a real API key. The SDK's own retries are disabled: retries,
+    backoff and the circuit breaker live in utils/llm_resilience.py.
+    """
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self._api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    def _key(self) -> str:
+        from config import OPENAI_API_KEY, require_openai_api_key
+
+        if self._api_key:
+            return self._api_key
+        if not OPENAI_API_KEY and self.base_url:
+            return "local-mock-key"
+        return require_openai_api_key()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self._key(), base_url=self.base_url, max_retries=0)
+        return self._client
+
+    @property
+    def async_client(self) -> Any:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=self._key(), base_url=self.base_url, max_retries=0)
+            self._async_clients[loop] = client
+        return client
+
+    @staticmethod
+    def _request(messages, model, temperature, max_tokens, response_format, timeout) -> dict:
+        request = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+        if response_format is not None:
+            request["response_format"] = response_format
+        if timeout is not None:
+            request["timeout"] = timeout
+        return request
+
+    def complete(self, messages, model, temperature, max_tokens, response_format=None, timeout=None):
+        return self.client.chat.completions.create(
+            **self._request(messages, model, temperature, max_tokens, response_format, timeout)
+        )
+
+    async def acomplete(self, messages, model, temperature, max_tokens, response_format=None, timeout=None):
+        return await self.async_client.chat.completions.create(
+            **self._request(messages, model, temperature, max_tokens, response_format, timeout)
+        )
+
+    def stream(self, messages, model, temperature, max_tokens, timeout=None):
+        # include_usage adds a final chunk with the token counts (and no choices)
+        return self.client.chat.completions.create(
+            **self._request(messages, model, temperature, max_tokens, None, timeout),
+            stream=True, stream_options={"include_usage": True}
+        )
+
+class FakeBackend(LLMBackend):
+    """
+    In-process stand-in for the API, for tests and benchmarks on machines
+    without network access. Each call waits latency_s (plus jitter_s at random)
+    and returns response_text with a token usage estimated from the prompt.
+    With a JSON schema response_format the text is wrapped in schema-shaped
+    JSON instead (see structured_content), one item per user in batched prompts.
+    Every rate_limit_every-th call (0 = never) and a random error_rate share of
+    calls raise the SDK's RateLimitError instead. A call whose delay exceeds
+    its timeout raises the SDK's APITimeoutError once the timeout has passed.
+    Call counts are kept in calls / rate_limited.
+    """
+    name = "fake"
+
+    def __init__(self, latency_s: float = 0.0, jitter_s: float = 0.0, completion_tokens: int = 150,
+                 rate_limit_every: int = 0, error_rate: float = 0.0, retry_after_s: Optional[float] = 1.0,
+                 response_text: Optional[str] = None, seed: int = 0):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.completion_tokens = completion_tokens
+        self.rate_limit_every = rate_limit_every
+        self.error_rate = error_rate
+        self.retry_after_s = retry_after_s
+        self.response_text = response_text
+        self.calls = 0
+        self.rate_limited = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FakeBackend":
+        return cls(
+            latency_s=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")) / 1000,
+            jitter_s=float(os.getenv("FAKE_LLM_JITTER_MS", "0")) / 1000,
+            completion_tokens=int(os.getenv("FAKE_LLM_COMPLETION_TOKENS", "150")),
+            rate_limit_every=int(os.getenv("FAKE_LLM_RATE_LIMIT_EVERY", "0")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+        )
+
+    def _next_call(self) -> tuple[float, bool]:
+        """Returns (delay, rate_limited) for the next call."""
+        with self._lock:
+            self.calls += 1
+            limited = (self.rate_limit_every > 0 and self.calls % self.rate_limit_every == 0) \
+                or self._random.random() < self.error_rate
+            if limited:
+                self.rate_limited += 1
+            return self.latency_s + self._random.uniform(0, self.jitter_s), limited
+
+    def _respond(self, messages, model, max_tokens, limited: bool, response_format: Optional[dict] = None):
+        if limited:
+            raise rate_limit_error(retry_after=self.retry_after_s)
+        prompt_tokens = sum(_approx_tokens(m.get("content", "")) for m in messages)
+        completion_tokens = min(max_tokens, self.completion_tokens)
+        content = structured_content(
+            self.response_text or f"[offline {model} response to a {prompt_tokens}-token prompt]",
+            messages, response_format)
+        return make_response(content, prompt_tokens, completion_tokens, model)
+
+    def complete(self, messages, model, temperature, max_tokens, response_format=None, timeout=None):
+        delay, limited = self._next_call()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise timeout_error()
+        if delay:
+            time.sleep(delay)
+        return self._respond(messages, model, max_tokens, limited, response_format)
+
+    async def acomplete(self, messages, model, temperature, max_tokens, response_format=None, timeout=None):
+        delay, limited = self._next_call()
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            raise timeout_error()
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(messages, model, max_tokens, limited, response_format)
+
+    def stream(self, messages, model, temperature, max_tokens, timeout=None):
+        delay, limited = self._next_call()
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise timeout_error()
+        if delay:
+            time.sleep(delay)
+        response = self._respond(messages, model, max_tokens, limited)
+        for piece in split_stream_text(response.choices[0].message.content):
+            yield make_chunk(piece, model)
+        yield make_chunk(None, model, response.usage)
+
+# --- Backend Selection ---
+# LLM_BACKEND=openai (default) talks to the OpenAI API, or to any compatible server
+# given by OPENAI_BASE_URL such as utils/mock_llm_server.py. LLM_BACKEND=fake answers
+# in-process without network access.
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+def backend_from_env() -> LLMBackend:
+    import config  # noqa: F401  Loads .env, which may set LLM_BACKEND or OPENAI_BASE_URL
+
+    name = os.getenv("LLM_BACKEND", "openai").lower()
+    if name == "fake":
+        return FakeBackend.from_env()
+    if name != "openai":
+        print(f"Warning: Unknown LLM_BACKEND '{name}', using the OpenAI backend.")
+    return OpenAIBackend()
+
+def get_backend() -> LLMBackend:
+    """Returns the process-wide backend, chosen from LLM_BACKEND on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = backend_from_env()
+    return _backend
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Replaces the process-wide backend (None re-reads LLM_BACKEND on next use)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
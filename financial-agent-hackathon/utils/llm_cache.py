@@ -0,0 +1,212 @@
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional, Union
+
+# --- Cache Settings ---
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "llm_responses.sqlite")
+)
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Owners of the responses cached while it is set (normally the user_id being analysed, or
+# every user of a batched request), so one user's entries can be invalidated without touching
+# anyone else's.
+_cache_scope: contextvars.ContextVar[tuple[str, ...]] = contextvars.ContextVar("llm_cache_scope", default=())
+
+def _scope_tuple(scope) -> tuple[str, ...]:
+    """None -> (), a single scope -> (scope,), an iterable of scopes -> all of them, as strings."""
+    if scope is None:
+        return ()
+    if isinstance(scope, (list, tuple, set, frozenset)):
+        return tuple(dict.fromkeys(str(item) for item in scope))
+    return (str(scope),)
+
+@contextlib.contextmanager
+def llm_cache_scope(scope):
+    """Tags responses cached inside the block with scope (e.g. a user_id, or a list of them)."""
+    token = _cache_scope.set(_scope_tuple(scope))
+    try:
+        yield
+    finally:
+        _cache_scope.reset(token)
+
+def prompt_fingerprint(messages: list[dict], model: str, temperature: float, max_tokens: int,
+                       response_format: Optional[dict] = None) -> str:
+    """
+    SHA-256 over the request parameters and the normalized prompt text.
+    Whitespace runs are collapsed so indentation changes in the prompt
+    templates do not invalidate otherwise identical requests.
+    """
+    normalized = [(m.get("role", ""), _WHITESPACE.sub(" ", m.get("content", "")).strip()) for m in messages]
+    params = [model, float(temperature), int(max_tokens), normalized]
+    if response_format is not None:  # Only structured requests hash it, so existing keys stay valid
+        params.append(response_format)
+    payload = json.dumps(params, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """
+    On-disk (SQLite) cache of LLM responses keyed by prompt fingerprint.
+
+    Entries older than ttl_seconds are treated as misses and removed. When the
+    table grows past max_entries, the least recently used entries are evicted.
+    Hit, miss and eviction counts are kept per process (see stats()). Each entry
+    can belong to several scopes (response_scopes), e.g. a batched response to
+    all of the batch's users; scopes only accumulate until the entry is removed.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        # WAL lets the CLI and Streamlit sessions read while another process writes.
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Removing a response removes its scope rows (ON DELETE CASCADE)
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   model TEXT NOT NULL,
+                   response TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   last_access REAL NOT NULL
+               )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS response_scopes (
+                   key TEXT NOT NULL REFERENCES responses (key) ON DELETE CASCADE,
+                   scope TEXT NOT NULL,
+                   PRIMARY KEY (key, scope)
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_response_scopes_scope ON response_scopes (scope)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, model: str, response: str, scope: Union[str, Iterable[str], None] = None) -> None:
+        """
+        Stores a response. scope (one or several) defaults to the ones set with llm_cache_scope();
+        they are added to the scopes the entry already has, so users sharing a response all keep it tagged.
+        """
+        now = time.time()
+        scopes = _scope_tuple(scope) if scope is not None else _cache_scope.get()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO responses (key, model, response, created_at, last_access) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (key) DO UPDATE SET model = excluded.model, response = excluded.response,
+                       created_at = excluded.created_at, last_access = excluded.last_access""",
+                (key, model, response, now, now)
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO response_scopes (key, scope) VALUES (?, ?)",
+                                   [(key, item) for item in scopes])
+            self._evict_locked()
+            self._conn.commit()
+
+    def _evict_locked(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+
+    def purge_expired(self) -> int:
+        """Deletes all expired entries and returns how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def invalidate_scopes(self, scopes) -> int:
+        """Deletes every entry cached under one of the given scopes and returns how many were removed."""
+        scopes = [str(scope) for scope in scopes]
+        removed = 0
+        with self._lock:
+            # Batched to stay under SQLite's bound-parameter limit
+            for start in range(0, len(scopes), 500):
+                batch = scopes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor = self._conn.execute(
+                    f"DELETE FROM responses WHERE key IN (SELECT key FROM response_scopes WHERE scope IN ({placeholders}))",
+                    batch
+                )
+                removed += cursor.rowcount
+            self._conn.commit()
+        return removed
+
+    def delete(self, key: str) -> bool:
+        """Removes one entry (e.g. a response that turned out unusable). Returns whether it existed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+def get_response_cache() -> Optional[LLMResponseCache]:
+    """Returns the process-wide response cache, or None when LLM_CACHE_ENABLED is off."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache()
+    return _cache
@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import os
+import time
+import weakref
+from typing import Iterator, Optional, Union
+
+from utils.llm_backends import get_backend
+from utils.llm_cache import get_response_cache, prompt_fingerprint
+from utils.instrumentation import record_llm_usage
+from utils.llm_resilience import LLMUnavailableError, call_with_retries, acall_with_retries  # noqa: F401  Re-exported for the agents
+
+DEFAULT_MODEL = "gpt-4o"
+
+# --- Async Scheduler Limits ---
+# Shared by every coroutine on an event loop, so many users' LLM stages can be in
+# flight at once without exceeding the account's concurrency or TPM limits.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+
+# One limiter per event loop: its semaphore and lock are loop-bound.
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncRateLimiter]" = weakref.WeakKeyDictionary()
+
+def estimate_tokens(messages: list[dict], max_tokens: int) -> int:
+    """Rough request size (about 4 characters per token) plus the completion allowance."""
+    return sum(len(m.get("content", "")) for m in messages) // 4 + max_tokens
+
+class AsyncRateLimiter:
+    """
+    Bounds the number of in-flight requests (semaphore) and the tokens spent
+    per minute (token bucket refilled continuously). Requests reserve their
+    estimated size up front; the estimate is corrected with the real usage
+    once the response arrives.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        self.capacity = float(tokens_per_minute)
+        self.refill_per_second = tokens_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    async def reserve(self, tokens: int) -> float:
+        """
+        Takes tokens from the bucket, waiting for it to refill, and returns the amount taken
+        (settle with that amount). A single request larger than the whole bucket takes a full
+        bucket instead of waiting forever. The lock is not held while waiting.
+        """
+        tokens = min(float(tokens), self.capacity)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return tokens
+                wait = (tokens - self._tokens) / self.refill_per_second
+            await asyncio.sleep(wait)
+
+    def settle(self, reserved: float, used: Optional[int]) -> None:
+        """Returns unused reserved tokens to the bucket (or charges the overrun); used=0 refunds a failed request."""
+        if used is not None:
+            self._tokens = min(self.capacity, self._tokens + (reserved - used))
+
+def get_rate_limiter() -> AsyncRateLimiter:
+    """Returns the rate limiter shared by all requests on the running event loop."""
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = AsyncRateLimiter()
+        _limiters[loop] = limiter
+    return limiter
+
+def chat_completion(messages: list[dict], temperature: float, max_tokens: int, model: str = DEFAULT_MODEL,
+                    response_format: Optional[dict] = None, stream: bool = False) -> Union[str, Iterator[str]]:
+    """
+    Blocking chat completion through the configured backend (utils/llm_backends.py).
+    Identical requests are answered from the response cache (utils/llm_cache.py).
+    response_format is passed to the API as is (e.g. a JSON schema for structured output).
+    Transient API errors are retried (utils/llm_resilience.py); when the service
+    stays unavailable, or the circuit breaker is open, LLMUnavailableError is
+    raised. Returns the message text; other API errors propagate. With stream=True it returns
+    an iterator over the text as it is generated instead (see stream_chat_completion).
+    """
+    if stream:
+        return stream_chat_completion(messages, temperature, max_tokens, model)
+    cache = get_response_cache()
+    key = prompt_fingerprint(messages, model, temperature, max_tokens, response_format)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_usage(cached=True)
+            return cached
+
+    response = call_with_retries(lambda timeout: get_backend().complete(
+        messages, model=model, temperature=temperature, max_tokens=max_tokens,
+        response_format=response_format, timeout=timeout))
+    record_llm_usage(getattr(response, "usage", None))
+    content = response.choices[0].message.content
+    if cache is not None and content is not None:
+        cache.set(key, model, content)
+    return content
+
+def discard_cached_response(messages: list[dict], temperature: float, max_tokens: int, model: str = DEFAULT_MODEL,
+                            response_format: Optional[dict] = None) -> None:
+    """
+    Drops the cached response to this request, for callers that find it unusable
+    after the fact (e.g. a batched response missing some users), so the next
+    identical request asks the model again instead of replaying it.
+    """
+    cache = get_response_cache()
+    if cache is not None:
+        cache.delete(prompt_fingerprint(messages, model, temperature, max_tokens, response_format))
+
+def stream_chat_completion(messages: list[dict], temperature: float, max_tokens: int,
+                           model: str = DEFAULT_MODEL) -> Iterator[str]:
+    """
+    Streaming chat completion: yields pieces of the message text as the model
+    produces them, so a UI can show the first words after time-to-first-token
+    instead of the full completion time. A cached response is yielded whole.
+    Once the stream completes, the full text is cached under the same key as
+    the blocking call, so repeating the request (streamed or not) is a cache hit.
+    Errors before the first chunk are retried like chat_completion's; once text
+    has been yielded, API errors propagate from the iterator.
+    """
+    cache = get_response_cache()
+    key = prompt_fingerprint(messages, model, temperature, max_tokens, None)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            record_llm_usage(cached=True)
+            yield cached
+            return
+
+    def open_stream(timeout: float) -> Iterator:
+        # Pulls the first chunk so that rate limits and connection errors surface (and are retried) here
+        chunks = iter(get_backend().stream(messages, model=model, temperature=temperature, max_tokens=max_tokens,
+                                           timeout=timeout))
+        first = next(chunks, None)
+        return chunks if first is None else itertools.chain([first], chunks)
+
+    parts, usage = [], None
+    for chunk in call_with_retries(open_stream):
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        for choice in chunk.choices:
+            piece = choice.delta.content
+            if piece:
+                parts.append(piece)
+                yield piece
+    record_llm_usage(usage)
+    if cache is not None and parts:
+        cache.set(key, model, "".join(parts))
+
+async def achat_completion(messages: list[dict], temperature: float, max_tokens: int, model: str = DEFAULT_MODEL,
+                           response_format: Optional[dict] = None) -> str:
+    """
+    Async chat completion that goes through the loop's shared rate limiter.
+    Cache hits return without touching the limiter; the (SQLite) cache is read and
+    written in a worker thread so it does not block the event loop. Retries like
+    chat_completion; backoff waits hold no concurrency slot. Returns the message
+    text; raises LLMUnavailableError when the service stays unavailable.
+    """
+    cache = get_response_cache()
+    key = prompt_fingerprint(messages, model, temperature, max_tokens, response_format)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            record_llm_usage(cached=True)
+            return cached
+
+    limiter = get_rate_limiter()
+    estimate = estimate_tokens(messages, max_tokens)
+
+    async def attempt(timeout: float):
+        reserved = await limiter.reserve(estimate)
+        try:
+            async with limiter.semaphore:
+                response = await get_backend().acomplete(messages, model=model, temperature=temperature,
+                                                         max_tokens=max_tokens, response_format=response_format,
+                                                         timeout=timeout)
+        except BaseException:
+            # A failed attempt spends no tokens; give the reservation back so retries don't drain the bucket
+            limiter.settle(reserved, 0)
+            raise
+        limiter.settle(reserved, getattr(getattr(response, "usage", None), "total_tokens", None))
+        return response
+
+    response = await acall_with_retries(attempt)
+    record_llm_usage(getattr(response, "usage", None))
+    content = response.choices[0].message.content
+    if cache is not None and content is not None:
+        await asyncio.to_thread(cache.set, key, model, content)  # The thread copies the context, so scopes apply
+    return content
@@ -0,0 +1,337 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from utils.instrumentation import record_llm_retry
+
+# --- Retry, Timeout and Circuit Breaker Settings ---
+# Every LLM request goes through call_with_retries / acall_with_retries (via
+# utils/llm_client.py). Transient errors (429, timeouts, connection errors, 5xx)
+# are retried with jittered exponential backoff, or after the server's
+# Retry-After. A circuit breaker shared by the whole process stops sending
+# requests while most recent attempts fail, so an outage fails users fast
+# instead of each one waiting out its retries; the runners defer those users.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1.0"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "30"))
+LLM_REQUEST_TIMEOUT_S = float(os.getenv("LLM_REQUEST_TIMEOUT_S", "60"))
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))              # Recent attempts considered
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "8"))         # Attempts needed before it can open
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+class LLMUnavailableError(Exception):
+    """
+    The LLM service could not answer: a transient error persisted through all
+    retries, or the circuit breaker is open. Callers should defer the work
+    rather than put an error message into a user's report.
+    """
+
+class CircuitOpenError(LLMUnavailableError):
+    """Raised without sending a request while the circuit breaker is open."""
+
+def is_transient(error: BaseException) -> bool:
+    """Errors worth retrying: rate limits, timeouts, connection failures and server-side (5xx) errors."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code >= 500 or error.status_code in (408, 409))
+
+def retry_after_s(error: BaseException) -> Optional[float]:
+    """The wait the server asked for in retry-after-ms / Retry-After (seconds or an HTTP date), if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay_s(attempt: int, error: BaseException) -> float:
+    """Retry-After when given (with up to 10% jitter so waiting clients do not return at once), else full jitter."""
+    server_wait = retry_after_s(error)
+    if server_wait is not None:
+        return server_wait * random.uniform(1.0, 1.1)
+    return random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * 2 ** attempt))
+
+# --- Circuit Breaker ---
+
+class CircuitBreaker:
+    """
+    Opens when at least failure_rate of the last `window` attempts (and at
+    least min_calls of them) failed with transient errors. While open, calls
+    fail at once with CircuitOpenError. After cooldown_s it lets a single probe
+    request through (half-open; other calls still fail at once): the probe's
+    success closes it, its failure reopens it.
+    """
+
+    def __init__(self, window: int = LLM_BREAKER_WINDOW, min_calls: int = LLM_BREAKER_MIN_CALLS,
+                 failure_rate: float = LLM_BREAKER_FAILURE_RATE, cooldown_s: float = LLM_BREAKER_COOLDOWN_S):
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.cooldown_s = cooldown_s
+        self._outcomes: deque = deque(maxlen=max(self.min_calls, window))
+        self._opened_at: Optional[float] = None
+        self._half_open = False
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is not None and time.monotonic() - self._opened_at < self.cooldown_s:
+            return "open"
+        return "half-open" if self._half_open or self._opened_at is not None else "closed"
+
+    def remaining_open_s(self) -> float:
+        """Seconds until an open breaker lets requests through again (0 when it already does)."""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown_s - (time.monotonic() - self._opened_at))
+
+    def raise_if_open(self) -> None:
+        with self._lock:
+            self._raise_if_open()
+
+    def _raise_if_open(self) -> None:
+        if self._state() == "open":
+            _count("breaker_rejections")
+            raise CircuitOpenError(f"LLM circuit breaker is open for another "
+                                   f"{self.cooldown_s - (time.monotonic() - self._opened_at):.0f}s "
+                                   f"after repeated API failures")
+
+    def before_call(self) -> None:
+        """Admits a call, or raises CircuitOpenError while open or while a half-open probe is in flight."""
+        with self._lock:
+            self._raise_if_open()
+            if self._opened_at is not None:
+                self._opened_at, self._half_open = None, True
+            if self._half_open:
+                if self._probe_in_flight:
+                    _count("breaker_rejections")
+                    raise CircuitOpenError("LLM circuit breaker is half-open and waiting for its probe request")
+                self._probe_in_flight = True
+
+    def release_probe(self) -> None:
+        """Ends a probe that gave no verdict on the service (a non-transient error, or cancelled); the next call probes."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record(self, success: bool) -> None:
+        with self._lock:
+            self._probe_in_flight = False
+            if success:
+                if self._half_open:
+                    self._half_open = False
+                    self._outcomes.clear()
+                self._outcomes.append(True)
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if self._half_open or (len(self._outcomes) >= self.min_calls
+                                   and failures / len(self._outcomes) >= self.failure_rate):
+                if self._opened_at is None:
+                    _count("breaker_trips")
+                    reason = ("a request after the cooldown failed" if self._half_open
+                              else f"{failures}/{len(self._outcomes)} recent attempts failed")
+                    print(f"Warning: LLM circuit breaker opened ({reason}); pausing requests for {self.cooldown_s:.0f}s.")
+                self._opened_at, self._half_open = time.monotonic(), False
+                self._outcomes.clear()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._outcomes.clear()
+            self._opened_at, self._half_open, self._probe_in_flight = None, False, False
+
+# --- Metrics ---
+# Process-wide counters: requests sent, retries, their causes, requests that
+# gave up, breaker trips, calls rejected while it was open and users deferred.
+_metrics = {"requests": 0, "retries": 0, "rate_limited": 0, "timeouts": 0, "transient_errors": 0,
+            "gave_up": 0, "breaker_trips": 0, "breaker_rejections": 0, "deferred_users": 0}
+_metrics_lock = threading.Lock()
+_breaker = CircuitBreaker()
+
+def _count(name: str) -> None:
+    with _metrics_lock:
+        _metrics[name] += 1
+
+def get_circuit_breaker() -> CircuitBreaker:
+    return _breaker
+
+def llm_call_metrics() -> dict:
+    """A snapshot of the retry and breaker counters, plus the breaker's current state."""
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    snapshot["breaker_state"] = _breaker.state
+    return snapshot
+
+def format_llm_call_metrics(metrics: Optional[dict] = None) -> str:
+    m = metrics or llm_call_metrics()
+    return (f"LLM requests: {m['requests']} sent, {m['retries']} retries ({m['rate_limited']} rate-limited, "
+            f"{m['timeouts']} timeouts), {m['gave_up']} gave up; circuit breaker tripped {m['breaker_trips']}x, "
+            f"{m['breaker_rejections']} calls rejected, now {m['breaker_state']}; {m['deferred_users']} users deferred.")
+
+def _record_failure(error: BaseException) -> None:
+    import openai
+
+    with _metrics_lock:
+        if isinstance(error, openai.RateLimitError):
+            _metrics["rate_limited"] += 1
+        elif isinstance(error, (openai.APITimeoutError, TimeoutError)):
+            _metrics["timeouts"] += 1
+        else:
+            _metrics["transient_errors"] += 1
+
+# --- Call Wrappers ---
+
+def _give_up(error: BaseException, attempts: int) -> LLMUnavailableError:
+    _count("gave_up")
+    return LLMUnavailableError(f"LLM request failed after {attempts} attempts: {error}")
+
+def call_with_retries(request: Callable[[float], Any], max_retries: int = LLM_MAX_RETRIES,
+                      timeout_s: float = LLM_REQUEST_TIMEOUT_S) -> Any:
+    """
+    Calls request(timeout_s) until it succeeds, retrying transient errors.
+    Other errors propagate at once. Raises LLMUnavailableError when retries
+    run out and CircuitOpenError while the breaker is open.
+    """
+    for attempt in range(max_retries + 1):
+        _breaker.before_call()
+        _count("requests")
+        try:
+            result = request(timeout_s)
+        except Exception as e:
+            if not is_transient(e):
+                _breaker.release_probe()
+                raise
+            _breaker.record(False)
+            _record_failure(e)
+            if attempt == max_retries:
+                raise _give_up(e, attempt + 1) from e
+            _count("retries")
+            record_llm_retry()
+            time.sleep(backoff_delay_s(attempt, e))
+            continue
+        except BaseException:  # Interrupted mid-request
+            _breaker.release_probe()
+            raise
+        _breaker.record(True)
+        return result
+
+async def acall_with_retries(request: Callable[[float], Awaitable[Any]], max_retries: int = LLM_MAX_RETRIES,
+                             timeout_s: float = LLM_REQUEST_TIMEOUT_S) -> Any:
+    """Async variant of call_with_retries; backoff waits do not block the event loop."""
+    for attempt in range(max_retries + 1):
+        _breaker.before_call()
+        _count("requests")
+        try:
+            result = await request(timeout_s)
+        except Exception as e:
+            if not is_transient(e):
+                _breaker.release_probe()
+                raise
+            _breaker.record(False)
+            _record_failure(e)
+            if attempt == max_retries:
+                raise _give_up(e, attempt + 1) from e
+            _count("retries")
+            record_llm_retry()
+            await asyncio.sleep(backoff_delay_s(attempt, e))
+            continue
+        except BaseException:  # Cancelled mid-request
+            _breaker.release_probe()
+            raise
+        _breaker.record(True)
+        return result
+
+# --- Deferring Users ---
+# Runners analyze users through these helpers: a user whose LLM stages hit
+# LLMUnavailableError (or who comes up while the breaker is open) is set aside
+# instead of getting an error report, and retried once after the breaker's
+# cooldown. Users still failing then are returned as deferred.
+
+def _deferral(user_id, error: BaseException) -> None:
+    _count("deferred_users")
+    print(f"Deferring User ID {user_id}: {error}")
+
+def _wait_time_s() -> float:
+    wait_s = _breaker.remaining_open_s()
+    if wait_s:
+        print(f"Waiting {wait_s:.0f}s for the LLM circuit breaker before retrying deferred users...")
+    return wait_s
+
+def run_deferring_unavailable(user_ids: Iterable, analyze_user: Callable[[Any], Any],
+                              retry: bool = True) -> tuple[dict, list]:
+    """
+    Returns ({user_id: analyze_user(user_id)} for users that completed, [users
+    still deferred]). retry=False skips the second pass (and its wait).
+    """
+    results, deferred = {}, []
+    for user_id in user_ids:
+        try:
+            _breaker.raise_if_open()
+            results[user_id] = analyze_user(user_id)
+        except LLMUnavailableError as e:
+            _deferral(user_id, e)
+            deferred.append(user_id)
+    if not deferred or not retry:
+        return results, deferred
+
+    time.sleep(_wait_time_s())
+    print(f"Retrying {len(deferred)} deferred users...")
+    still_deferred = []
+    for user_id in deferred:
+        try:
+            _breaker.raise_if_open()
+            results[user_id] = analyze_user(user_id)
+        except LLMUnavailableError as e:
+            print(f"User ID {user_id} is still deferred: {e}")
+            still_deferred.append(user_id)
+    return results, still_deferred
+
+async def arun_deferring_unavailable(user_ids: Iterable, analyze_user: Callable[[Any], Awaitable[Any]]) -> tuple[dict, list]:
+    """Async variant of run_deferring_unavailable; the users of each pass run concurrently."""
+    async def attempt(user_id, first_pass: bool):
+        try:
+            _breaker.raise_if_open()
+            return user_id, await analyze_user(user_id), None
+        except LLMUnavailableError as e:
+            if first_pass:
+                _deferral(user_id, e)
+            else:
+                print(f"User ID {user_id} is still deferred: {e}")
+            return user_id, None, e
+
+    outcomes = await asyncio.gather(*(attempt(user_id, True) for user_id in user_ids))
+    results = {user_id: result for user_id, result, error in outcomes if error is None}
+    deferred = [user_id for user_id, _, error in outcomes if error is not None]
+    if not deferred:
+        return results, []
+
+    await asyncio.sleep(_wait_time_s())
+    print(f"Retrying {len(deferred)} deferred users...")
+    outcomes = await asyncio.gather(*(attempt(user_id, False) for user_id in deferred))
+    results.update({user_id: result for user_id, result, error in outcomes if error is None})
+    return results, [user_id for user_id, _, error in outcomes if error is not None]
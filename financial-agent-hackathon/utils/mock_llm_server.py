@@ -0,0 +1,217 @@
+"""
+Local HTTP server that mimics the OpenAI chat completions endpoint, for load
+and retry testing without network access or an API key.
+
+Every POST /v1/chat/completions waits a configurable latency and answers with
+a canned completion (schema-shaped JSON when the request has a JSON schema
+response_format) and a token usage estimated from the prompt. Requests over
+the per-minute limit, and a random error_rate share of the others, get an HTTP
+429 with a Retry-After header like the real API. Requests with "stream": true
+are answered with server-sent events: the first chunk after the base latency,
+then one word at a time at ms_per_token. GET /stats returns request, 429 and
+concurrency counters as JSON.
+
+Usage:
+    python -m utils.mock_llm_server --port 8765 --latency-ms 800 --rpm 120 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python main.py --async
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from utils.llm_backends import split_stream_text, structured_content
+
+class MockLLMServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer carrying the simulation settings and counters shared by all handler threads."""
+    daemon_threads = True
+
+    def __init__(self, address: tuple, latency_ms: float = 500.0, jitter_ms: float = 0.0,
+                 ms_per_token: float = 0.0, completion_tokens: int = 150, rpm: int = 0,
+                 error_rate: float = 0.0, response_text: Optional[str] = None, seed: int = 0):
+        super().__init__(address, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_token = ms_per_token
+        self.completion_tokens = completion_tokens
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.response_text = response_text
+        self.stats = {"requests": 0, "completed": 0, "rate_limited": 0, "in_flight": 0, "peak_in_flight": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+        self._random = random.Random(seed)
+        self._window: deque = deque()  # Start times of requests admitted in the last minute
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def admit(self) -> Optional[float]:
+        """Counts a request; returns None if it may proceed, else the Retry-After seconds for a 429."""
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requests"] += 1
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            retry_after = None
+            if self.rpm and len(self._window) >= self.rpm:
+                retry_after = 60 - (now - self._window[0])
+            elif self._random.random() < self.error_rate:
+                retry_after = 1.0
+            if retry_after is not None:
+                self.stats["rate_limited"] += 1
+                return retry_after
+            self._window.append(now)
+            self.stats["in_flight"] += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+            return None
+
+    def finish(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            self.stats["in_flight"] -= 1
+            self.stats["completed"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+
+    def delay_s(self, completion_tokens: int) -> float:
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter_ms)
+        return (self.latency_ms + jitter + self.ms_per_token * completion_tokens) / 1000
+
+    def first_token_delay_s(self) -> float:
+        return self.delay_s(0)
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockLLMServer
+
+    def log_message(self, format, *args):  # Keep load tests quiet
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.server._lock:
+                self._send_json(200, dict(self.server.stats))
+        else:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+            return
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+
+        retry_after = self.server.admit()
+        if retry_after is not None:
+            self._send_json(429, {"error": {"message": "Rate limit reached (mock server)", "type": "requests",
+                                            "code": "rate_limit_exceeded"}},
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+            return
+
+        model = request.get("model", "gpt-4o")
+        prompt_tokens = sum(max(1, len(str(m.get("content", ""))) // 4) for m in request.get("messages", []))
+        completion_tokens = min(int(request.get("max_tokens") or self.server.completion_tokens),
+                                self.server.completion_tokens)
+        try:
+            content = structured_content(
+                self.server.response_text or f"[mock {model} response to a {prompt_tokens}-token prompt]",
+                request.get("messages", []), request.get("response_format"))
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                     "total_tokens": prompt_tokens + completion_tokens}
+            if request.get("stream"):
+                include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+                self._send_stream(model, content, usage if include_usage else None, completion_tokens)
+                return
+            time.sleep(self.server.delay_s(completion_tokens))
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{self.server.stats['requests']}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+        finally:
+            self.server.finish(prompt_tokens, completion_tokens)
+
+    def _send_stream(self, model: str, content: str, usage: Optional[dict], completion_tokens: int) -> None:
+        """Sends content as chat.completion.chunk events, spreading the generation time over the pieces."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        chunk_id = f"chatcmpl-mock-{self.server.stats['requests']}"
+
+        def send_event(choices: list, usage: Optional[dict] = None) -> None:
+            payload = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "choices": choices, "usage": usage}
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        pieces = split_stream_text(content)
+        per_piece_s = self.server.ms_per_token * completion_tokens / 1000 / len(pieces)
+        time.sleep(self.server.first_token_delay_s())
+        for i, piece in enumerate(pieces):
+            time.sleep(per_piece_s)
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            send_event([{"index": 0, "delta": delta, "finish_reason": None}])
+        send_event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            send_event([], usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **settings) -> MockLLMServer:
+    """Starts the server on a daemon thread (port 0 picks a free port). Stop it with server.shutdown()."""
+    server = MockLLMServer((host, port), **settings)
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Base latency of every completion")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency, uniform in [0, jitter]")
+    parser.add_argument("--ms-per-token", type=float, default=0.0, help="Extra latency per completion token")
+    parser.add_argument("--completion-tokens", type=int, default=150, help="Completion size (capped by max_tokens)")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before answering 429 (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a random 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockLLMServer((args.host, args.port), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           ms_per_token=args.ms_per_token, completion_tokens=args.completion_tokens,
+                           rpm=args.rpm, error_rate=args.error_rate, seed=args.seed)
+    print(f"Mock LLM server listening on {server.base_url} (set OPENAI_BASE_URL to this URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import pandas as pd
+from utils.budget_categories import map_budget_buckets
+
+# Columns added by normalize_transactions. Their presence marks a frame as normalized.
+NORMALIZED_COLUMNS = ['month', 'signed_amount', 'is_debit', 'budget_bucket']
+
+def debit_mask(direction: pd.Series) -> pd.Series:
+    """Handles "debit", "Debit", " DEBIT ", etc. For categoricals only the categories are parsed."""
+    if isinstance(direction.dtype, pd.CategoricalDtype):
+        is_debit_category = direction.cat.categories.str.strip().str.lower() == 'debit'
+        codes = direction.cat.codes.to_numpy()
+        return pd.Series((codes >= 0) & is_debit_category[codes], index=direction.index)
+    return direction.astype(str).str.strip().str.lower() == 'debit'
+
+def normalize_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The shared normalization stage. Returns a new DataFrame (the input is not
+    modified) with:
+    - 'timestamp' parsed to datetime and 'amount' coerced to numbers (NaN -> 0)
+    - 'month': the monthly period of each transaction
+    - 'is_debit': boolean debit mask
+    - 'signed_amount': negative for debits, positive otherwise
+    - 'budget_bucket': Needs / Wants / Other (see utils/budget_categories.py)
+
+    Agents treat the result as read-only, so it can be computed once per
+    dataset and shared by every per-user slice.
+    """
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce')
+    df['amount'] = pd.to_numeric(df['amount'], errors='coerce').fillna(0)
+    df['month'] = df['timestamp'].dt.to_period('M')
+    df['is_debit'] = debit_mask(df['direction'])
+    df['signed_amount'] = df['amount'].where(~df['is_debit'], -df['amount'])
+    df['budget_bucket'] = map_budget_buckets(df['category'])
+    return df
+
+def is_normalized(df: pd.DataFrame) -> bool:
+    return all(col in df.columns for col in NORMALIZED_COLUMNS)
+
+def ensure_normalized(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns df unchanged if it is already normalized, otherwise a normalized copy."""
+    return df if is_normalized(df) else normalize_transactions(df)
+
+def drop_normalized_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns the frame without the derived columns, e.g. for showing raw transactions."""
+    return df.drop(columns=[col for col in NORMALIZED_COLUMNS if col in df.columns])
@@ -0,0 +1,127 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import pandas as pd
+
+from utils.normalization import ensure_normalized
+
+# --- Partition Store ---
+# Graph states and analysis results refer to a user's rows with a handle,
+# {"dataset": key, "user_id": ..., "rows": n}, instead of carrying a DataFrame.
+# The rows stay in the partitions registered under the dataset key: positional
+# slices of one NumPy-backed frame (UserPartitions) or memory-mapped Arrow
+# shards on disk (ShardedTransactions). Handles are plain dicts, so they are
+# cheap to checkpoint (msgpack), pickle to worker processes or keep in a session.
+PARTITION_STORE_MAX_DATASETS = 8    # Registered datasets kept; the least recently used is released first
+RESOLVED_CACHE_SIZE = int(os.getenv("PARTITION_CACHE_USERS", "64"))  # Normalized frames kept for recently resolved handles
+
+class PartitionStore:
+    """
+    Registry of datasets' per-user partitions (and their aggregate cubes),
+    addressed by dataset key. Resolving a handle returns the user's normalized
+    rows; for in-memory partitions that is a slice of the shared frame, not a copy.
+    """
+
+    def __init__(self, max_datasets: int = PARTITION_STORE_MAX_DATASETS, resolved_cache_size: int = RESOLVED_CACHE_SIZE):
+        self.max_datasets = max(1, max_datasets)
+        self.resolved_cache_size = resolved_cache_size
+        self._datasets: "OrderedDict[str, tuple[Any, Any]]" = OrderedDict()
+        # Shard reads and normalization are repeated by every node of a user's graph otherwise
+        self._resolved: "OrderedDict[tuple, pd.DataFrame]" = OrderedDict()
+        self._loading: dict[tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, dataset_key: str) -> bool:
+        return dataset_key in self._datasets
+
+    def register(self, dataset_key: str, partitions, cube=None) -> None:
+        """
+        Makes partitions (UserPartitions, ShardedTransactions or anything with
+        user_ids, row_count and per-user __getitem__) and optionally the
+        dataset's AggregateCube resolvable under dataset_key.
+        """
+        with self._lock:
+            self._drop_resolved(dataset_key)
+            self._datasets[dataset_key] = (partitions, cube)
+            self._datasets.move_to_end(dataset_key)
+            while len(self._datasets) > self.max_datasets:
+                self._drop_resolved(self._datasets.popitem(last=False)[0])
+
+    def release(self, dataset_key: str) -> None:
+        with self._lock:
+            self._datasets.pop(dataset_key, None)
+            self._drop_resolved(dataset_key)
+
+    def partitions(self, dataset_key: str):
+        return self._dataset(dataset_key)[0]
+
+    def handle(self, dataset_key: str, user_id: Any) -> dict:
+        """A handle to one user's rows of a registered dataset."""
+        partitions, _ = self._dataset(dataset_key)
+        return {"dataset": dataset_key, "user_id": user_id, "rows": partitions.row_count(user_id)}
+
+    def transactions(self, handle: dict) -> pd.DataFrame:
+        """The user's normalized rows for a handle."""
+        key = (handle["dataset"], handle["user_id"])
+        with self._lock:
+            frame = self._cached(key)
+            if frame is not None:
+                return frame
+            loading = self._loading.setdefault(key, threading.Lock())
+        # Parallel branches of one user's graph wait for a single read instead of each loading the rows
+        with loading:
+            with self._lock:
+                frame = self._cached(key)
+            if frame is not None:
+                return frame
+            try:
+                partitions, _ = self._dataset(handle["dataset"])
+                frame = ensure_normalized(partitions[handle["user_id"]])
+                with self._lock:
+                    if self.resolved_cache_size > 0:
+                        self._resolved[key] = frame
+                        while len(self._resolved) > self.resolved_cache_size:
+                            self._resolved.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return frame
+
+    def cube_cells(self, handle: dict) -> Optional[pd.DataFrame]:
+        """The user's aggregate cube cells, or None if the dataset was registered without a cube."""
+        _, cube = self._dataset(handle["dataset"])
+        return None if cube is None else cube.for_user(handle["user_id"])
+
+    def _dataset(self, dataset_key: str) -> tuple[Any, Any]:
+        with self._lock:
+            if dataset_key not in self._datasets:
+                raise KeyError(f"Dataset {dataset_key!r} is not registered in the partition store.")
+            self._datasets.move_to_end(dataset_key)
+            return self._datasets[dataset_key]
+
+    def _cached(self, key: tuple) -> Optional[pd.DataFrame]:
+        frame = self._resolved.get(key)
+        if frame is not None:
+            self._resolved.move_to_end(key)
+        return frame
+
+    def _drop_resolved(self, dataset_key: str) -> None:
+        for key in [key for key in self._resolved if key[0] == dataset_key]:
+            del self._resolved[key]
+
+# Shared by the CLI runners, the Streamlit app and the graph nodes of this process
+partition_store = PartitionStore()
+
+def state_transactions(state: dict) -> pd.DataFrame:
+    """The user's rows for a graph state: its transactions_df, or the rows its transactions_ref points to."""
+    if state.get('transactions_df') is not None:
+        return state['transactions_df']
+    return partition_store.transactions(state['transactions_ref'])
+
+def state_cube_cells(state: dict) -> Optional[pd.DataFrame]:
+    """The user's aggregate cube cells for a graph state, if precomputed."""
+    if state.get('aggregate_cube') is not None or state.get('transactions_ref') is None:
+        return state.get('aggregate_cube')
+    return partition_store.cube_cells(state['transactions_ref'])
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Iterator
+
+class UserPartitions:
+    """
+    Splits a transactions DataFrame into per-user partitions in a single pass.
+
+    The frame is reordered once so that each user's rows are contiguous, and
+    every partition is then a positional slice of that frame (no boolean mask
+    over the full dataset and no per-user copy). Users keep the order in which
+    they first appear in the data, matching df['user_id'].unique(). Rows with a
+    missing user_id are not assigned to any partition.
+    """
+
+    def __init__(self, df: pd.DataFrame, user_col: str = 'user_id'):
+        codes, uniques = pd.factorize(df[user_col], sort=False)
+        n_missing = int((codes < 0).sum())
+
+        # A stable sort keeps each user's rows in their original order.
+        if n_missing == 0 and (len(codes) < 2 or bool(np.all(codes[1:] >= codes[:-1]))):
+            self.frame = df
+        else:
+            self.frame = df.take(np.argsort(codes, kind='stable'))
+
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        self._bounds = np.concatenate([[0], np.cumsum(counts)]) + n_missing
+        self.user_ids = list(uniques)
+        self._positions = {user_id: i for i, user_id in enumerate(self.user_ids)}
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def __contains__(self, user_id: Any) -> bool:
+        return user_id in self._positions
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.user_ids)
+
+    def __getitem__(self, user_id: Any) -> pd.DataFrame:
+        start, stop = self.bounds(user_id)
+        return self.frame.iloc[start:stop]
+
+    def bounds(self, user_id: Any) -> tuple[int, int]:
+        """Start and stop row positions of the user's rows in self.frame."""
+        i = self._positions[user_id]
+        return int(self._bounds[i]), int(self._bounds[i + 1])
+
+    def row_count(self, user_id: Any) -> int:
+        start, stop = self.bounds(user_id)
+        return stop - start
+
+    def get(self, user_id: Any) -> pd.DataFrame:
+        """Returns the user's rows, or an empty frame with the same columns for unknown users."""
+        if user_id not in self._positions:
+            return self.frame.iloc[0:0]
+        return self[user_id]
+
+    def items(self) -> Iterator[tuple[Any, pd.DataFrame]]:
+        for user_id in self.user_ids:
+            yield user_id, self[user_id]
+
+def partition_by_user(df: pd.DataFrame, user_col: str = 'user_id') -> UserPartitions:
+    """Builds the per-user partitions for a full transactions DataFrame."""
+    return UserPartitions(df, user_col)
@@ -0,0 +1,110 @@
+import math
+from typing import Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+# --- Section Budgets ---
+# Token budget of each table the agents put into analysis results and prompts.
+# A table that does not fit is cut to its first rows plus a one-line summary of
+# the rest, so prompt size stays flat however long a user's history is.
+PROMPT_SECTION_BUDGETS = {
+    "top_spending_categories": 80,
+    "top_merchants_by_frequency": 80,
+    "transaction_samples": 300,
+    "top_category_increases": 60,
+    "burst_transactions_report": 200,
+}
+DEFAULT_SECTION_BUDGET = 150
+MAX_CELL_CHARS = 28
+
+# Columns of a transaction row worth showing to the model; ids, device and geo columns are dropped
+TRANSACTION_PROMPT_COLUMNS = ['timestamp', 'merchant_name', 'category', 'amount', 'direction', 'status']
+
+# The tokenizer is resolved on the first count, not at import: tiktoken may download its encoding then
+_encoding = None
+_encoding_resolved = False
+
+def _get_encoding():
+    """The tiktoken encoding of the default model, or None if tiktoken or the encoding is unavailable."""
+    global _encoding, _encoding_resolved
+    if not _encoding_resolved:
+        _encoding_resolved = True
+        from utils.llm_client import DEFAULT_MODEL
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(DEFAULT_MODEL)
+        except Exception as e:  # Not installed, or the encoding cannot be fetched offline
+            print(f"Warning: No tiktoken encoding for {DEFAULT_MODEL} ({e}). Estimating prompt tokens from text length.")
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when available, else about 4 characters per token (as llm_client estimates)."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+def format_cell(value) -> str:
+    """Short text for one table cell: 2-decimal amounts, minute timestamps, long strings cut."""
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value))
+    if pd.isna(value):
+        return ""
+    if isinstance(value, pd.Timestamp):
+        return value.strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, (float, np.floating)):
+        return f"{value:,.2f}"
+    text = str(value)
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 1] + "…"
+
+def render_table(df: pd.DataFrame, max_tokens: int, columns: Optional[Sequence[str]] = None,
+                 total_col: Optional[str] = 'amount', noun: str = "rows") -> str:
+    """
+    Renders df as a compact pipe-separated table of at most max_tokens tokens.
+    Rows are kept in order until the budget is reached; the rest are replaced by
+    a line giving their count and, if total_col is present, their total.
+    """
+    if columns is not None:
+        df = df[[col for col in columns if col in df.columns] or list(df.columns)]
+    if df.empty:
+        return "(none)"
+
+    header = " | ".join(str(col) for col in df.columns)
+    lines = [header]
+    used = count_tokens(header) + 1
+    # Room kept for the truncation line, which is only added when rows are dropped
+    summary_reserve = 16
+    shown = 0
+    for row in df.itertuples(index=False, name=None):
+        line = " | ".join(format_cell(value) for value in row)
+        cost = count_tokens(line) + 1
+        remaining = len(df) - shown - 1
+        if used + cost + (summary_reserve if remaining else 0) > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+        shown += 1
+
+    omitted = len(df) - shown
+    if omitted:
+        summary = f"… {omitted} more {noun} not shown"
+        if total_col is not None and total_col in df.columns:
+            summary += f" (total {format_cell(df[total_col].iloc[shown:].sum())})"
+        lines.append(summary)
+    return "\n".join(lines)
+
+def render_series(series: pd.Series, max_tokens: int, value_name: Optional[str] = None, noun: str = "rows") -> str:
+    """Renders a labelled series (e.g. a top-N table) as a two-column table within max_tokens."""
+    value_name = value_name or series.name or "value"
+    frame = series.rename(value_name).reset_index()
+    frame.columns = [series.index.name or "item", value_name]
+    total_col = value_name if series.dtype.kind in 'iuf' else None
+    return render_table(frame, max_tokens, total_col=total_col, noun=noun)
+
+def render_section(section: str, data: Union[pd.DataFrame, pd.Series], **kwargs) -> str:
+    """Renders data within the budget configured for section in PROMPT_SECTION_BUDGETS."""
+    budget = PROMPT_SECTION_BUDGETS.get(section, DEFAULT_SECTION_BUDGET)
+    if isinstance(data, pd.Series):
+        return render_series(data, budget, **kwargs)
+    return render_table(data, budget, **kwargs)
@@ -0,0 +1,340 @@
+import hashlib
+import io
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from reportlab.lib.units import inch
+
+# Share of the progress bar spent rendering sections; the rest is the reportlab layout pass.
+_SECTION_PROGRESS_SHARE = 0.5
+
+def _build_styles() -> dict:
+    styles = getSampleStyleSheet()
+    return {
+        'base': styles,
+        # Custom styles
+        'title': ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            spaceAfter=30,
+            textColor=colors.HexColor('#1f77b4'),
+            alignment=1  # Center alignment
+        ),
+        'heading': ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=16,
+            spaceAfter=12,
+            textColor=colors.HexColor('#2c3e50'),
+            leftIndent=0
+        ),
+    }
+
+def build_summary_section(results: dict, processed_data, styles: dict, generated_at: Optional[datetime] = None) -> list:
+    """Title page and executive summary. generated_at (default now) is when the report was built."""
+    story = []
+    base = styles['base']
+    generated_at = generated_at or datetime.now()
+
+    # Title page
+    story.append(Paragraph("💰 Financial Analysis & Budget Planning Report", styles['title']))
+    story.append(Spacer(1, 20))
+    story.append(Paragraph(f"Report generated on: {generated_at.strftime('%B %d, %Y at %I:%M %p')}", base['Normal']))
+    story.append(Spacer(1, 20))
+
+    # Executive Summary
+    story.append(Paragraph("📊 Executive Summary", styles['heading']))
+
+    total_users = len(results)
+    total_transactions = len(processed_data) if processed_data is not None else 0
+    total_spending = sum([r.get('pandas_analysis', {}).get('total_spending', 0) for r in results.values()])
+    avg_spending = total_spending / total_users if total_users > 0 else 0
+
+    summary_data = [
+        ['Metric', 'Value'],
+        ['Total Users Analyzed', f"{total_users}"],
+        ['Total Transactions', f"{total_transactions:,}"],
+        ['Total Spending', f"₹{total_spending:,.2f}"],
+        ['Average Spending per User', f"₹{avg_spending:,.2f}"]
+    ]
+
+    summary_table = Table(summary_data, colWidths=[3*inch, 2*inch])
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1f77b4')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    story.append(summary_table)
+    story.append(Spacer(1, 20))
+    return story
+
+def build_user_section(user_id, user_data: dict, budget_data: Any, styles: dict) -> list:
+    """One user's pages: metrics, AI insights, budget plan and category breakdown."""
+    story = []
+    base = styles['base']
+    story.append(PageBreak())
+    story.append(Paragraph(f"👤 User Analysis: {user_id}", styles['heading']))
+
+    analysis = user_data.get('pandas_analysis', {})
+    profile = user_data.get('profile_summary', 'No profile available')
+
+    # User metrics table
+    if analysis:
+        user_metrics = [
+            ['Metric', 'Value'],
+            ['Total Spending', f"₹{analysis.get('total_spending', 0):,.2f}"],
+            ['Total Transactions', f"{analysis.get('total_transactions', 0):,}"],
+            ['Average Transaction', f"₹{analysis.get('average_transaction_amount', 0):.2f}"],
+            ['Unique Merchants', f"{analysis.get('unique_merchants', 0)}"]
+        ]
+
+        user_table = Table(user_metrics, colWidths=[2.5*inch, 2.5*inch])
+        user_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495e')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgrey),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+
+        story.append(user_table)
+        story.append(Spacer(1, 15))
+
+    # AI-Generated Insights
+    story.append(Paragraph("🤖 AI-Generated Financial Insights", base['Heading3']))
+
+    # Clean and format the profile text
+    profile_lines = profile.split('\n')
+    for line in profile_lines:
+        if line.strip():
+            # Remove markdown-style formatting for PDF
+            clean_line = line.replace('**', '').strip()
+            if clean_line:
+                story.append(Paragraph(clean_line, base['Normal']))
+                story.append(Spacer(1, 6))
+
+    story.append(Spacer(1, 15))
+
+    # Budget Planning Section
+    if budget_data is not None:
+        story.append(Paragraph("💡 Personalized Budget Plan", base['Heading3']))
+
+        if isinstance(budget_data, dict) and 'plan' in budget_data:
+            budget_lines = budget_data['plan'].split('\n')
+            for line in budget_lines:
+                if line.strip():
+                    clean_line = line.replace('**', '').replace('###', '').strip()
+                    if clean_line:
+                        story.append(Paragraph(clean_line, base['Normal']))
+                        story.append(Spacer(1, 6))
+
+        story.append(Spacer(1, 15))
+
+    # Category spending breakdown
+    if 'category_spending' in analysis:
+        story.append(Paragraph("💰 Spending by Category", base['Heading3']))
+
+        category_data = [['Category', 'Amount', 'Percentage']]
+        total_cat_spending = sum(analysis['category_spending'].values())
+
+        for category, amount in sorted(analysis['category_spending'].items(), key=lambda x: x[1], reverse=True):
+            percentage = (amount / total_cat_spending * 100) if total_cat_spending > 0 else 0
+            category_data.append([
+                category,
+                f"₹{amount:,.2f}",
+                f"{percentage:.1f}%"
+            ])
+
+        category_table = Table(category_data, colWidths=[2*inch, 1.5*inch, 1.5*inch])
+        category_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#27ae60')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lightgoldenrodyellow),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+
+        story.append(category_table)
+        story.append(Spacer(1, 20))
+    return story
+
+def build_comparison_section(results: dict, styles: dict) -> list:
+    """User comparison table (only when there are several users) and footer."""
+    story = []
+    # Comparison section if multiple users
+    if len(results) > 1:
+        story.append(PageBreak())
+        story.append(Paragraph("📊 User Comparison", styles['heading']))
+
+        comparison_data = [['User', 'Total Spending', 'Transactions', 'Avg Transaction', 'Unique Merchants']]
+        for user_id, data in results.items():
+            analysis = data.get('pandas_analysis', {})
+            comparison_data.append([
+                user_id,
+                f"₹{analysis.get('total_spending', 0):,.2f}",
+                f"{analysis.get('total_transactions', 0):,}",
+                f"₹{analysis.get('average_transaction_amount', 0):.2f}",
+                f"{analysis.get('unique_merchants', 0)}"
+            ])
+
+        comparison_table = Table(comparison_data, colWidths=[1.2*inch, 1.3*inch, 1*inch, 1.2*inch, 1.3*inch])
+        comparison_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#e74c3c')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.lavender),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTSIZE', (0, 1), (-1, -1), 8)
+        ]))
+
+        story.append(comparison_table)
+
+    # Footer
+    story.append(Spacer(1, 30))
+    story.append(Paragraph("Report generated by Financial Agent - Transaction Analyzer & Budget Planner", styles['base']['Italic']))
+    return story
+
+def generate_pdf_report(results: dict, processed_data, budget_plans: dict,
+                        progress_callback: Optional[Callable[[float, str], None]] = None,
+                        generated_at: Optional[datetime] = None) -> io.BytesIO:
+    """
+    Generate a comprehensive PDF report including budget planning.
+
+    Sections are rendered one after the other: building flowables is pure
+    Python under the GIL, so threads would not overlap it, and reportlab
+    flowables are not worth pickling to worker processes for the few
+    milliseconds each section takes. progress_callback(fraction, message) is
+    called as sections finish and as reportlab lays out the document.
+    """
+    report_progress = progress_callback or (lambda fraction, message: None)
+    styles = _build_styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+
+    report_progress(0.0, "Rendering report sections")
+    story = build_summary_section(results, processed_data, styles, generated_at)
+    for done, (user_id, user_data) in enumerate(results.items(), start=1):
+        story.extend(build_user_section(user_id, user_data, budget_plans.get(user_id), styles))
+        report_progress(_SECTION_PROGRESS_SHARE * done / len(results), f"Rendered {done}/{len(results)} user sections")
+    story.extend(build_comparison_section(results, styles))
+
+    # Layout progress from reportlab: SIZE_EST gives the flowable count, PROGRESS how many are placed
+    total_flowables = [len(story)]
+    def on_layout(kind, value):
+        if kind == 'SIZE_EST':
+            total_flowables[0] = max(1, value)
+        elif kind == 'PROGRESS':
+            layout_share = 1 - _SECTION_PROGRESS_SHARE
+            report_progress(_SECTION_PROGRESS_SHARE + layout_share * value / total_flowables[0], "Laying out pages")
+    doc.setProgressCallBack(on_layout)
+
+    # Build PDF
+    doc.build(story)
+    buffer.seek(0)
+    report_progress(1.0, "Report ready")
+    return buffer
+
+# --- Background Report Generation ---
+
+def report_cache_key(dataset_hash: str, budget_plans: dict) -> str:
+    """Identifies a finished report: the analysed dataset plus the budget plans included in it."""
+    plans = json.dumps({str(k): v for k, v in budget_plans.items()}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{dataset_hash}|{plans}".encode("utf-8")).hexdigest()
+
+class PdfReportJob:
+    """State of one background report build. Read progress/status/result from any thread."""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.status = "queued"   # queued -> running -> done | failed
+        self.progress = 0.0
+        self.message = "Waiting for a worker"
+        self.result: Optional[bytes] = None
+        self.error: Optional[str] = None
+        # When the report was built; a cached report keeps (and shows) its original time
+        self.generated_at: Optional[datetime] = None
+
+    def update(self, fraction: float, message: str) -> None:
+        self.progress = min(1.0, max(self.progress, fraction))
+        self.message = message
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+class PdfReportWorker:
+    """
+    Builds PDF reports on a background thread so the caller (e.g. a Streamlit
+    request) returns immediately. Jobs are keyed by report_cache_key(); a
+    finished report is kept (up to max_cached) and returned again for the same
+    key instead of being rebuilt. Submitting a key that is already queued or
+    running returns the existing job.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = 1, max_cached: int = 8):
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="pdf-report")
+        self._max_cached = max_cached
+        self._jobs: "OrderedDict[str, PdfReportJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, results: dict, processed_data, budget_plans: dict) -> PdfReportJob:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status != "failed":
+                self._jobs.move_to_end(key)
+                return job
+            job = PdfReportJob(key)
+            self._jobs[key] = job
+            self._evict_locked()
+        # Snapshot the plans so later edits in the session do not change a running build
+        self._executor.submit(self._run, job, results, processed_data, dict(budget_plans))
+        return job
+
+    def get(self, key: str) -> Optional[PdfReportJob]:
+        with self._lock:
+            return self._jobs.get(key)
+
+    def _run(self, job: PdfReportJob, results: dict, processed_data, budget_plans: dict) -> None:
+        job.status = "running"
+        job.generated_at = datetime.now()
+        try:
+            buffer = generate_pdf_report(results, processed_data, budget_plans,
+                                         progress_callback=job.update, generated_at=job.generated_at)
+            job.result = buffer.getvalue()
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+
+    def _evict_locked(self) -> None:
+        # Only finished jobs are evicted; running ones stay until they complete
+        while len(self._jobs) > self._max_cached:
+            oldest = next((k for k, j in self._jobs.items() if j.finished), None)
+            if oldest is None:
+                break
+            del self._jobs[oldest]
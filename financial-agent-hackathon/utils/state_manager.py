@@ -7,7 +7,9 @@ class FinancialAnalysisState(TypedDict):
     """
     # Input data
     user_id: Any
-    transactions_df: pd.DataFrame
+    transactions_ref: Optional[dict[str, Any]]  # Handle to the user's rows and cube cells (utils/partition_store.py)
+    transactions_df: Optional[pd.DataFrame]  # The rows themselves, for callers that do not register a dataset
+    aggregate_cube: Optional[pd.DataFrame]  # The user's cells of the monthly aggregate cube, if precomputed
     
     # Phase 1: Profiling Results
     pandas_analysis: Optional[dict[str, Any]]
@@ -0,0 +1,226 @@
+"""
+Deterministic synthetic UPI transaction generator.
+
+Produces frames with the same columns and value styles as
+sample_data/upi_transactions.xlsx, at any size (tested up to 10M rows and
+100k users). Rows are generated in time-ordered chunks so large datasets can
+be written to disk without holding them in memory; the same parameters
+always produce the same data.
+
+CLI:
+    python -m utils.synthetic_data --rows 1000000 --users 10000 --out data.csv
+"""
+import argparse
+import os
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = [
+    'txn_id', 'utr', 'user_id', 'merchant_name', 'transaction_type', 'category', 'amount',
+    'currency', 'direction', 'status', 'timestamp', 'device_id', 'city', 'lat', 'lon',
+    'is_recurring', 'running_balance', 'note'
+]
+
+# --- Catalog (modelled on the sample data) ---
+# category: (row weight, median amount, amount spread, recurring probability, transaction types, merchants)
+CATEGORY_CATALOG = {
+    'food': (327, 120.0, 0.7, 0.0, ['campus_food', 'street_food', 'food_delivery', 'premium_dining', 'coffee_tea'],
+             ['Tea Stall', 'Snack Shop', 'Mess', 'Local Restaurant', 'Starbucks', 'Food Court', 'Swiggy', 'Zomato',
+              "McDonald's", 'Street Food', "Domino's", 'KFC', 'Cafe Coffee Day', 'Premium Restaurant']),
+    'transportation': (150, 90.0, 0.6, 0.0, ['transportation', 'fuel'],
+                       ['Ola', 'Uber', 'Rapido', 'Auto Driver', 'Metro', 'Metro Card', 'Local Bus', 'Petrol Pump',
+                        'Fuel Station', 'Shared Cab', 'Airport Taxi']),
+    'groceries': (89, 320.0, 0.6, 0.0, ['groceries'],
+                  ['BigBasket', 'DMart', 'Reliance Fresh', 'Kirana Store', 'More', 'Grofers', 'Local Grocery',
+                   "Nature's Basket", 'Mini Market']),
+    'entertainment': (71, 220.0, 0.7, 0.15, ['entertainment'],
+                      ['Netflix', 'Spotify', 'Hotstar', 'Prime Video', 'YouTube Premium', 'BookMyShow',
+                       'Movie Theater', 'Gaming Cafe', 'Music Concert']),
+    'utilities': (64, 500.0, 0.5, 0.6, ['utilities', 'subscriptions'],
+                  ['Electricity Board', 'Airtel', 'Jio', 'Vodafone', 'BSNL', 'Gas Agency', 'Internet Bill',
+                   'Mobile Recharge', 'Laundry']),
+    'shopping': (55, 700.0, 0.8, 0.0, ['shopping_online', 'budget_shopping', 'luxury_shopping'],
+                 ['Amazon', 'Flipkart', 'Myntra', 'Ajio', 'Nykaa', 'Meesho', 'Local Market', 'Shoppers Stop',
+                  'Electronics']),
+    'education': (36, 380.0, 0.7, 0.05, ['books_supplies', 'education'],
+                  ['Book Store', 'Stationery', 'Online Course', 'Certification', 'College', 'Xerox']),
+    'healthcare': (27, 350.0, 0.8, 0.0, ['healthcare'],
+                   ['Pharmacy', 'Apollo Pharmacy', 'PharmEasy', 'Local Clinic', 'Apollo Hospital', 'Practo',
+                    'Medical Store']),
+    'business': (16, 2000.0, 0.5, 0.1, ['business_expenses'],
+                 ['CA Services', 'Meeting Room', 'Printing', 'Office Supplies', 'Marketing Agency']),
+    'housing': (6, 20000.0, 0.4, 0.9, ['rent'], ['Rent Payment', 'Maintenance', 'Luxury Apartments']),
+    'transfer': (3, 5000.0, 0.5, 0.0, ['family_transfer'], ['Flatmate', 'Vendor Payment', 'Colleague']),
+}
+CITIES = {
+    'Bangalore': (12.9716, 77.5946), 'Chennai': (13.0827, 80.2707), 'Delhi': (28.7041, 77.1025),
+    'Mumbai': (19.0760, 72.8777), 'Pune': (18.5204, 73.8567),
+}
+DEVICES = ['device_android_01', 'device_android_02', 'device_ios_01', 'device_tablet_01', 'device_web_01', 'device_web_02']
+STATUSES = ['SUCCESS', 'PENDING', 'FAILED', 'REFUNDED']
+STATUS_WEIGHTS = [0.934, 0.032, 0.026, 0.008]
+# Incoming money (salary, reimbursements) so running balances stay realistic.
+CREDIT_SHARE = 0.05
+CREDIT_MEDIAN_AMOUNT = 8000.0
+
+# Multipliers coprime with 10 make (index * m + c) mod 10^k a bijection, so ids never collide.
+_TXN_MULTIPLIER = 982_451_653
+_UTR_MULTIPLIER = 7_919_000_003
+
+def _user_ids(n_users: int) -> np.ndarray:
+    width = max(3, len(str(n_users)))
+    return np.array([f"USER_{i + 1:0{width}d}" for i in range(n_users)])
+
+def generate_transaction_chunks(n_rows: int, n_users: int, chunk_size: int = 1_000_000,
+                                start: str = "2025-04-01", months: int = 6,
+                                seed: int = 42) -> Iterator[pd.DataFrame]:
+    """
+    Yields the dataset as time-ordered DataFrame chunks of at most chunk_size
+    rows. Each chunk covers the next slice of the date range, and running
+    balances carry over between chunks.
+    """
+    root = np.random.default_rng(seed)
+    categories = list(CATEGORY_CATALOG)
+    weights = np.array([CATEGORY_CATALOG[c][0] for c in categories], dtype=float)
+    weights /= weights.sum()
+    medians = np.array([CATEGORY_CATALOG[c][1] for c in categories])
+    spreads = np.array([CATEGORY_CATALOG[c][2] for c in categories])
+    recurring_p = np.array([CATEGORY_CATALOG[c][3] for c in categories])
+
+    # Flat merchant / transaction-type tables with per-category offsets, for vectorized lookups
+    merchants = np.array([m for c in categories for m in CATEGORY_CATALOG[c][5]])
+    merchant_counts = np.array([len(CATEGORY_CATALOG[c][5]) for c in categories])
+    merchant_offsets = np.concatenate([[0], np.cumsum(merchant_counts)[:-1]])
+    txn_types = np.array([t for c in categories for t in CATEGORY_CATALOG[c][4]])
+    type_counts = np.array([len(CATEGORY_CATALOG[c][4]) for c in categories])
+    type_offsets = np.concatenate([[0], np.cumsum(type_counts)[:-1]])
+
+    # Per-user attributes: activity level, home city, device and opening balance
+    user_ids = _user_ids(n_users)
+    activity = root.gamma(shape=1.5, scale=1.0, size=n_users)
+    activity /= activity.sum()
+    city_names = np.array(list(CITIES))
+    city_coords = np.array(list(CITIES.values()))
+    user_city = root.integers(0, len(city_names), size=n_users)
+    user_device = root.integers(0, len(DEVICES), size=n_users)
+    balances = np.round(root.uniform(20_000, 250_000, size=n_users), 2)
+
+    start_ts = pd.Timestamp(start)
+    total_seconds = ((start_ts + pd.DateOffset(months=months)) - start_ts).total_seconds()
+    n_chunks = max(1, -(-n_rows // chunk_size))
+    chunk_seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+
+    for chunk_no in range(n_chunks):
+        rng = np.random.default_rng(chunk_seeds[chunk_no])
+        first_row = chunk_no * chunk_size
+        n = min(chunk_size, n_rows - first_row)
+        index = np.arange(first_row, first_row + n, dtype=np.int64)
+
+        window = total_seconds / n_chunks
+        offsets = np.sort(rng.uniform(chunk_no * window, (chunk_no + 1) * window, size=n))
+        timestamps = start_ts + pd.to_timedelta(offsets.astype(np.int64), unit='s')
+
+        users = rng.choice(n_users, size=n, p=activity)
+        cat = rng.choice(len(categories), size=n, p=weights)
+        is_credit = rng.random(n) < CREDIT_SHARE
+        amounts = np.where(
+            is_credit,
+            rng.lognormal(np.log(CREDIT_MEDIAN_AMOUNT), 0.4, size=n),
+            rng.lognormal(np.log(medians[cat]), spreads[cat])
+        ).round(2)
+        cat = np.where(is_credit, categories.index('transfer'), cat)
+
+        merchant_idx = merchant_offsets[cat] + (rng.random(n) * merchant_counts[cat]).astype(np.int64)
+        type_idx = type_offsets[cat] + (rng.random(n) * type_counts[cat]).astype(np.int64)
+        status = rng.choice(len(STATUSES), size=n, p=STATUS_WEIGHTS)
+        home = user_city[users]
+        # Mostly the home city, sometimes travelling
+        city = np.where(rng.random(n) < 0.85, home, rng.integers(0, len(city_names), size=n))
+
+        # Running balance in time order within each user, continuing from the previous chunk
+        signed = np.where(is_credit, amounts, -amounts)
+        order = np.lexsort((np.arange(n), users))
+        sorted_users = users[order]
+        cumulative = np.cumsum(signed[order])
+        group_start = np.r_[True, sorted_users[1:] != sorted_users[:-1]]
+        base = np.maximum.accumulate(np.where(group_start, np.arange(n), 0))
+        within_user = cumulative - cumulative[base] + signed[order][base]
+        running = np.empty(n)
+        running[order] = balances[sorted_users] + within_user
+        last_of_user = np.r_[sorted_users[1:] != sorted_users[:-1], True]
+        balances[sorted_users[last_of_user]] = running[order][last_of_user]
+
+        txn_numbers = (index * _TXN_MULTIPLIER + 417_000_123) % 10**12
+        yield pd.DataFrame({
+            'txn_id': np.char.add('TXN', np.char.zfill(txn_numbers.astype(str), 12)),
+            'utr': (index * _UTR_MULTIPLIER + 1_234_567) % 10**16,
+            'user_id': user_ids[users],
+            'merchant_name': merchants[merchant_idx],
+            'transaction_type': txn_types[type_idx],
+            'category': np.array(categories)[cat],
+            'amount': amounts,
+            'currency': 'INR',
+            'direction': np.where(is_credit, 'CREDIT', 'DEBIT'),
+            'status': np.array(STATUSES)[status],
+            'timestamp': timestamps,
+            'device_id': np.array(DEVICES)[user_device[users]],
+            'city': city_names[city],
+            'lat': (city_coords[city, 0] + rng.normal(0, 0.03, size=n)).round(6),
+            'lon': (city_coords[city, 1] + rng.normal(0, 0.03, size=n)).round(6),
+            'is_recurring': rng.random(n) < np.where(is_credit, 0.0, recurring_p[cat]),
+            'running_balance': running.round(2),
+            'note': np.array(categories)[cat],
+        }, columns=COLUMNS)
+
+def generate_transactions(n_rows: int, n_users: int, **kwargs) -> pd.DataFrame:
+    """Generates the whole synthetic dataset in memory. See generate_transaction_chunks for options."""
+    return pd.concat(list(generate_transaction_chunks(n_rows, n_users, **kwargs)), ignore_index=True)
+
+def write_synthetic_dataset(path: str, n_rows: int, n_users: int, chunk_size: int = 1_000_000,
+                            seed: int = 42, months: int = 6) -> Optional[str]:
+    """
+    Streams a synthetic dataset to .csv, .parquet or .xlsx (Excel only up to its
+    row limit). Returns the path, or None if the format is unsupported.
+    """
+    _, ext = os.path.splitext(path)
+    ext = ext.lower()
+    chunks = generate_transaction_chunks(n_rows, n_users, chunk_size=chunk_size, seed=seed, months=months)
+    if ext == '.csv':
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+    elif ext == '.parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    elif ext in ['.xlsx', '.xls']:
+        if n_rows > 1_048_575:
+            print("Error: Excel files are limited to 1,048,575 data rows. Use .csv or .parquet instead.")
+            return None
+        pd.concat(list(chunks), ignore_index=True).to_excel(path, index=False)
+    else:
+        print(f"Error: Unsupported output type '{ext}'. Use .csv, .parquet or .xlsx.")
+        return None
+    print(f"Wrote {n_rows:,} synthetic transactions for {n_users:,} users to {path}.")
+    return path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic UPI transactions dataset.")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="synthetic_transactions.csv")
+    args = parser.parse_args()
+    write_synthetic_dataset(args.out, args.rows, args.users, chunk_size=args.chunk_size, seed=args.seed, months=args.months)